@@ -14,6 +14,7 @@ from src.instruments.models import InstrumentModel
 from src.orders.models import OrderModel
 from src.balance.models import BalanceModel
 from src.transactions.models import TransactionModel
+from src.affinity.models import TickerLeaseModel
 
 config = context.config
 
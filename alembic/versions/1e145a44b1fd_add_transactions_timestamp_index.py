@@ -0,0 +1,28 @@
+"""add transactions timestamp index
+
+Revision ID: 1e145a44b1fd
+Revises: 43ea3fd2c4fc
+Create Date: 2026-10-19 01:42:30.734127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1e145a44b1fd'
+down_revision: Union[str, None] = '43ea3fd2c4fc'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('idx_transactions_timestamp', 'transactions', ['timestamp'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_transactions_timestamp', table_name='transactions')
@@ -0,0 +1,30 @@
+"""add version columns to balance and orders
+
+Revision ID: 427ab7ee4976
+Revises: e581803a9074
+Create Date: 2026-10-19 01:36:26.475086
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '427ab7ee4976'
+down_revision: Union[str, None] = 'e581803a9074'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('balance', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('orders', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('orders', 'version')
+    op.drop_column('balance', 'version')
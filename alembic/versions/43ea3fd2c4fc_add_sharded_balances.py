@@ -0,0 +1,34 @@
+"""add sharded balances
+
+Revision ID: 43ea3fd2c4fc
+Revises: 427ab7ee4976
+Create Date: 2026-10-19 01:38:29.148253
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '43ea3fd2c4fc'
+down_revision: Union[str, None] = '427ab7ee4976'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('balance', sa.Column('shard', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('users', sa.Column('balance_shards', sa.Integer(), server_default='1', nullable=False))
+    op.drop_index('idx_balance_user_ticker', table_name='balance')
+    op.create_index('idx_balance_user_ticker_shard', 'balance', ['user_id', 'ticker', 'shard'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_balance_user_ticker_shard', table_name='balance')
+    op.create_index('idx_balance_user_ticker', 'balance', ['user_id', 'ticker'], unique=True)
+    op.drop_column('users', 'balance_shards')
+    op.drop_column('balance', 'shard')
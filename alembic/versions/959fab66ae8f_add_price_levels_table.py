@@ -0,0 +1,64 @@
+"""add price levels table
+
+Revision ID: 959fab66ae8f
+Revises: 1e145a44b1fd
+Create Date: 2026-10-19 01:43:49.053266
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from src.ids import uuid7
+
+
+# revision identifiers, used by Alembic.
+revision: str = '959fab66ae8f'
+down_revision: Union[str, None] = '1e145a44b1fd'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('price_levels',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('ticker', sa.String(length=10), nullable=False),
+    sa.Column('side', postgresql.ENUM('BUY', 'SELL', name='directionenum', create_type=False), nullable=False),
+    sa.Column('price', sa.Integer(), nullable=False),
+    sa.Column('qty', sa.Integer(), nullable=False),
+    sa.Column('order_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['ticker'], ['instruments.ticker'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_price_levels_ticker_side_price', 'price_levels', ['ticker', 'side', 'price'], unique=True)
+    # Ключи генерируются в Python: gen_random_uuid() встроен только в PostgreSQL 13+
+    levels = op.get_bind().execute(sa.text("""
+        SELECT ticker, direction::text, price, SUM(qty - filled), COUNT(*)
+        FROM orders
+        WHERE status IN ('NEW', 'PARTIALLY_EXECUTED') AND price IS NOT NULL
+        GROUP BY ticker, direction, price
+        HAVING SUM(qty - filled) > 0
+    """)).all()
+    if levels:
+        price_levels = sa.table(
+            'price_levels',
+            sa.column('id', sa.UUID()),
+            sa.column('ticker', sa.String()),
+            sa.column('side', postgresql.ENUM('BUY', 'SELL', name='directionenum', create_type=False)),
+            sa.column('price', sa.Integer()),
+            sa.column('qty', sa.Integer()),
+            sa.column('order_count', sa.Integer())
+        )
+        op.bulk_insert(price_levels, [
+            {'id': uuid7(), 'ticker': ticker, 'side': side, 'price': price, 'qty': qty, 'order_count': count}
+            for ticker, side, price, qty, count in levels
+        ])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_price_levels_ticker_side_price', table_name='price_levels')
+    op.drop_table('price_levels')
@@ -0,0 +1,56 @@
+"""add order queue
+
+Revision ID: 99f9a2fbf51b
+Revises: c0a9a9cbe43e
+Create Date: 2026-10-19 01:56:08.159933
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '99f9a2fbf51b'
+down_revision: Union[str, None] = 'c0a9a9cbe43e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Новое значение enum нельзя использовать в той же транзакции, где оно
+    # добавлено, поэтому ALTER TYPE выполняется отдельно
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE statusenum ADD VALUE IF NOT EXISTS 'PENDING'")
+
+    op.execute('CREATE SEQUENCE order_seq AS bigint')
+    op.add_column('orders', sa.Column('seq', sa.BigInteger(), nullable=True))
+    # Существующие ордера нумеруются в порядке приема
+    op.execute(
+        'UPDATE orders SET seq = numbered.seq '
+        'FROM (SELECT id, row_number() OVER (ORDER BY timestamp, id) AS seq FROM orders) AS numbered '
+        'WHERE orders.id = numbered.id'
+    )
+    op.execute("SELECT setval('order_seq', COALESCE((SELECT max(seq) FROM orders), 0) + 1, false)")
+    op.alter_column('orders', 'seq', nullable=False, server_default=sa.text("nextval('order_seq')"))
+    op.execute('ALTER SEQUENCE order_seq OWNED BY orders.seq')
+    op.create_index('index_orders_pending_ticker_seq', 'orders', ['ticker', 'seq'], unique=False, postgresql_where=sa.text("status = 'PENDING'"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Значение PENDING остается в типе statusenum: PostgreSQL не умеет
+    # удалять значения enum. Оставшиеся в очереди ордера отменяются,
+    # их резерв возвращается в нулевой шард баланса
+    op.execute(
+        "UPDATE balance SET available = balance.available + pending.qty "
+        "FROM (SELECT user_id, CASE WHEN direction = 'BUY' THEN 'RUB' ELSE ticker END AS ticker, "
+        "sum(CASE WHEN direction = 'BUY' THEN qty * COALESCE(price, 0) ELSE qty END) AS qty "
+        "FROM orders WHERE status = 'PENDING' GROUP BY 1, 2) AS pending "
+        "WHERE balance.user_id = pending.user_id AND balance.ticker = pending.ticker AND balance.shard = 0"
+    )
+    op.execute("UPDATE orders SET status = 'CANCELLED' WHERE status = 'PENDING'")
+    op.drop_index('index_orders_pending_ticker_seq', table_name='orders', postgresql_where=sa.text("status = 'PENDING'"))
+    op.drop_column('orders', 'seq')
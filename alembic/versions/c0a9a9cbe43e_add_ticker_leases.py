@@ -0,0 +1,39 @@
+"""add ticker leases
+
+Revision ID: c0a9a9cbe43e
+Revises: 959fab66ae8f
+Create Date: 2026-10-19 01:51:41.663235
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c0a9a9cbe43e'
+down_revision: Union[str, None] = '959fab66ae8f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('ticker_leases',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('ticker', sa.String(length=10), nullable=False),
+    sa.Column('node_id', sa.String(length=100), nullable=False),
+    sa.Column('node_url', sa.String(length=200), nullable=True),
+    sa.Column('token', sa.BigInteger(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['ticker'], ['instruments.ticker'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_ticker_leases_ticker', 'ticker_leases', ['ticker'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_ticker_leases_ticker', table_name='ticker_leases')
+    op.drop_table('ticker_leases')
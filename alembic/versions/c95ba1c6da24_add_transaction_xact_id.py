@@ -0,0 +1,34 @@
+"""add transaction xact id
+
+Revision ID: c95ba1c6da24
+Revises: 99f9a2fbf51b
+Create Date: 2026-10-19 02:29:43.061705
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c95ba1c6da24'
+down_revision: Union[str, None] = '99f9a2fbf51b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Номер транзакции, записавшей сделку: по нему процессы догружают
+    # чужие сделки в порядке коммита, а не по времени, выставленному
+    # приложением. Старым строкам хватает нуля — их покрывает окно 24ч
+    op.add_column('transactions', sa.Column('xact_id', sa.BigInteger(), server_default='0', nullable=False))
+    op.alter_column('transactions', 'xact_id', server_default=sa.text('txid_current()'))
+    op.create_index('idx_transactions_xact_id', 'transactions', ['xact_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_transactions_xact_id', table_name='transactions')
+    op.drop_column('transactions', 'xact_id')
@@ -0,0 +1,40 @@
+import os
+import shutil
+
+
+# Каталог для файлов метрик prometheus_client, общий для всех воркеров
+prometheus_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus')
+# Каталог Unix-сокетов воркеров для распределения тикеров между ними
+affinity_dir = os.environ.setdefault('AFFINITY_DIR', '/tmp/affinity')
+
+def on_starting(server):
+    shutil.rmtree(prometheus_dir, ignore_errors=True)
+    os.makedirs(prometheus_dir, exist_ok=True)
+    shutil.rmtree(affinity_dir, ignore_errors=True)
+    os.makedirs(affinity_dir, exist_ok=True)
+    # Сегмент снимков стакана создается мастером и живет, пока жив он;
+    # размеры должны совпадать с src/orders/snapshots.py
+    if os.getenv('BOOK_SNAPSHOTS', '0') == '1':
+        from multiprocessing.shared_memory import SharedMemory
+        name = os.getenv('SNAPSHOT_SEGMENT', 'toy_exchange_books')
+        size = int(os.getenv('SNAPSHOT_SLOTS', '256')) * int(os.getenv('SNAPSHOT_SLOT_SIZE', str(64 * 1024)))
+        try:
+            SharedMemory(name).unlink()
+        except FileNotFoundError:
+            pass
+        server.snapshot_segment = SharedMemory(name, create=True, size=size)
+
+def on_exit(server):
+    segment = getattr(server, 'snapshot_segment', None)
+    if segment is not None:
+        segment.close()
+        segment.unlink()
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+    # Сокет упавшего воркера убирается сразу, чтобы кольцо перестроилось
+    try:
+        os.unlink(os.path.join(affinity_dir, f'worker-{worker.pid}.sock'))
+    except FileNotFoundError:
+        pass
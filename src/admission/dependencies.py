@@ -0,0 +1,82 @@
+from fastapi import HTTPException, Request, status
+
+from src.admission.limiter import rate_limiter
+from src.admission.gate import trading_gate, Priority, OverloadedError, ADMISSION_GATE
+from src.affinity.leases import lease_manager
+from src.monitoring.metrics import ADMISSION_REJECTED, ADMISSION_WAIT
+from src.logger import logger
+
+
+def client_address(request: Request) -> str:
+    return request.client.host if request.client else 'unknown'
+
+def check_rate_limit(route: str, key: str):
+    retry_after = rate_limiter.check(route, key)
+    if retry_after:
+        ADMISSION_REJECTED.labels(route, 'rate_limited').inc()
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail='Rate limit exceeded',
+            headers={'Retry-After': str(retry_after)}
+        )
+
+def rate_limit(route: str):
+    # Публичные ручки без аутентификации — ключ только адрес клиента
+    async def dependency(request: Request):
+        check_rate_limit(route, client_address(request))
+    return dependency
+
+# Подключается через dependencies= в декораторе ручки: такие зависимости
+# FastAPI разрешает первыми, так что отказ происходит до того, как запрос
+# возьмет соединение из пула
+def admission(route: str, priority: Priority, authenticated: bool = True):
+    async def dependency(request: Request):
+        # Заголовок Authorization здесь еще не проверен: случайный ключ на
+        # каждый запрос дал бы новое ведро, поэтому сначала общий лимит на
+        # адрес, и только потом лимит группы ручек на ключ
+        address = client_address(request)
+        if not authenticated:
+            check_rate_limit(route, address)
+        elif lease_manager.is_forwarded(request.headers.get('x-forwarded-order')):
+            # Ордер проксирован другим узлом: адрес — это узел, а не клиент,
+            # лимит на адрес клиента уже проверил узел, принявший запрос
+            check_rate_limit(route, request.headers.get('authorization') or address)
+        else:
+            check_rate_limit('address', address)
+            check_rate_limit(route, request.headers.get('authorization') or address)
+        if not ADMISSION_GATE:
+            yield
+            return
+        await acquire_gate(route, priority)
+        request.state.admitted = True
+        try:
+            yield
+        finally:
+            release_admission(request)
+    return dependency
+
+async def acquire_gate(route: str, priority: Priority):
+    try:
+        with ADMISSION_WAIT.labels(priority.name).time():
+            await trading_gate.acquire(priority)
+    except OverloadedError:
+        ADMISSION_REJECTED.labels(route, 'overloaded').inc()
+        logger.warning(f'[ADMISSION] Запрос отклонен из-за перегрузки: route={route}, priority={priority.name}')
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Server is overloaded, please retry',
+            headers={'Retry-After': '1'}
+        )
+
+def release_admission(request: Request):
+    # Слот можно отдать раньше конца запроса — например, пока ордер ждет
+    # ответа от воркера-владельца, который возьмет свой слот
+    if getattr(request.state, 'admitted', False):
+        request.state.admitted = False
+        trading_gate.release()
+
+async def readmit(request: Request, route: str, priority: Priority):
+    # Обратно в гейт, если запрос все-таки исполняется в этом воркере
+    if ADMISSION_GATE and not getattr(request.state, 'admitted', False):
+        await acquire_gate(route, priority)
+        request.state.admitted = True
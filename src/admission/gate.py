@@ -0,0 +1,93 @@
+import asyncio
+import heapq
+import itertools
+import os
+from enum import IntEnum
+
+from src.database import pool_limits
+
+
+class Priority(IntEnum):
+    CANCEL = 0
+    ORDER = 1
+    READ = 2
+
+ADMISSION_GATE = os.getenv('ADMISSION_GATE', '1') == '1'
+# По умолчанию одновременно допускается столько запросов, сколько
+# соединений может выдать торговый пул: лишние ждут в очереди гейта, а не
+# в пуле, где порядок не учитывает приоритет
+ADMISSION_CONCURRENCY = int(os.getenv('ADMISSION_CONCURRENCY', sum(pool_limits('trading')[:2])))
+ADMISSION_QUEUE_LIMIT = int(os.getenv('ADMISSION_QUEUE_LIMIT', '100'))
+ADMISSION_MAX_WAIT = {
+    Priority.CANCEL: float(os.getenv('ADMISSION_MAX_WAIT_CANCEL', '2')),
+    Priority.ORDER: float(os.getenv('ADMISSION_MAX_WAIT_ORDER', '1')),
+    Priority.READ: float(os.getenv('ADMISSION_MAX_WAIT_READ', '0.25'))
+}
+
+
+class OverloadedError(Exception):
+    pass
+
+
+class PriorityGate:
+    # Ограничивает число одновременно исполняемых торговых запросов.
+    # Освободившийся слот получает самый приоритетный из ожидающих, а при
+    # переполненной очереди новый запрос вытесняет самый низкоприоритетный
+    def __init__(self, capacity: int, queue_limit: int):
+        self.capacity = capacity
+        self.queue_limit = queue_limit
+        self.active = 0
+        self.waiters = []
+        self.counter = itertools.count()
+
+    def _remove(self, entry):
+        try:
+            self.waiters.remove(entry)
+        except ValueError:
+            return
+        heapq.heapify(self.waiters)
+
+    async def acquire(self, priority: Priority):
+        if self.active < self.capacity and not self.waiters:
+            self.active += 1
+            return
+
+        if len(self.waiters) >= self.queue_limit:
+            worst = max(self.waiters)
+            if worst[0] <= priority:
+                raise OverloadedError()
+            self._remove(worst)
+            worst[2].set_exception(OverloadedError())
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self.counter), future)
+        heapq.heappush(self.waiters, entry)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), ADMISSION_MAX_WAIT[priority])
+        except asyncio.TimeoutError:
+            if not future.done():
+                self._remove(entry)
+                future.cancel()
+                raise OverloadedError()
+        except asyncio.CancelledError:
+            # Клиент отключился, пока запрос ждал в очереди
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self.release()
+            else:
+                self._remove(entry)
+                future.cancel()
+            raise
+        # Слот мог быть передан в момент таймаута — тогда он наш
+        future.result()
+
+    def release(self):
+        while self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                # Слот переходит ожидающему, active не меняется
+                future.set_result(None)
+                return
+        self.active -= 1
+
+
+trading_gate = PriorityGate(ADMISSION_CONCURRENCY, ADMISSION_QUEUE_LIMIT)
@@ -0,0 +1,82 @@
+import math
+import os
+from time import monotonic
+
+
+# Лимиты запросов на ключ клиента (API-ключ, для публичных ручек — адрес)
+# по группам ручек: RATE_LIMIT_<ROUTE>=<запросов в секунду>/<всплеск>,
+# 0 отключает лимит. Группа address — общий лимит на адрес для всех ручек
+# с API-ключом, profile — проверки токена для заголовка X-Profile.
+# Счетчики живут в воркере, лимит действует на воркер
+RATE_LIMIT_DEFAULTS = {
+    'address': '200/400',
+    'order_create': '50/100',
+    'order_cancel': '100/200',
+    'order_read': '50/100',
+    'profile': '1/5',
+    'public': '100/200'
+}
+RATE_LIMIT_PRUNE_INTERVAL = float(os.getenv('RATE_LIMIT_PRUNE_INTERVAL', '60'))
+
+def parse_rate_limit(value: str) -> tuple[float, float] | None:
+    rate, _, burst = value.partition('/')
+    rate = float(rate)
+    if rate <= 0:
+        return None
+    return rate, float(burst) if burst else rate
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated_at')
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.updated_at = now
+
+    def take(self, rate: float, burst: float, now: float) -> float:
+        # Возвращает 0, если запрос пропущен, иначе через сколько секунд
+        # в ведре появится токен
+        self.tokens = min(burst, self.tokens + (now - self.updated_at) * rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / rate
+
+
+class RateLimiter:
+    def __init__(self):
+        self.limits = {
+            route: parse_rate_limit(os.getenv(f'RATE_LIMIT_{route.upper()}', default))
+            for route, default in RATE_LIMIT_DEFAULTS.items()
+        }
+        self.buckets = {}
+        self.prune_at = monotonic() + RATE_LIMIT_PRUNE_INTERVAL
+
+    def check(self, route: str, key: str) -> int:
+        # 0 — запрос пропущен, иначе значение для Retry-After в секундах
+        limit = self.limits.get(route)
+        if limit is None:
+            return 0
+        rate, burst = limit
+        now = monotonic()
+        if now >= self.prune_at:
+            self.prune(now)
+
+        bucket = self.buckets.get((route, key))
+        if bucket is None:
+            bucket = self.buckets[(route, key)] = TokenBucket(burst, now)
+        wait = bucket.take(rate, burst, now)
+        return math.ceil(wait) if wait else 0
+
+    def prune(self, now: float):
+        # Ведро, которое успело наполниться до краев, ничем не отличается
+        # от нового — его можно выбросить
+        for (route, key), bucket in list(self.buckets.items()):
+            rate, burst = self.limits[route]
+            if bucket.tokens + (now - bucket.updated_at) * rate >= burst:
+                del self.buckets[(route, key)]
+        self.prune_at = now + RATE_LIMIT_PRUNE_INTERVAL
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,74 @@
+import asyncio
+import os
+
+import httpx
+import orjson
+
+from src.logger import logger
+
+
+AFFINITY_FORWARD_TIMEOUT = float(os.getenv('AFFINITY_FORWARD_TIMEOUT', '5'))
+
+
+class OwnerUnavailableError(Exception):
+    pass
+
+_http_client = None
+
+
+# Протокол — по одному JSON-сообщению на строку в обе стороны
+async def serve(path: str, handler):
+    async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while line := await reader.readline():
+                response = await handler(orjson.loads(line))
+                writer.write(orjson.dumps(response) + b'\n')
+                await writer.drain()
+        except Exception as e:
+            logger.error(f'[AFFINITY] Ошибка при обработке пересланного запроса: {str(e)}', exc_info=True)
+        finally:
+            writer.close()
+
+    if os.path.exists(path):
+        os.unlink(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    server = await asyncio.start_unix_server(handle_connection, path=path)
+    logger.info(f'[AFFINITY] Воркер слушает {path}')
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if os.path.exists(path):
+            os.unlink(path)
+
+async def forward(path: str, message: dict) -> dict:
+    # Ошибка подключения означает, что запрос владельцу не ушел и его можно
+    # выполнить локально; таймаут после отправки так трактовать нельзя
+    try:
+        reader, writer = await asyncio.open_unix_connection(path)
+    except (FileNotFoundError, ConnectionRefusedError) as e:
+        raise OwnerUnavailableError(str(e))
+    try:
+        writer.write(orjson.dumps(message) + b'\n')
+        await writer.drain()
+        line = await asyncio.wait_for(reader.readline(), AFFINITY_FORWARD_TIMEOUT)
+        if not line:
+            raise ConnectionResetError('Owner closed the connection')
+        return orjson.loads(line)
+    finally:
+        writer.close()
+
+async def proxy(url: str, headers: dict, payload: dict) -> httpx.Response:
+    # То же правило для другого узла: не удалось подключиться — можно
+    # исполнять самим, оборвалось после отправки — нельзя
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(timeout=AFFINITY_FORWARD_TIMEOUT)
+    try:
+        return await _http_client.post(url, json=payload, headers=headers)
+    except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+        raise OwnerUnavailableError(str(e))
+    except httpx.TimeoutException as e:
+        raise asyncio.TimeoutError(str(e))
+    except httpx.TransportError as e:
+        raise ConnectionError(str(e))
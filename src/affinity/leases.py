@@ -0,0 +1,232 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import socket
+from datetime import datetime, timezone
+from time import monotonic
+
+from sqlalchemy import select, update, text, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from src.database import DATABASE_URL
+from src.ids import uuid7
+from src.affinity.models import TickerLeaseModel
+from src.affinity.ring import ticker_ring
+from src.instruments.models import InstrumentModel
+from src.logger import logger
+
+
+MATCHING_LEASES = os.getenv('MATCHING_LEASES', '0') == '1'
+NODE_URL = os.getenv('NODE_URL')
+LEASE_TTL = float(os.getenv('LEASE_TTL', '10'))
+LEASE_HEARTBEAT_INTERVAL = float(os.getenv('LEASE_HEARTBEAT_INTERVAL', '3'))
+# Общий секрет узлов: им подписан заголовок X-Forwarded-Order у
+# проксированных ордеров. Без секрета такие запросы не считаются доверенными
+LEASE_NODE_SECRET = os.getenv('LEASE_NODE_SECRET')
+
+
+class LeaseManager:
+    # Владение тикером между узлами: сессионный pg_try_advisory_lock на
+    # отдельном соединении плюс строка ticker_leases с адресом владельца,
+    # сроком действия и fencing-токеном. Смерть процесса закрывает
+    # соединение и снимает блокировку; потерю связи с узлом ограничивают
+    # TCP keepalive на стороне сервера, а сам владелец перестает считать
+    # аренду своей, если heartbeat не проходил дольше LEASE_TTL
+    def __init__(self):
+        self.enabled = MATCHING_LEASES
+        self.node_id = f'{socket.gethostname()}:{os.getpid()}'
+        self.node_url = NODE_URL
+        self.engine = None
+        self.connection = None
+        self.held = {}
+        self.owners = {}
+        self.last_heartbeat = 0
+        self.listeners = []
+
+    def start(self):
+        self.node_id = f'{socket.gethostname()}:{os.getpid()}'
+        self.engine = create_async_engine(
+            DATABASE_URL,
+            poolclass=NullPool,
+            isolation_level='AUTOCOMMIT',
+            connect_args={'server_settings': {
+                'tcp_keepalives_idle': '5',
+                'tcp_keepalives_interval': '2',
+                'tcp_keepalives_count': '3'
+            }}
+        )
+
+    def on_change(self, listener):
+        self.listeners.append(listener)
+
+    def _notify(self, ticker: str):
+        for listener in self.listeners:
+            listener(ticker)
+
+    def holds(self, ticker: str) -> bool:
+        return ticker in self.held and monotonic() - self.last_heartbeat < LEASE_TTL
+
+    def owner_url(self, ticker: str) -> str | None:
+        # Адрес другого узла, которому нужно проксировать ордер; None — если
+        # владелец это узел (тогда решает локальное кольцо) или его нет
+        owner = self.owners.get(ticker)
+        if owner is None:
+            return None
+        node_url, expires_at = owner
+        if node_url is None or node_url == self.node_url or expires_at <= datetime.now(timezone.utc):
+            return None
+        return node_url
+
+    def _sign(self, node_id: str) -> str:
+        return hmac.new(LEASE_NODE_SECRET.encode(), node_id.encode(), hashlib.sha256).hexdigest()
+
+    def forwarded_header(self) -> str:
+        if not LEASE_NODE_SECRET:
+            return self.node_id
+        return f'{self.node_id}:{self._sign(self.node_id)}'
+
+    def is_forwarded(self, value: str | None) -> bool:
+        # Запрос пришел от другого узла кластера, а не от клиента
+        if not LEASE_NODE_SECRET or not value:
+            return False
+        node_id, _, signature = value.rpartition(':')
+        return bool(node_id) and hmac.compare_digest(signature, self._sign(node_id))
+
+    def _drop(self, ticker: str):
+        self.held.pop(ticker, None)
+        self._notify(ticker)
+
+    def _drop_all(self):
+        for ticker in list(self.held):
+            self._drop(ticker)
+
+    async def fence(self, session: AsyncSession, ticker: str):
+        # Выполняется в транзакции ордера. Владелец держит строку аренды FOR
+        # SHARE до коммита, так что перехват аренды дождется его сделок.
+        # Любой другой процесс, исполняющий ордер по тикеру, увеличивает
+        # токен — владелец увидит расхождение и сбросит свой кэш стакана
+        if self.holds(ticker):
+            token = await session.scalar(
+                select(TickerLeaseModel.token)
+                .where(TickerLeaseModel.ticker == ticker)
+                .with_for_update(read=True)
+            )
+            if token == self.held[ticker]:
+                return
+            logger.warning(f'[LEASE] Токен аренды {ticker} изменился: {self.held[ticker]} -> {token}')
+            self._drop(ticker)
+        await session.execute(
+            update(TickerLeaseModel)
+            .where(TickerLeaseModel.ticker == ticker)
+            .values(token=TickerLeaseModel.token + 1)
+        )
+
+    async def _claim(self, ticker: str):
+        statement = insert(TickerLeaseModel).values(
+            id=uuid7(),
+            ticker=ticker,
+            node_id=self.node_id,
+            node_url=self.node_url,
+            token=1,
+            expires_at=func.now() + text(f"interval '{LEASE_TTL} seconds'")
+        )
+        token = await self.connection.scalar(
+            statement.on_conflict_do_update(
+                index_elements=[TickerLeaseModel.ticker],
+                set_={
+                    'node_id': statement.excluded.node_id,
+                    'node_url': statement.excluded.node_url,
+                    'token': TickerLeaseModel.token + 1,
+                    'expires_at': statement.excluded.expires_at
+                }
+            ).returning(TickerLeaseModel.token)
+        )
+        self.held[ticker] = token
+        self._notify(ticker)
+        logger.info(f'[LEASE] Узел {self.node_id} взял аренду {ticker}: token={token}')
+
+    async def _release(self, ticker: str):
+        token = self.held.get(ticker)
+        self._drop(ticker)
+        await self.connection.execute(
+            update(TickerLeaseModel)
+            .where(TickerLeaseModel.ticker == ticker)
+            .where(TickerLeaseModel.token == token)
+            .values(expires_at=func.now())
+        )
+        await self.connection.scalar(select(func.pg_advisory_unlock(func.hashtext(f'ticker_lease:{ticker}'))))
+        logger.info(f'[LEASE] Узел {self.node_id} отпустил аренду {ticker}')
+
+    async def tick(self):
+        if self.connection is None:
+            self.connection = await self.engine.connect()
+
+        tickers = (await self.connection.scalars(
+            select(InstrumentModel.ticker).where(InstrumentModel.ticker != 'RUB')
+        )).all()
+        # Внутри узла аренду берет воркер, которому тикер достался в кольце
+        wanted = {ticker for ticker in tickers if not ticker_ring.enabled or ticker_ring.owns(ticker)}
+
+        for ticker in list(self.held):
+            if ticker not in wanted:
+                await self._release(ticker)
+
+        if self.held:
+            renewed = dict((await self.connection.execute(
+                update(TickerLeaseModel)
+                .where(TickerLeaseModel.ticker.in_(list(self.held)))
+                .where(TickerLeaseModel.node_id == self.node_id)
+                .values(expires_at=func.now() + text(f"interval '{LEASE_TTL} seconds'"))
+                .returning(TickerLeaseModel.ticker, TickerLeaseModel.token)
+            )).all())
+            for ticker, token in list(self.held.items()):
+                if renewed.get(ticker) != token:
+                    # Токен увеличил чужой ордер; блокировка по-прежнему наша —
+                    # забираем аренду заново с новым токеном
+                    await self._claim(ticker)
+        self.last_heartbeat = monotonic()
+
+        for ticker in wanted - set(self.held):
+            locked = await self.connection.scalar(
+                select(func.pg_try_advisory_lock(func.hashtext(f'ticker_lease:{ticker}')))
+            )
+            if locked:
+                await self._claim(ticker)
+
+        self.owners = {
+            ticker: (node_url, expires_at)
+            for ticker, node_url, expires_at in await self.connection.execute(
+                select(TickerLeaseModel.ticker, TickerLeaseModel.node_url, TickerLeaseModel.expires_at)
+            )
+        }
+
+    async def run(self, interval: float):
+        while True:
+            try:
+                await self.tick()
+            except Exception as e:
+                # Соединение с блокировками потеряно — аренды больше не наши
+                logger.error(f'[LEASE] Ошибка при продлении аренд: {str(e)}', exc_info=True)
+                self._drop_all()
+                if self.connection is not None:
+                    try:
+                        await self.connection.close()
+                    except Exception:
+                        pass
+                    self.connection = None
+            await asyncio.sleep(interval)
+
+    async def close(self):
+        if self.connection is not None:
+            for ticker in list(self.held):
+                await self._release(ticker)
+            await self.connection.close()
+            self.connection = None
+        if self.engine is not None:
+            await self.engine.dispose()
+
+
+lease_manager = LeaseManager()
@@ -0,0 +1,51 @@
+from uuid import UUID
+from datetime import datetime
+
+from sqlalchemy import String, BigInteger, ForeignKey, DateTime, Index
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.dialects.postgresql import UUID as PGUUID
+
+from src.database import Base
+from src.ids import uuid7
+
+
+class TickerLeaseModel(Base):
+    __tablename__ = 'ticker_leases'
+
+    id: Mapped[UUID] = mapped_column(
+        PGUUID,
+        primary_key=True,
+        default=uuid7,
+        nullable=False
+    )
+
+    ticker: Mapped[str] = mapped_column(
+        String(10),
+        ForeignKey('instruments.ticker', ondelete='CASCADE'),
+        nullable=False
+    )
+
+    node_id: Mapped[str] = mapped_column(
+        String(100),
+        nullable=False
+    )
+
+    node_url: Mapped[str] = mapped_column(
+        String(200),
+        nullable=True
+    )
+
+    token: Mapped[int] = mapped_column(
+        BigInteger,
+        nullable=False,
+        default=1
+    )
+
+    expires_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        nullable=False
+    )
+
+    __table_args__ = (
+        Index('idx_ticker_leases_ticker', 'ticker', unique=True),
+    )
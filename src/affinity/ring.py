@@ -0,0 +1,108 @@
+import asyncio
+import bisect
+import hashlib
+import os
+from time import monotonic
+
+from src.logger import logger
+
+
+TICKER_AFFINITY = os.getenv('TICKER_AFFINITY', '0') == '1'
+AFFINITY_DIR = os.getenv('AFFINITY_DIR', '/tmp/affinity')
+AFFINITY_REFRESH_INTERVAL = float(os.getenv('AFFINITY_REFRESH_INTERVAL', '1'))
+AFFINITY_VIRTUAL_NODES = int(os.getenv('AFFINITY_VIRTUAL_NODES', '64'))
+AFFINITY_EXCLUDE_SECONDS = float(os.getenv('AFFINITY_EXCLUDE_SECONDS', '5'))
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    # Консистентное хеширование с виртуальными узлами: при уходе или
+    # появлении воркера переезжает только его доля тикеров
+    def __init__(self, nodes: list[str], virtual_nodes: int = AFFINITY_VIRTUAL_NODES):
+        self.nodes = sorted(nodes)
+        points = sorted(
+            (_hash(f'{node}#{replica}'), node)
+            for node in self.nodes
+            for replica in range(virtual_nodes)
+        )
+        self._keys = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def owner(self, key: str) -> str | None:
+        if not self._keys:
+            return None
+        index = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._nodes[index]
+
+
+class TickerRing:
+    # Каждый воркер gunicorn слушает Unix-сокет worker-<pid>.sock в
+    # AFFINITY_DIR; набор сокетов в каталоге и есть состав кольца
+    def __init__(self):
+        self.enabled = TICKER_AFFINITY
+        self.node = f'worker-{os.getpid()}'
+        self.ring = HashRing([])
+        self.excluded = {}
+        self.listeners = []
+
+    def start(self):
+        # Воркеры gunicorn форкаются от мастера — идентификатор берется уже в воркере
+        self.node = f'worker-{os.getpid()}'
+        self.refresh()
+
+    @property
+    def socket_path(self) -> str:
+        return self.socket_for(self.node)
+
+    def socket_for(self, node: str) -> str:
+        return os.path.join(AFFINITY_DIR, f'{node}.sock')
+
+    def owner(self, ticker: str) -> str | None:
+        if not self.enabled:
+            return None
+        return self.ring.owner(ticker)
+
+    def owns(self, ticker: str) -> bool:
+        return self.enabled and self.owner(ticker) == self.node
+
+    def on_change(self, listener):
+        self.listeners.append(listener)
+
+    def refresh(self):
+        try:
+            nodes = {
+                name[:-len('.sock')]
+                for name in os.listdir(AFFINITY_DIR)
+                if name.endswith('.sock')
+            }
+        except FileNotFoundError:
+            nodes = set()
+        now = monotonic()
+        self.excluded = {node: until for node, until in self.excluded.items() if until > now}
+        nodes = (nodes - set(self.excluded)) | {self.node}
+        if set(self.ring.nodes) == nodes:
+            return
+        logger.info(f'[AFFINITY] Состав кольца изменился: {sorted(nodes)}')
+        self.ring = HashRing(list(nodes))
+        for listener in self.listeners:
+            listener()
+
+    def exclude(self, node: str):
+        # Воркер не отвечает на сокете — его тикеры временно берут остальные
+        logger.warning(f'[AFFINITY] Воркер {node} недоступен, исключен из кольца')
+        self.excluded[node] = monotonic() + AFFINITY_EXCLUDE_SECONDS
+        self.refresh()
+
+    async def refresh_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f'[AFFINITY] Ошибка при обновлении кольца: {str(e)}', exc_info=True)
+
+
+ticker_ring = TickerRing()
@@ -1,15 +1,16 @@
-from uuid import uuid4, UUID
+from uuid import UUID
 from sqlalchemy import String, Integer, ForeignKey, Index
 from sqlalchemy.orm import Mapped, mapped_column
 from sqlalchemy.dialects.postgresql import UUID as PGUUID
 from src.database import Base
+from src.ids import uuid7
 
 class BalanceModel(Base):
     __tablename__ = 'balance'
 
     id: Mapped[UUID] = mapped_column(
         PGUUID,
-        default=uuid4,
+        default=uuid7,
         primary_key=True
     )
     
@@ -26,6 +27,13 @@ class BalanceModel(Base):
         nullable=False
     )
 
+    shard: Mapped[int] = mapped_column(
+        Integer,
+        nullable=False,
+        default=0,
+        server_default='0'
+    )
+
     amount: Mapped[int] = mapped_column(
         Integer,
         nullable=False
@@ -36,7 +44,17 @@ class BalanceModel(Base):
         nullable=False
     )
 
+    version: Mapped[int] = mapped_column(
+        Integer,
+        nullable=False,
+        server_default='1'
+    )
+
     __table_args__ = (
-        Index('idx_balance_user_ticker', 'user_id', 'ticker', unique=True),
+        Index('idx_balance_user_ticker_shard', 'user_id', 'ticker', 'shard', unique=True),
         Index('idx_balance_ticker_amount', 'ticker', 'amount'),
-    )
\ No newline at end of file
+    )
+
+    __mapper_args__ = {
+        'version_id_col': version
+    }
\ No newline at end of file
@@ -1,43 +1,49 @@
+from uuid import UUID
+
 from fastapi import APIRouter, HTTPException, Depends, status
-from sqlalchemy import select
+from sqlalchemy import select, func
 
-from src.database import SessionDep
+from src.database import SessionDep, AdminSessionDep, TradingReadSessionDep, run_transaction
 from src.balance.models import BalanceModel
+from src.balance.utils import update_balance, rebalance_shards
 from src.instruments.models import InstrumentModel
 from src.users.models import UserModel
-from src.balance.schemas import BalanceSchema
-from src.users.dependencies import get_current_admin, get_current_user
+from src.balance.schemas import BalanceSchema, BalanceShardsSchema
+from src.users.dependencies import get_current_admin, get_current_reader
+from src.admission.dependencies import admission
+from src.admission.gate import Priority
 from src.schemas import OkResponseSchema
 from src.logger import logger
+from src.responses import FastJSONResponse
 
 
 balance_router = APIRouter()
 
-@balance_router.get('/api/v1/balance', response_model=dict[str, int], tags=['balance'])
+@balance_router.get('/api/v1/balance', response_model=dict[str, int], dependencies=[Depends(admission('order_read', Priority.READ))], tags=['balance'])
 async def get_balances(
-    session: SessionDep,
-    current_user: UserModel = Depends(get_current_user)
+    session: TradingReadSessionDep,
+    current_user: UserModel = Depends(get_current_reader)
 ):
     logger.info(f'[GET /api/v1/balance] Начало запроса балансов для пользователя {current_user.id}')
     try:
-        balances = await session.scalars(
-            select(BalanceModel)
+        balances = await session.execute(
+            select(BalanceModel.ticker, func.sum(BalanceModel.amount))
             .where(BalanceModel.user_id == current_user.id)
+            .group_by(BalanceModel.ticker)
         )
-        balances_dict = {balance.ticker: int(balance.amount) for balance in balances.all()}
+        balances_dict = {ticker: amount for ticker, amount in balances}
         logger.info(f'[GET /api/v1/balance] Успешно получены балансы для пользователя {current_user.id}: {balances_dict}')
-        return balances_dict
+        return FastJSONResponse(balances_dict)
     except Exception as e:
         logger.error(f'[GET /api/v1/balance] Ошибка при получении балансов для пользователя {current_user.id}: {str(e)}')
         raise
 
-@balance_router.post('/api/v1/admin/balance/deposit', response_model=OkResponseSchema, tags=['admin', 'balance'])
-async def deposit_balance(
-    balance_data: BalanceSchema, 
+async def deposit(
     session: SessionDep,
-    current_admin: UserModel = Depends(get_current_admin)
+    admin_id: UUID,
+    balance_data: BalanceSchema
 ):
-    logger.info(f'[POST /api/v1/admin/balance/deposit] Админ {current_admin.id}) инициировал пополнение баланса: user_id={balance_data.user_id}, ticker={balance_data.ticker}, amount={balance_data.amount}')
+    logger.info(f'[POST /api/v1/admin/balance/deposit] Админ {admin_id} инициировал пополнение баланса: user_id={balance_data.user_id}, ticker={balance_data.ticker}, amount={balance_data.amount}')
     
     try:
         user = await session.scalar(
@@ -73,6 +79,8 @@ async def deposit_balance(
                 BalanceModel.user_id == balance_data.user_id,
                 BalanceModel.ticker == balance_data.ticker
             )
+            .order_by(BalanceModel.shard)
+            .limit(1)
         )
         
         if balance:
@@ -81,29 +89,32 @@ async def deposit_balance(
             balance.available += balance_data.amount
             logger.info(f'[POST /api/v1/admin/balance/deposit] Обновление существующего баланса: user_id={balance_data.user_id}, ticker={balance_data.ticker}, old_amount={old_amount}, new_amount={balance.amount}')
         else:
-            balance = BalanceModel(
-                user_id=balance_data.user_id,
-                ticker=balance_data.ticker,
-                amount=balance_data.amount,
-                available=balance_data.amount
-            )
-            session.add(balance)
+            # Строку мог параллельно создать другой запрос, поэтому upsert
+            await update_balance(session, balance_data.user_id, balance_data.ticker, balance_data.amount)
             logger.info(f'[POST /api/v1/admin/balance/deposit] Создание нового баланса: user_id={balance_data.user_id}, ticker={balance_data.ticker}, amount={balance_data.amount}')
 
         await session.commit()
-        logger.info(f'[POST /api/v1/admin/balance/deposit] Успешное пополнение баланса: user_id={balance_data.user_id}, ticker={balance_data.ticker}, amount={balance_data.amount}, admin_id={current_admin.id}')
+        logger.info(f'[POST /api/v1/admin/balance/deposit] Успешное пополнение баланса: user_id={balance_data.user_id}, ticker={balance_data.ticker}, amount={balance_data.amount}, admin_id={admin_id}')
         return {'success': True}
     except Exception as e:
         logger.error(f'[POST /api/v1/admin/balance/deposit] Ошибка при пополнении баланса: {str(e)}')
         raise
 
-@balance_router.post('/api/v1/admin/balance/withdraw', response_model=OkResponseSchema, tags=['admin', 'balance'])
-async def withdraw_balance(
-    balance_data: BalanceSchema,
-    session: SessionDep,
+@balance_router.post('/api/v1/admin/balance/deposit', response_model=OkResponseSchema, tags=['admin', 'balance'])
+async def deposit_balance(
+    balance_data: BalanceSchema, 
+    session: AdminSessionDep,
     current_admin: UserModel = Depends(get_current_admin)
 ):
-    logger.info(f'[POST /api/v1/admin/balance/withdraw] Админ {current_admin.id} инициировал списание баланса: user_id={balance_data.user_id}, ticker={balance_data.ticker}, amount={balance_data.amount}')
+    admin_id = current_admin.id
+    return await run_transaction(session, lambda: deposit(session, admin_id, balance_data), 'deposit')
+
+async def withdraw(
+    session: SessionDep,
+    admin_id: UUID,
+    balance_data: BalanceSchema
+):
+    logger.info(f'[POST /api/v1/admin/balance/withdraw] Админ {admin_id} инициировал списание баланса: user_id={balance_data.user_id}, ticker={balance_data.ticker}, amount={balance_data.amount}')
     
     try:
         user = await session.scalar(
@@ -120,35 +131,93 @@ async def withdraw_balance(
 
         logger.info(f'[POST /api/v1/admin/balance/withdraw] Найден пользователь: id={user.id}')
 
-        balance = await session.scalar(
+        balances = list(await session.scalars(
             select(BalanceModel)
             .where(
                 BalanceModel.user_id == balance_data.user_id,
                 BalanceModel.ticker == balance_data.ticker
             )
-        )
+            .order_by(BalanceModel.shard)
+        ))
         
-        if not balance:
+        if not balances:
             logger.warning(f'[POST /api/v1/admin/balance/withdraw] Попытка списания баланса: баланс по тикеру {balance_data.ticker} не найден у пользователя {balance_data.user_id}')
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f'No balance found for ticker {balance_data.ticker}'
             )
 
-        logger.info(f'[POST /api/v1/admin/balance/withdraw] Текущий баланс пользователя: user_id={balance_data.user_id}, ticker={balance_data.ticker}, current_amount={balance.amount}')
+        old_amount = sum(balance.amount for balance in balances)
+        available = sum(balance.available for balance in balances)
+        logger.info(f'[POST /api/v1/admin/balance/withdraw] Текущий баланс пользователя: user_id={balance_data.user_id}, ticker={balance_data.ticker}, current_amount={old_amount}, available={available}')
 
-        if balance.amount < balance_data.amount:
-            logger.warning(f'[POST /api/v1/admin/balance/withdraw] Недостаточно средств: user_id={balance_data.user_id}, ticker={balance_data.ticker}, current_amount={balance.amount}, requested_amount={balance_data.amount}')
+        # Средства, зарезервированные под открытые ордера, списать нельзя
+        if available < balance_data.amount:
+            logger.warning(f'[POST /api/v1/admin/balance/withdraw] Недостаточно средств: user_id={balance_data.user_id}, ticker={balance_data.ticker}, available={available}, requested_amount={balance_data.amount}')
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail='Insufficient balance for withdrawal'
             )
 
-        old_amount = balance.amount
-        balance.amount -= balance_data.amount
+        remaining = balance_data.amount
+        for balance in balances:
+            withdrawn = min(balance.available, remaining)
+            balance.amount -= withdrawn
+            balance.available -= withdrawn
+            remaining -= withdrawn
         await session.commit()
-        logger.info(f'[POST /api/v1/admin/balance/withdraw] Успешное списание баланса: user_id={balance_data.user_id}, ticker={balance_data.ticker}, old_amount={old_amount}, new_amount={balance.amount}, admin_id={current_admin.id}')
+        logger.info(f'[POST /api/v1/admin/balance/withdraw] Успешное списание баланса: user_id={balance_data.user_id}, ticker={balance_data.ticker}, old_amount={old_amount}, new_amount={old_amount - balance_data.amount}, admin_id={admin_id}')
         return {'success': True}
     except Exception as e:
         logger.error(f'[POST /api/v1/admin/balance/withdraw] Ошибка при списании баланса: {str(e)}')
-        raise
\ No newline at end of file
+        raise
+
+@balance_router.post('/api/v1/admin/balance/withdraw', response_model=OkResponseSchema, tags=['admin', 'balance'])
+async def withdraw_balance(
+    balance_data: BalanceSchema,
+    session: AdminSessionDep,
+    current_admin: UserModel = Depends(get_current_admin)
+):
+    admin_id = current_admin.id
+    return await run_transaction(session, lambda: withdraw(session, admin_id, balance_data), 'withdraw')
+
+async def set_shards(
+    session: SessionDep,
+    admin_id: UUID,
+    shards_data: BalanceShardsSchema
+):
+    logger.info(f'[POST /api/v1/admin/balance/shards] Админ {admin_id} задает число шардов баланса: user_id={shards_data.user_id}, shards={shards_data.shards}')
+
+    user = await session.scalar(
+        select(UserModel)
+        .where(UserModel.id == shards_data.user_id)
+        .with_for_update()
+    )
+    if not user:
+        logger.warning(f'[POST /api/v1/admin/balance/shards] Пользователь {shards_data.user_id} не найден')
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='User not found'
+        )
+
+    user.balance_shards = shards_data.shards
+    tickers = await session.scalars(
+        select(BalanceModel.ticker)
+        .where(BalanceModel.user_id == shards_data.user_id)
+        .distinct()
+    )
+    for ticker in sorted(tickers.all()):
+        await rebalance_shards(session, shards_data.user_id, ticker, shards_data.shards)
+
+    await session.commit()
+    logger.info(f'[POST /api/v1/admin/balance/shards] Балансы пользователя {shards_data.user_id} распределены по {shards_data.shards} шардам')
+    return {'success': True}
+
+@balance_router.post('/api/v1/admin/balance/shards', response_model=OkResponseSchema, tags=['admin', 'balance'])
+async def set_balance_shards(
+    shards_data: BalanceShardsSchema,
+    session: AdminSessionDep,
+    current_admin: UserModel = Depends(get_current_admin)
+):
+    admin_id = current_admin.id
+    return await run_transaction(session, lambda: set_shards(session, admin_id, shards_data), 'set_balance_shards')
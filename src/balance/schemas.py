@@ -7,5 +7,9 @@ class BalanceSchema(BaseModel):
     ticker: str
     amount: int = Field(gt=0)
 
+class BalanceShardsSchema(BaseModel):
+    user_id: UUID
+    shards: int = Field(ge=1, le=64)
+
 class GetBalanceResponseSchema(RootModel[dict[str, int]]):
     pass
\ No newline at end of file
@@ -0,0 +1,297 @@
+import asyncio
+import os
+from typing import NamedTuple
+from uuid import UUID
+
+from fastapi import HTTPException, status
+from sqlalchemy import select, update, func, lambda_stmt, or_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database import admin_engine
+from src.balance.models import BalanceModel
+from src.users.models import UserModel
+from src.ids import uuid7
+from src.logger import logger
+
+
+BALANCE_REBALANCE_INTERVAL = float(os.getenv('BALANCE_REBALANCE_INTERVAL', '60'))
+
+
+class BalanceTotals(NamedTuple):
+    amount: int
+    available: int
+
+
+def _apply_delta_statement(
+    user_id: UUID,
+    ticker: str,
+    delta_amount: int,
+    delta_available: int,
+    skip_locked: bool
+):
+    # Баланс может быть разбит на несколько строк-шардов; изменение
+    # применяется к любому шарду, который его выдерживает. С SKIP LOCKED
+    # параллельные сделки расходятся по разным шардам, без него ждем
+    # блокировку в порядке номеров шардов. Случайный выбор шарда порядок
+    # блокировок не нарушает: SKIP LOCKED никогда не ждет, поэтому не может
+    # замкнуть цикл ожиданий; ждут только блокирующий вариант, списание по
+    # нескольким шардам и rebalance_shards — все по возрастанию номера шарда. Оба варианта —
+    # lambda_stmt: UPDATE с подзапросом строится и компилируется один раз
+    if skip_locked:
+        return lambda_stmt(
+            lambda: update(BalanceModel)
+            .where(BalanceModel.id == (
+                select(BalanceModel.id)
+                .where(BalanceModel.user_id == user_id)
+                .where(BalanceModel.ticker == ticker)
+                .where(BalanceModel.amount + delta_amount >= 0)
+                .where(BalanceModel.available + delta_available >= 0)
+                .where(BalanceModel.amount + delta_amount >= BalanceModel.available + delta_available)
+                .order_by(func.random())
+                .limit(1)
+                .with_for_update(skip_locked=True)
+                .scalar_subquery()
+            ))
+            .values(
+                amount=BalanceModel.amount + delta_amount,
+                available=BalanceModel.available + delta_available,
+                version=BalanceModel.version + 1
+            )
+            .returning(BalanceModel.amount, BalanceModel.available)
+            .execution_options(synchronize_session=False)
+        )
+    return lambda_stmt(
+        lambda: update(BalanceModel)
+        .where(BalanceModel.id == (
+            select(BalanceModel.id)
+            .where(BalanceModel.user_id == user_id)
+            .where(BalanceModel.ticker == ticker)
+            .where(BalanceModel.amount + delta_amount >= 0)
+            .where(BalanceModel.available + delta_available >= 0)
+            .where(BalanceModel.amount + delta_amount >= BalanceModel.available + delta_available)
+            .order_by(BalanceModel.shard)
+            .limit(1)
+            .with_for_update()
+            .scalar_subquery()
+        ))
+        .values(
+            amount=BalanceModel.amount + delta_amount,
+            available=BalanceModel.available + delta_available,
+            version=BalanceModel.version + 1
+        )
+        .returning(BalanceModel.amount, BalanceModel.available)
+        .execution_options(synchronize_session=False)
+    )
+
+def _upsert_statement(
+    user_id: UUID,
+    ticker: str,
+    delta_amount: int,
+    delta_available: int
+):
+    statement = insert(BalanceModel).values(
+        id=uuid7(),
+        user_id=user_id,
+        ticker=ticker,
+        shard=0,
+        amount=delta_amount,
+        available=delta_available
+    )
+    return statement.on_conflict_do_update(
+        index_elements=[BalanceModel.user_id, BalanceModel.ticker, BalanceModel.shard],
+        set_={
+            'amount': BalanceModel.amount + statement.excluded.amount,
+            'available': BalanceModel.available + statement.excluded.available,
+            'version': BalanceModel.version + 1
+        }
+    ).returning(BalanceModel.amount, BalanceModel.available)
+
+async def apply_delta(
+    session: AsyncSession,
+    user_id: UUID,
+    ticker: str,
+    delta_amount: int,
+    delta_available: int
+):
+    for skip_locked in (True, False):
+        balance = (await session.execute(
+            _apply_delta_statement(user_id, ticker, delta_amount, delta_available, skip_locked)
+        )).first()
+        if balance is not None:
+            return balance
+
+    # Строк баланса еще нет. Вставка в нулевой шард допустима, только если
+    # сама дельта не нарушает amount >= available: при конфликте она
+    # сохраняет это условие для любой существующей строки
+    if delta_amount >= delta_available >= 0:
+        return (await session.execute(
+            _upsert_statement(user_id, ticker, delta_amount, delta_available)
+        )).first()
+
+    # Ни один шард не выдерживает изменение целиком — делим его между шардами
+    return await _apply_across_shards(session, user_id, ticker, delta_amount, delta_available)
+
+def _split(delta: int, limits: list[int]) -> list[int]:
+    # Прибавка целиком идет в первый шард, списание — по шардам, пока не
+    # наберется нужная сумма; limits — сколько можно списать с каждого
+    parts = [0] * len(limits)
+    if delta >= 0:
+        parts[0] = delta
+        return parts
+    remaining = -delta
+    for index, limit in enumerate(limits):
+        parts[index] = -min(limit, remaining)
+        remaining += parts[index]
+    return parts
+
+async def _apply_across_shards(
+    session: AsyncSession,
+    user_id: UUID,
+    ticker: str,
+    delta_amount: int,
+    delta_available: int
+):
+    # Шарды остаются шардами: слияние в одну строку посреди сделки отменило
+    # бы шардирование как раз для горячих счетов. Резерв (amount -
+    # available) и свободные средства меняются независимо, и каждое из двух
+    # изменений списывается с тех шардов, где есть что списать. Шарды
+    # блокируются по возрастанию номера, как и в блокирующем UPDATE
+    balances = list(await session.scalars(
+        select(BalanceModel)
+        .where(BalanceModel.user_id == user_id)
+        .where(BalanceModel.ticker == ticker)
+        .order_by(BalanceModel.shard)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    ))
+    delta_reserved = delta_amount - delta_available
+    reserved = [balance.amount - balance.available for balance in balances]
+    available = [balance.available for balance in balances]
+    if not balances or sum(reserved) + delta_reserved < 0 or sum(available) + delta_available < 0:
+        return None
+
+    for balance, reserved_part, available_part in zip(balances, _split(delta_reserved, reserved), _split(delta_available, available)):
+        balance.amount += reserved_part + available_part
+        balance.available += available_part
+    await session.flush()
+    logger.info(f'[APPLY_DELTA] Изменение баланса {ticker} пользователя {user_id} распределено по {len(balances)} шардам: delta_amount={delta_amount}, delta_available={delta_available}')
+    return BalanceTotals(
+        sum(balance.amount for balance in balances),
+        sum(balance.available for balance in balances)
+    )
+
+async def update_balance(
+    session: AsyncSession,
+    user_id: UUID,
+    ticker: str,
+    delta_amount: int,
+    delta_available: int = None
+):
+    if delta_available is None:
+        delta_available = delta_amount
+    logger.debug(f'[UPDATE_BALANCE] Обновление баланса: user_id={user_id}, ticker={ticker}, delta_amount={delta_amount}, delta_available={delta_available}')
+
+    balance = await apply_delta(session, user_id, ticker, delta_amount, delta_available)
+
+    if balance is None:
+        logger.error(f'Попытка установить отрицательный баланс для {ticker} у пользователя {user_id}: delta_amount={delta_amount}, delta_available={delta_available}')
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f'Negative balance not allowed for {ticker}'
+        )
+
+    logger.debug(f'Баланс для {ticker} у пользователя {user_id} обновлен: amount={balance.amount}, available={balance.available}')
+    return balance
+
+async def reserve_balance(
+    session: AsyncSession,
+    user_id: UUID,
+    ticker: str,
+    qty: int
+) -> int | None:
+    balance = await apply_delta(session, user_id, ticker, 0, -qty)
+    return balance.available if balance is not None else None
+
+async def rebalance_shards(
+    session: AsyncSession,
+    user_id: UUID,
+    ticker: str,
+    shards: int
+) -> bool:
+    balances = list(await session.scalars(
+        select(BalanceModel)
+        .where(BalanceModel.user_id == user_id)
+        .where(BalanceModel.ticker == ticker)
+        .order_by(BalanceModel.shard)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    ))
+    if not balances or (shards == 1 and len(balances) == 1):
+        return False
+
+    by_shard = {balance.shard: balance for balance in balances}
+    for shard in range(shards):
+        if shard not in by_shard:
+            by_shard[shard] = BalanceModel(user_id=user_id, ticker=ticker, shard=shard, amount=0, available=0)
+            session.add(by_shard[shard])
+
+    # Резерв под открытые ордера остается в своем шарде, свободные средства
+    # делятся поровну; шарды сверх заданного числа сливаются в нулевой
+    total_available = sum(balance.available for balance in by_shard.values())
+    extra_reserved = 0
+    for shard, balance in list(by_shard.items()):
+        if shard >= shards:
+            extra_reserved += balance.amount - balance.available
+            await session.delete(balance)
+            del by_shard[shard]
+
+    share, remainder = divmod(total_available, shards)
+    for shard, balance in by_shard.items():
+        reserved = balance.amount - balance.available
+        balance.available = share + (1 if shard < remainder else 0)
+        balance.amount = reserved + balance.available
+    by_shard[0].amount += extra_reserved
+
+    await session.flush()
+    logger.info(f'[REBALANCE] Баланс {ticker} пользователя {user_id} распределен по {shards} шардам: available={total_available}')
+    return True
+
+async def rebalance_loop(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with admin_engine.connect() as connection:
+                # Проход выполняет один процесс на кластер: сессионная
+                # advisory-блокировка держится на этом соединении до конца
+                # прохода, остальные воркеры его пропускают
+                locked = await connection.scalar(select(func.pg_try_advisory_lock(func.hashtext('balance_rebalance'))))
+                await connection.commit()
+                if not locked:
+                    continue
+                try:
+                    async with AsyncSession(bind=connection, expire_on_commit=False) as session:
+                        # Только шардированные счета и только балансы, у
+                        # которых число шардов не совпадает с настройкой или
+                        # свободные средства разошлись больше, чем дает
+                        # деление с остатком. Смену числа шардов на 1
+                        # применяет сама админская ручка
+                        targets = (await session.execute(
+                            select(BalanceModel.user_id, BalanceModel.ticker, UserModel.balance_shards)
+                            .join(UserModel, UserModel.id == BalanceModel.user_id)
+                            .where(UserModel.balance_shards > 1)
+                            .group_by(BalanceModel.user_id, BalanceModel.ticker, UserModel.balance_shards)
+                            .having(or_(
+                                func.count() != UserModel.balance_shards,
+                                func.max(BalanceModel.available) - func.min(BalanceModel.available) > 1
+                            ))
+                        )).all()
+                        await session.commit()
+                        for user_id, ticker, shards in targets:
+                            await rebalance_shards(session, user_id, ticker, shards)
+                            await session.commit()
+                finally:
+                    await connection.scalar(select(func.pg_advisory_unlock(func.hashtext('balance_rebalance'))))
+                    await connection.commit()
+        except Exception as e:
+            logger.error(f'[REBALANCE] Ошибка при перераспределении шардов: {str(e)}', exc_info=True)
@@ -1,13 +1,20 @@
 from typing import Annotated
+from contextlib import asynccontextmanager
+import asyncio
 import os
+import random
 
 from dotenv import load_dotenv
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.orm.exc import StaleDataError
 from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-from fastapi import Depends
+from fastapi import Depends, HTTPException, status
 from src.logger import logger
+from src.monitoring.metrics import TX_RETRIES, REPLICA_LAG, POOL_WAIT, POOL_TIMEOUTS, track_pool
 
 
 load_dotenv()
@@ -15,31 +22,112 @@ DATABASE_URL = os.getenv('DATABASE_URL')
 if not DATABASE_URL:
     raise RuntimeError('DATABASE_URL not set')
 
+DB_RETRY_ATTEMPTS = int(os.getenv('DB_RETRY_ATTEMPTS', '3'))
+DB_RETRY_BACKOFF = float(os.getenv('DB_RETRY_BACKOFF', '0.01'))
+DB_LOCK_TIMEOUT_MS = int(os.getenv('DB_LOCK_TIMEOUT_MS', '2000'))
+
+# Кэш скомпилированных SQLAlchemy-выражений и кэш prepared statements
+# asyncpg на каждое соединение: горячие запросы не компилируются и не
+# планируются сервером заново
+DB_COMPILED_CACHE_SIZE = int(os.getenv('DB_COMPILED_CACHE_SIZE', '1000'))
+DB_PREPARED_STATEMENT_CACHE_SIZE = int(os.getenv('DB_PREPARED_STATEMENT_CACHE_SIZE', '500'))
+
+READ_DATABASE_URL = os.getenv('READ_DATABASE_URL')
+READ_REPLICA_MAX_LAG = float(os.getenv('READ_REPLICA_MAX_LAG', '5'))
+READ_REPLICA_LAG_INTERVAL = float(os.getenv('READ_REPLICA_LAG_INTERVAL', '5'))
+
 if DATABASE_URL.startswith('postgresql://'):
     DATABASE_URL = DATABASE_URL.replace('postgresql://', 'postgresql+asyncpg://', 1)
+if READ_DATABASE_URL and READ_DATABASE_URL.startswith('postgresql://'):
+    READ_DATABASE_URL = READ_DATABASE_URL.replace('postgresql://', 'postgresql+asyncpg://', 1)
+
+# Отдельные пулы под классы нагрузки: всплеск чтений стакана или админские
+# операции не должны забирать соединения у выставления ордеров. Размеры
+# задаются через DB_POOL_<NAME>_SIZE / _OVERFLOW / _TIMEOUT
+POOL_DEFAULTS = {
+    'trading': (5, 10, 10),
+    'market_data': (3, 5, 5),
+    'replica': (3, 5, 5),
+    'admin': (1, 2, 10)
+}
+
+def pool_limits(name: str) -> tuple[int, int, float]:
+    size, overflow, timeout = POOL_DEFAULTS[name]
+    prefix = f'DB_POOL_{name.upper()}'
+    return (
+        int(os.getenv(f'{prefix}_SIZE', size)),
+        int(os.getenv(f'{prefix}_OVERFLOW', overflow)),
+        float(os.getenv(f'{prefix}_TIMEOUT', timeout))
+    )
+
+def create_pool_engine(url: str, name: str):
+    size, overflow, timeout = pool_limits(name)
+    pool_engine = create_async_engine(
+        url,
+        echo=True,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=size,
+        max_overflow=overflow,
+        pool_timeout=timeout,
+        pool_recycle=1800,
+        pool_pre_ping=True,
+        isolation_level='READ COMMITTED',
+        query_cache_size=DB_COMPILED_CACHE_SIZE,
+        connect_args={'prepared_statement_cache_size': DB_PREPARED_STATEMENT_CACHE_SIZE}
+    )
+    track_pool(pool_engine, name)
+    return pool_engine
+
+def create_sessionmaker(pool_engine):
+    return async_sessionmaker(
+        pool_engine,
+        class_=AsyncSession,
+        expire_on_commit=False,
+        autocommit=False,
+        autoflush=False
+    )
+
+def create_read_sessionmaker(pool_engine):
+    # Чтения идут в режиме AUTOCOMMIT через тот же пул: без BEGIN/COMMIT
+    # каждый SELECT — один round trip, соединение не держит транзакцию
+    return create_sessionmaker(pool_engine.execution_options(isolation_level='AUTOCOMMIT'))
+
+engine = create_pool_engine(DATABASE_URL, 'trading')
+async_session = create_sessionmaker(engine)
+trading_read_session = create_read_sessionmaker(engine)
+
+admin_engine = create_pool_engine(DATABASE_URL, 'admin')
+admin_session = create_sessionmaker(admin_engine)
 
-engine = create_async_engine(
-    DATABASE_URL,
-    echo=True,
-    poolclass=AsyncAdaptedQueuePool,
-    pool_size=5,
-    max_overflow=10,
-    pool_timeout=30,
-    pool_recycle=1800,
-    pool_pre_ping=True,
-    isolation_level='READ COMMITTED'
-)
-
-async_session = async_sessionmaker(
-    engine,
-    class_=AsyncSession,
-    expire_on_commit=False,
-    autocommit=False,
-    autoflush=False
-)
+# Публичные market-data запросы идут в реплику, если она задана; без
+# READ_DATABASE_URL или при отставании реплики — в свой пул на основной базе
+market_data_engine = create_pool_engine(DATABASE_URL, 'market_data')
+market_data_session = create_read_sessionmaker(market_data_engine)
+if READ_DATABASE_URL:
+    read_engine = create_pool_engine(READ_DATABASE_URL, 'replica')
+    read_session = create_read_sessionmaker(read_engine)
+else:
+    read_engine = market_data_engine
+    read_session = market_data_session
+
+async def acquire_connection(session: AsyncSession, pool: str):
+    # Соединение берется сразу, чтобы ожидание пула было видно в метриках,
+    # а исчерпанный пул давал 503 вместо зависшего запроса
+    try:
+        with POOL_WAIT.labels(pool).time():
+            await session.connection()
+    except PoolTimeoutError:
+        POOL_TIMEOUTS.labels(pool).inc()
+        logger.warning(f'[POOL] Нет свободных соединений в пуле {pool}')
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Database is busy, please retry',
+            headers={'Retry-After': '1'}
+        )
 
 async def get_session():
     async with async_session() as session:
+        await acquire_connection(session, 'trading')
         try:
             yield session
             await session.commit()
@@ -50,5 +138,107 @@ async def get_session():
 
 SessionDep = Annotated[AsyncSession, Depends(get_session)]
 
+async def get_admin_session():
+    async with admin_session() as session:
+        await acquire_connection(session, 'admin')
+        try:
+            yield session
+            await session.commit()
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"Ошибка в транзакции: {str(e)}", exc_info=True)
+            raise
+
+AdminSessionDep = Annotated[AsyncSession, Depends(get_admin_session)]
+
+replica_lag = 0.0
+
+@asynccontextmanager
+async def open_read_session():
+    # Отстающая реплика отдала бы слишком старые данные — читаем с основной базы
+    if replica_lag <= READ_REPLICA_MAX_LAG:
+        sessionmaker, pool = read_session, 'replica' if READ_DATABASE_URL else 'market_data'
+    else:
+        sessionmaker, pool = market_data_session, 'market_data'
+    async with sessionmaker() as session:
+        await acquire_connection(session, pool)
+        session.info['pool'] = pool
+        yield session
+
+async def get_read_session():
+    async with open_read_session() as session:
+        yield session
+
+ReadSessionDep = Annotated[AsyncSession, Depends(get_read_session)]
+
+# Чтение собственных ордеров и балансов пользователя: основная база и
+# торговый пул, но без транзакции
+async def get_trading_read_session():
+    async with trading_read_session() as session:
+        await acquire_connection(session, 'trading')
+        yield session
+
+TradingReadSessionDep = Annotated[AsyncSession, Depends(get_trading_read_session)]
+
+async def replica_lag_loop(interval: float):
+    global replica_lag
+    while True:
+        try:
+            async with read_session() as session:
+                lag = await session.scalar(text(
+                    "SELECT CASE "
+                    "WHEN NOT pg_is_in_recovery() THEN 0 "
+                    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+                ))
+            replica_lag = float(lag)
+            REPLICA_LAG.set(replica_lag)
+            if replica_lag > READ_REPLICA_MAX_LAG:
+                logger.warning(f'[REPLICA] Отставание реплики {replica_lag:.1f}с превышает {READ_REPLICA_MAX_LAG}с, чтение переключено на основную базу')
+        except Exception as e:
+            logger.error(f'[REPLICA] Ошибка при проверке отставания реплики: {str(e)}', exc_info=True)
+        await asyncio.sleep(interval)
+
+# deadlock_detected, serialization_failure, lock_not_available (lock_timeout)
+RETRYABLE_SQLSTATES = {'40P01', '40001', '55P03'}
+
+def get_sqlstate(error: Exception) -> str | None:
+    if not isinstance(error, DBAPIError):
+        return None
+    return getattr(error.orig, 'sqlstate', None) or getattr(error.orig.__cause__, 'sqlstate', None)
+
+def is_retryable_error(error: Exception) -> bool:
+    return isinstance(error, StaleDataError) or get_sqlstate(error) in RETRYABLE_SQLSTATES
+
+async def run_transaction(session: AsyncSession, operation, name: str, attempts: int = DB_RETRY_ATTEMPTS):
+    # Выполняет операцию в транзакции с lock_timeout и повторяет ее при
+    # конфликте версий, дедлоке, ошибке сериализации или таймауте блокировки;
+    # операция сама делает commit, чтобы конфликт проявился внутри цикла
+    reason = None
+    for attempt in range(1, attempts + 1):
+        try:
+            await session.execute(text(f"SET LOCAL lock_timeout = '{DB_LOCK_TIMEOUT_MS}ms'"))
+            return await operation()
+        except Exception as e:
+            if not is_retryable_error(e):
+                raise
+            reason = 'stale_data' if isinstance(e, StaleDataError) else get_sqlstate(e)
+            await session.rollback()
+            TX_RETRIES.labels(name, reason).inc()
+            logger.warning(f'[{name}] Конфликт транзакции ({reason}), попытка {attempt}/{attempts}: {str(e)}')
+            if attempt < attempts:
+                await asyncio.sleep(random.uniform(0, DB_RETRY_BACKOFF * 2 ** attempt))
+
+    if reason == '55P03':
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Resource is busy, please retry',
+            headers={'Retry-After': '1'}
+        )
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail='Concurrent update, please retry'
+    )
+
 class Base(DeclarativeBase):
     pass
\ No newline at end of file
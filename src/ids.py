@@ -0,0 +1,36 @@
+import os
+import threading
+import time
+from uuid import UUID
+
+
+# UUIDv7 (RFC 9562): 48 бит unix-времени в миллисекундах, затем 12-битный
+# счетчик внутри миллисекунды и 62 случайных бита. Новые ключи растут со
+# временем и ложатся в правый край B-tree индекса вместо случайных страниц.
+# Старые uuid4-ключи остаются как есть: колонка та же, переписывать их не нужно
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+def uuid7() -> UUID:
+    global _last_ms, _counter
+    with _lock:
+        now_ms = time.time_ns() // 1_000_000
+        if now_ms > _last_ms:
+            _last_ms = now_ms
+            _counter = int.from_bytes(os.urandom(2), 'big') & 0x7FF
+        else:
+            # Монотонность внутри процесса: в той же миллисекунде (или при
+            # откате часов) увеличиваем счетчик, при переполнении — время
+            _counter += 1
+            if _counter > 0xFFF:
+                _last_ms += 1
+                _counter = 0
+        timestamp_ms, counter = _last_ms, _counter
+
+    value = (timestamp_ms & 0xFFFFFFFFFFFF) << 80
+    value |= 0x7 << 76
+    value |= counter << 64
+    value |= 0b10 << 62
+    value |= int.from_bytes(os.urandom(8), 'big') & 0x3FFFFFFFFFFFFFFF
+    return UUID(int=value)
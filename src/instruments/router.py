@@ -1,28 +1,43 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, status
 from sqlalchemy import select
 
-from src.database import SessionDep
+from src.database import AdminSessionDep, open_read_session
 from src.schemas import OkResponseSchema
 from src.users.dependencies import get_current_admin
+from src.admission.dependencies import rate_limit
 from src.instruments.models import InstrumentModel
 from src.instruments.schemas import InstrumentCreateSchema
+from src.orders.snapshots import book_snapshots, INSTRUMENTS_KEY
 from src.logger import logger
+from src.responses import dump_json, body_etag, conditional_response
+from src.singleflight import single_flight
 
 
 instrument_router = APIRouter()
 
-@instrument_router.get('/api/v1/public/instrument', response_model=list[InstrumentCreateSchema], tags=['public'])
+async def load_instruments_json() -> bytes:
+    async with open_read_session() as session:
+        instruments = (await session.execute(
+            select(InstrumentModel.name, InstrumentModel.ticker).order_by(InstrumentModel.ticker)
+        )).all()
+    logger.info(f'[GET /api/v1/public/instrument] Получено инструментов: {len(instruments)}')
+    return dump_json([{'name': name, 'ticker': ticker} for name, ticker in instruments])
+
+@instrument_router.get('/api/v1/public/instrument', response_model=list[InstrumentCreateSchema], dependencies=[Depends(rate_limit('public'))], tags=['public'])
 async def get_instruments_list(
-    session: SessionDep
+    if_none_match: Optional[str] = Header(None)
 ):
     try:
         logger.info(f'[GET /api/v1/public/instrument] Начало запроса списка инструментов')
-        result = await session.execute(select(InstrumentModel))
-        instruments = result.scalars().all()
-        logger.info(f'[GET /api/v1/public/instrument] Получено инструментов: {len(instruments)}')
-        for instrument in instruments:
-            logger.info(f'[GET /api/v1/public/instrument] Инструмент: ticker={instrument.ticker}, name={instrument.name}, created_by={instrument.user_id}')
-        return instruments
+        # Версия реестра инструментов — версия его слота в сегменте снимков
+        snapshot = book_snapshots.read(INSTRUMENTS_KEY)
+        if snapshot is not None:
+            return conditional_response(snapshot.book, f'"i{snapshot.version:x}"', if_none_match)
+
+        content = await single_flight.do('instruments', 'instruments', load_instruments_json)
+        return conditional_response(content, body_etag(content), if_none_match)
     except Exception as e:
         logger.error(f'[GET /api/v1/public/instrument] Ошибка при получении списка инструментов: {str(e)}', exc_info=True)
         raise
@@ -30,7 +45,7 @@ async def get_instruments_list(
 @instrument_router.post('/api/v1/admin/instrument', response_model=OkResponseSchema, tags=['admin'])
 async def create_instrument(
     user_data: InstrumentCreateSchema,
-    session: SessionDep,
+    session: AdminSessionDep,
     admin_user = Depends(get_current_admin)
 ):
     try:
@@ -56,6 +71,7 @@ async def create_instrument(
         
         session.add(new_instrument)
         await session.commit()
+        book_snapshots.mark_dirty(INSTRUMENTS_KEY)
         logger.info(f'[POST /api/v1/admin/instrument] Успешно создан новый инструмент: ticker={new_instrument.ticker}, name={new_instrument.name}, created_by={admin_user.id}')
         return {'success': True}
     except Exception as e:
@@ -64,7 +80,7 @@ async def create_instrument(
 
 @instrument_router.delete('/api/v1/admin/instrument/{ticker}', response_model=OkResponseSchema, tags=['admin'])
 async def delete_instrument(
-    session: SessionDep,
+    session: AdminSessionDep,
     ticker: str,
     admin_user = Depends(get_current_admin)
 ):
@@ -86,6 +102,7 @@ async def delete_instrument(
         logger.info(f'[DELETE /api/v1/admin/instrument/{ticker}] Найден инструмент для удаления: ticker={instrument.ticker}, name={instrument.name}, created_by={instrument.user_id}')
         await session.delete(instrument)
         await session.commit()
+        book_snapshots.mark_dirty(INSTRUMENTS_KEY)
         logger.info(f'[DELETE /api/v1/admin/instrument/{ticker}] Успешно удален инструмент: ticker={ticker}, admin_id={admin_user.id}')
         return {'success': True}
     except Exception as e:
@@ -1,16 +1,63 @@
+import asyncio
+from contextlib import asynccontextmanager
+from time import perf_counter
+
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 
 from src.logger import logger
+from src.monitoring.metrics import REQUEST_LATENCY
+from src.monitoring.router import monitoring_router
+from src.monitoring.profiler import should_profile, profile_request
 from src.users.router import auth_router
 from src.instruments.router import instrument_router
-from src.orders.router import order_router
+from src.orders.router import order_router, handle_forwarded_order, match_queued_order
 from src.balance.router import balance_router
 from src.transactions.router import transaction_router
+from src.balance.utils import BALANCE_REBALANCE_INTERVAL, rebalance_loop
+from src.database import READ_DATABASE_URL, READ_REPLICA_LAG_INTERVAL, replica_lag_loop
+from src.affinity.ring import ticker_ring, AFFINITY_REFRESH_INTERVAL
+from src.affinity.ipc import serve
+from src.affinity.leases import lease_manager, LEASE_HEARTBEAT_INTERVAL
+from src.orders.snapshots import book_snapshots, SNAPSHOT_REFRESH_INTERVAL
+from src.orders.queue import order_queue
+from src.transactions.stats import ticker_stats
+
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tasks = [asyncio.create_task(ticker_stats.warm_up())]
+    if BALANCE_REBALANCE_INTERVAL > 0:
+        tasks.append(asyncio.create_task(rebalance_loop(BALANCE_REBALANCE_INTERVAL)))
+    if READ_DATABASE_URL and READ_REPLICA_LAG_INTERVAL > 0:
+        tasks.append(asyncio.create_task(replica_lag_loop(READ_REPLICA_LAG_INTERVAL)))
+    if ticker_ring.enabled:
+        ticker_ring.start()
+        tasks.append(asyncio.create_task(serve(ticker_ring.socket_path, handle_forwarded_order)))
+        tasks.append(asyncio.create_task(ticker_ring.refresh_loop(AFFINITY_REFRESH_INTERVAL)))
+    if book_snapshots.enabled:
+        book_snapshots.attach()
+        tasks.append(asyncio.create_task(book_snapshots.run(SNAPSHOT_REFRESH_INTERVAL)))
+    if lease_manager.enabled:
+        lease_manager.start()
+        tasks.append(asyncio.create_task(lease_manager.run(LEASE_HEARTBEAT_INTERVAL)))
+    if order_queue.enabled:
+        tasks.append(asyncio.create_task(order_queue.run(match_queued_order)))
+    yield
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    if lease_manager.enabled:
+        try:
+            await lease_manager.close()
+        except Exception as e:
+            logger.error(f'[LEASE] Ошибка при освобождении аренд: {str(e)}', exc_info=True)
+    if order_queue.enabled:
+        await order_queue.close()
 
 app = FastAPI(
     title='Trading API',
+    lifespan=lifespan,
     openapi_tags=[
         {
             'name': 'public',
@@ -30,6 +77,12 @@ app = FastAPI(
     ]
 )
 
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    if await should_profile(request):
+        return await profile_request(request, call_next)
+    return await call_next(request)
+
 @app.middleware("http")
 async def log_errors(request: Request, call_next):
     try:
@@ -41,8 +94,21 @@ async def log_errors(request: Request, call_next):
             content={"detail": "Internal server error"}
         )
 
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    started = perf_counter()
+    response = await call_next(request)
+    route = request.scope.get('route')
+    REQUEST_LATENCY.labels(
+        request.method,
+        route.path if route else 'unmatched',
+        response.status_code
+    ).observe(perf_counter() - started)
+    return response
+
 app.include_router(auth_router)
 app.include_router(instrument_router)
 app.include_router(order_router)
 app.include_router(balance_router)
-app.include_router(transaction_router)
\ No newline at end of file
+app.include_router(transaction_router)
+app.include_router(monitoring_router)
\ No newline at end of file
@@ -0,0 +1,158 @@
+import os
+
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+
+
+# При запуске под gunicorn значения пишутся в файлы PROMETHEUS_MULTIPROC_DIR
+# и агрегируются по всем воркерам в момент сбора
+MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds',
+    'Latency of HTTP requests by route',
+    ['method', 'route', 'status']
+)
+
+MATCH_DURATION = Histogram(
+    'match_orders_duration_seconds',
+    'Duration of match_orders calls',
+    ['ticker']
+)
+
+MATCH_FILLS = Histogram(
+    'match_orders_fills',
+    'Number of fills produced by a single match_orders call',
+    ['ticker'],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100)
+)
+
+MATCH_SKIPPED = Counter(
+    'match_orders_skipped_total',
+    'Limit orders that rested without a matching query thanks to the top-of-book cache',
+    ['ticker']
+)
+
+ORDERS_ACCEPTED = Counter(
+    'orders_accepted_total',
+    'Orders accepted by POST /api/v1/order',
+    ['ticker', 'direction', 'type']
+)
+
+ORDERS_FORWARDED = Counter(
+    'orders_forwarded_total',
+    'Orders forwarded to the worker that owns the ticker',
+    ['result']
+)
+
+ORDERS_REJECTED = Counter(
+    'orders_rejected_total',
+    'Orders rejected by POST /api/v1/order',
+    ['reason']
+)
+
+ORDER_QUEUE_DELAY = Histogram(
+    'order_queue_delay_seconds',
+    'Time between accepting an asynchronous order and matching it',
+    ['ticker'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+
+ADMISSION_REJECTED = Counter(
+    'admission_rejected_total',
+    'Requests shed by the rate limiter or the priority gate',
+    ['route', 'reason']
+)
+
+ADMISSION_WAIT = Histogram(
+    'admission_wait_seconds',
+    'Time trading requests spent waiting for a slot in the priority gate',
+    ['priority'],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2)
+)
+
+SINGLE_FLIGHT_CALLS = Counter(
+    'single_flight_calls_total',
+    'Public reads that ran a query (leader) or reused a concurrent one (shared)',
+    ['name', 'result']
+)
+
+POOL_CHECKED_OUT = Gauge(
+    'db_pool_checked_out',
+    'Connections currently checked out from the pool',
+    ['pool'],
+    multiprocess_mode='livesum'
+)
+
+POOL_OVERFLOW = Gauge(
+    'db_pool_overflow',
+    'Overflow connections currently opened by the pool',
+    ['pool'],
+    multiprocess_mode='livesum'
+)
+
+POOL_WAIT = Histogram(
+    'db_pool_wait_seconds',
+    'Time spent waiting for a connection from the pool',
+    ['pool'],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)
+)
+
+POOL_TIMEOUTS = Counter(
+    'db_pool_timeouts_total',
+    'Requests rejected because the pool had no free connection',
+    ['pool']
+)
+
+REPLICA_LAG = Gauge(
+    'db_replica_lag_seconds',
+    'Replication lag of the read replica',
+    multiprocess_mode='mostrecent'
+)
+
+ORDER_BOOK_DEPTH = Gauge(
+    'order_book_depth_levels',
+    'Number of price levels in the order book',
+    ['ticker', 'side'],
+    multiprocess_mode='mostrecent'
+)
+
+TX_RETRIES = Counter(
+    'db_transaction_retries_total',
+    'Transactions retried after a version conflict, deadlock, serialization failure or lock timeout',
+    ['operation', 'reason']
+)
+
+LOCK_WAIT = Histogram(
+    'db_lock_wait_seconds',
+    'Time spent in statements that acquire row locks',
+    ['operation']
+)
+
+
+def track_pool(engine, name: str):
+    pool = engine.sync_engine.pool
+
+    def update_pool_gauges(*args):
+        POOL_CHECKED_OUT.labels(name).set(pool.checkedout())
+        POOL_OVERFLOW.labels(name).set(max(pool.overflow(), 0))
+
+    event.listen(engine.sync_engine, 'checkout', update_pool_gauges)
+    event.listen(engine.sync_engine, 'checkin', update_pool_gauges)
+
+def render_metrics() -> tuple[bytes, str]:
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,104 @@
+import cProfile
+import os
+import random
+import re
+from datetime import datetime, timezone
+from time import perf_counter
+
+from fastapi import Request
+from sqlalchemy import select
+
+from src.database import admin_session
+from src.users.models import UserModel, RoleEnum
+from src.admission.limiter import rate_limiter
+from src.admission.dependencies import client_address
+from src.logger import logger
+
+
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'profiles'))
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', '100'))
+PROFILE_HEADER = 'X-Profile'
+PROFILE_NAME_PATTERN = re.compile(r'^[\w.-]+\.prof$')
+# Формат ключа из generate_api_key: token_urlsafe(32)
+PROFILE_TOKEN_PATTERN = re.compile(r'^TOKEN [\w-]{43}$')
+
+# cProfile снимает профиль со всего потока, поэтому в цикле событий
+# одновременно профилируется только один запрос; в профиль попадают
+# и чужие корутины, исполнявшиеся в это время
+_active = False
+
+
+async def _is_admin_token(authorization: str | None) -> bool:
+    if authorization is None or not PROFILE_TOKEN_PATTERN.match(authorization):
+        return False
+    async with admin_session() as session:
+        role = await session.scalar(
+            select(UserModel.role)
+            .where(UserModel.api_key == authorization[len('TOKEN '):])
+        )
+    return role == RoleEnum.ADMIN
+
+async def should_profile(request: Request) -> bool:
+    if _active:
+        return False
+    if PROFILE_HEADER in request.headers:
+        # Проверка токена идет до гейта и лимитов ручек и берет соединение
+        # из маленького админского пула — отдельный лимит на адрес не дает
+        # заголовком профилирования занять этот пул
+        if rate_limiter.check('profile', client_address(request)):
+            return False
+        return await _is_admin_token(request.headers.get('Authorization'))
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+def _profile_name(request: Request, elapsed: float) -> str:
+    path = re.sub(r'[^\w]+', '_', request.url.path).strip('_')
+    started = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')
+    return f'{started}_{request.method}_{path}_{int(elapsed * 1000)}ms_{os.getpid()}.prof'
+
+def _prune_profiles():
+    profiles = sorted(list_profiles(), key=lambda profile: profile['created_at'])
+    for profile in profiles[:max(len(profiles) - PROFILE_MAX_FILES, 0)]:
+        os.remove(os.path.join(PROFILE_DIR, profile['name']))
+
+async def profile_request(request: Request, call_next):
+    global _active
+    _active = True
+    profiler = cProfile.Profile()
+    started = perf_counter()
+    try:
+        profiler.enable()
+        try:
+            return await call_next(request)
+        finally:
+            profiler.disable()
+    finally:
+        _active = False
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            name = _profile_name(request, perf_counter() - started)
+            profiler.dump_stats(os.path.join(PROFILE_DIR, name))
+            _prune_profiles()
+            logger.info(f'[PROFILE] {request.method} {request.url.path}: профиль сохранен в {name}')
+        except OSError as e:
+            logger.error(f'[PROFILE] Не удалось сохранить профиль: {str(e)}')
+
+def list_profiles() -> list[dict]:
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for entry in os.scandir(PROFILE_DIR):
+        if entry.is_file() and PROFILE_NAME_PATTERN.match(entry.name):
+            stat = entry.stat()
+            profiles.append({
+                'name': entry.name,
+                'size': stat.st_size,
+                'created_at': datetime.fromtimestamp(stat.st_mtime, timezone.utc)
+            })
+    return profiles
+
+def get_profile_path(name: str) -> str | None:
+    if not PROFILE_NAME_PATTERN.match(name):
+        return None
+    path = os.path.join(PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
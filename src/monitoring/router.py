@@ -0,0 +1,40 @@
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from fastapi.responses import FileResponse
+
+from src.monitoring.metrics import render_metrics
+from src.monitoring.profiler import list_profiles, get_profile_path
+from src.monitoring.schemas import ProfileSchema
+from src.users.dependencies import get_current_admin
+from src.users.models import UserModel
+from src.logger import logger
+
+
+monitoring_router = APIRouter()
+
+@monitoring_router.get('/metrics', include_in_schema=False)
+async def get_metrics():
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+@monitoring_router.get('/api/v1/admin/profiles', response_model=list[ProfileSchema], tags=['admin'])
+async def get_profiles_list(
+    current_admin: UserModel = Depends(get_current_admin)
+):
+    profiles = sorted(list_profiles(), key=lambda profile: profile['created_at'], reverse=True)
+    logger.info(f'[GET /api/v1/admin/profiles] Админ {current_admin.id} запросил список профилей: {len(profiles)}')
+    return profiles
+
+@monitoring_router.get('/api/v1/admin/profiles/{name}', tags=['admin'])
+async def download_profile(
+    name: str,
+    current_admin: UserModel = Depends(get_current_admin)
+):
+    path = get_profile_path(name)
+    if path is None:
+        logger.warning(f'[GET /api/v1/admin/profiles/{name}] Профиль не найден')
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='Profile not found'
+        )
+    logger.info(f'[GET /api/v1/admin/profiles/{name}] Админ {current_admin.id} скачивает профиль')
+    return FileResponse(path, media_type='application/octet-stream', filename=name)
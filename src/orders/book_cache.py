@@ -0,0 +1,97 @@
+import os
+from time import monotonic
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.orders.models import OrderModel, DirectionEnum
+from src.orders.utils import best_price_statement
+from src.affinity.ring import ticker_ring, AFFINITY_REFRESH_INTERVAL
+from src.affinity.leases import lease_manager
+from src.affinity.ipc import AFFINITY_FORWARD_TIMEOUT
+
+
+ORDER_BOOK_CACHE = os.getenv('ORDER_BOOK_CACHE', '0') == '1'
+
+
+class TopOfBookCache:
+    # Лучшие цены по тикеру и стороне. Кэш обязан быть консервативным:
+    # лучшая цена в нем может быть «лучше» реальной (тогда просто выполнится
+    # запрос матчинга), но никогда не хуже. Поэтому новые ордера сразу
+    # улучшают цену, а снятие ордера по лучшей цене сбрасывает сторону
+    def __init__(self):
+        self._best = {}
+        self._generation = {}
+        self._epoch = 0
+        self._paused_until = 0
+
+    def is_enabled(self, ticker: str) -> bool:
+        # Ордера других процессов кэш не видит, поэтому он включается только
+        # когда все ордера тикера проходят через этот процесс: либо процесс
+        # один (ORDER_BOOK_CACHE), либо воркер владеет тикером в кольце и,
+        # при нескольких узлах, держит аренду тикера
+        if monotonic() < self._paused_until:
+            return False
+        if ORDER_BOOK_CACHE:
+            return True
+        if lease_manager.enabled and not lease_manager.holds(ticker):
+            return False
+        return ticker_ring.owns(ticker) or (lease_manager.enabled and not ticker_ring.enabled)
+
+    def pause(self, seconds: float):
+        # После смены владельцев прежний владелец еще может дописывать
+        # ордера тикера — кэш сбрасывается и не используется это время
+        self.invalidate()
+        self._paused_until = monotonic() + seconds
+
+    def _bump(self, key):
+        self._generation[key] = self._generation.get(key, 0) + 1
+
+    def on_rest(self, ticker: str, direction: DirectionEnum, price: int):
+        key = (ticker, direction)
+        self._bump(key)
+        if key not in self._best:
+            return
+        best = self._best[key]
+        if best is None:
+            self._best[key] = price
+        elif direction == DirectionEnum.BUY:
+            self._best[key] = max(best, price)
+        else:
+            self._best[key] = min(best, price)
+
+    def on_remove(self, ticker: str, direction: DirectionEnum, price: int):
+        key = (ticker, direction)
+        self._bump(key)
+        if self._best.get(key) == price:
+            del self._best[key]
+
+    def invalidate(self, ticker: str = None):
+        if ticker is None:
+            self._epoch += 1
+        for key in list(self._best):
+            if ticker is None or key[0] == ticker:
+                self._bump(key)
+                del self._best[key]
+
+    async def get_best(self, session: AsyncSession, ticker: str, direction: DirectionEnum) -> int | None:
+        key = (ticker, direction)
+        if key in self._best:
+            return self._best[key]
+        generation = (self._epoch, self._generation.get(key, 0))
+        best = await session.scalar(best_price_statement(ticker, direction))
+        # Пока шел запрос, книга могла измениться — такой результат не кэшируем
+        if (self._epoch, self._generation.get(key, 0)) == generation:
+            self._best[key] = best
+        return best
+
+    async def can_cross(self, session: AsyncSession, order: OrderModel) -> bool:
+        opposite_direction = DirectionEnum.SELL if order.direction == DirectionEnum.BUY else DirectionEnum.BUY
+        best = await self.get_best(session, order.ticker, opposite_direction)
+        if best is None:
+            return False
+        return order.price >= best if order.direction == DirectionEnum.BUY else order.price <= best
+
+
+top_of_book = TopOfBookCache()
+ticker_ring.on_change(lambda: top_of_book.pause(2 * AFFINITY_REFRESH_INTERVAL + AFFINITY_FORWARD_TIMEOUT))
+lease_manager.on_change(top_of_book.invalidate)
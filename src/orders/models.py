@@ -1,12 +1,13 @@
 from enum import Enum as PyEnum
-from uuid import uuid4, UUID
+from uuid import UUID
 from datetime import datetime, timezone
 
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import Enum, String, Integer, ForeignKey, DateTime, func, Index
+from sqlalchemy import Enum, String, Integer, BigInteger, ForeignKey, DateTime, func, Index, text
 from sqlalchemy.dialects.postgresql import UUID as PGUUID
 
 from src.database import Base
+from src.ids import uuid7
 
 
 class DirectionEnum(PyEnum):
@@ -18,6 +19,7 @@ class StatusEnum(PyEnum):
     EXECUTED = 'EXECUTED'
     PARTIALLY_EXECUTED = 'PARTIALLY_EXECUTED'
     CANCELLED = 'CANCELLED'
+    PENDING = 'PENDING'
 
 class OrderModel(Base):
     __tablename__ = 'orders'
@@ -25,7 +27,7 @@ class OrderModel(Base):
     id: Mapped[UUID] = mapped_column(
         PGUUID,
         primary_key=True,
-        default=uuid4,
+        default=uuid7,
         nullable=False
     )
 
@@ -76,7 +78,69 @@ class OrderModel(Base):
         nullable=False
     )
 
+    version: Mapped[int] = mapped_column(
+        Integer,
+        nullable=False,
+        server_default='1'
+    )
+
+    # Порядковый номер приема ордера; очередь асинхронных ордеров
+    # исполняется по тикеру строго в порядке seq. Синхронные ордера
+    # очередь не ждут, относительно них seq порядка не задает
+    seq: Mapped[int] = mapped_column(
+        BigInteger,
+        nullable=False,
+        server_default=text("nextval('order_seq')")
+    )
+
     __table_args__ = (
         Index('index_orders_ticker_direction_status', 'ticker', 'direction', 'status'),
         Index('index_orders_price_timestamp', 'price', 'timestamp'),
-    )
\ No newline at end of file
+        Index('index_orders_pending_ticker_seq', 'ticker', 'seq', postgresql_where=text("status = 'PENDING'")),
+    )
+
+    __mapper_args__ = {
+        'version_id_col': version
+    }
+
+class PriceLevelModel(Base):
+    __tablename__ = 'price_levels'
+
+    id: Mapped[UUID] = mapped_column(
+        PGUUID,
+        primary_key=True,
+        default=uuid7,
+        nullable=False
+    )
+
+    ticker: Mapped[str] = mapped_column(
+        String(10),
+        ForeignKey('instruments.ticker', ondelete='CASCADE'),
+        nullable=False
+    )
+
+    side: Mapped[DirectionEnum] = mapped_column(
+        Enum(DirectionEnum),
+        nullable=False
+    )
+
+    price: Mapped[int] = mapped_column(
+        Integer,
+        nullable=False
+    )
+
+    qty: Mapped[int] = mapped_column(
+        Integer,
+        nullable=False,
+        default=0
+    )
+
+    order_count: Mapped[int] = mapped_column(
+        Integer,
+        nullable=False,
+        default=0
+    )
+
+    __table_args__ = (
+        Index('idx_price_levels_ticker_side_price', 'ticker', 'side', 'price', unique=True),
+    )
@@ -0,0 +1,134 @@
+import asyncio
+import os
+from time import monotonic
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from src.database import DATABASE_URL, market_data_session
+from src.orders.models import OrderModel, StatusEnum
+from src.affinity.ring import ticker_ring
+from src.affinity.leases import lease_manager
+from src.admission.gate import trading_gate, Priority, OverloadedError, ADMISSION_GATE
+from src.logger import logger
+
+
+ASYNC_ORDERS = os.getenv('ASYNC_ORDERS', '0') == '1'
+ORDER_QUEUE_CHANNEL = 'order_queue'
+# Основной сигнал — NOTIFY после коммита ордера; опрос таблицы только
+# страхует от потерянных уведомлений
+ORDER_QUEUE_FALLBACK_INTERVAL = float(os.getenv('ORDER_QUEUE_FALLBACK_INTERVAL', '5'))
+ORDER_QUEUE_BATCH = int(os.getenv('ORDER_QUEUE_BATCH', '100'))
+
+
+class OrderQueue:
+    # Ордера, принятые с Prefer: respond-async, лежат в таблице orders со
+    # статусом PENDING — это и есть durable-очередь. Разбирает ее по тикеру
+    # тот же процесс, что исполняет синхронные ордера тикера: держатель
+    # аренды или владелец в кольце воркеров. Порядок seq внутри тикера
+    # гарантирует advisory-блокировка, которую берет handler.
+    # seq упорядочивает только асинхронные ордера между собой: синхронный
+    # ордер исполняется сразу и может опередить ордера, ждущие в очереди
+    def __init__(self):
+        self.enabled = ASYNC_ORDERS
+        self.wakeup = asyncio.Event()
+        self.ready = set()
+        self.engine = None
+        self.connection = None
+        self.listener = None
+
+    def owns(self, ticker: str) -> bool:
+        if lease_manager.enabled:
+            return lease_manager.holds(ticker)
+        if ticker_ring.enabled:
+            return ticker_ring.owns(ticker)
+        return True
+
+    def notify(self, ticker: str):
+        if self.owns(ticker):
+            self.ready.add(ticker)
+            self.wakeup.set()
+
+    async def _listen(self):
+        # LISTEN на отдельном соединении вне пулов: уведомление о новом
+        # ордере приходит владельцу тикера из любого воркера и узла
+        if self.listener is not None and not self.listener.is_closed():
+            return
+        await self._close_listener()
+        if self.engine is None:
+            self.engine = create_async_engine(DATABASE_URL, poolclass=NullPool, isolation_level='AUTOCOMMIT')
+        self.connection = await self.engine.connect()
+        self.listener = (await self.connection.get_raw_connection()).driver_connection
+        await self.listener.add_listener(ORDER_QUEUE_CHANNEL, lambda connection, pid, channel, ticker: self.notify(ticker))
+        logger.info(f'[ORDER_QUEUE] Подписка на канал {ORDER_QUEUE_CHANNEL}')
+
+    async def _close_listener(self):
+        if self.connection is not None:
+            try:
+                await self.connection.close()
+            except Exception:
+                pass
+        self.connection = None
+        self.listener = None
+
+    async def _pending_tickers(self) -> set[str]:
+        async with market_data_session() as session:
+            return set((await session.scalars(
+                select(OrderModel.ticker)
+                .where(OrderModel.status == StatusEnum.PENDING)
+                .distinct()
+            )).all())
+
+    async def _drain(self, ticker: str, handler):
+        # Каждый ордер очереди проходит через гейт торгового пула наравне
+        # с новыми ордерами из HTTP
+        for _ in range(ORDER_QUEUE_BATCH):
+            if ADMISSION_GATE:
+                try:
+                    await trading_gate.acquire(Priority.ORDER)
+                except OverloadedError:
+                    self.ready.add(ticker)
+                    return
+            try:
+                if not await handler(ticker):
+                    return
+            finally:
+                if ADMISSION_GATE:
+                    trading_gate.release()
+        self.notify(ticker)
+
+    async def run(self, handler):
+        # handler(ticker) исполняет самый ранний ордер тикера в отдельной
+        # транзакции и возвращает False, когда очередь тикера пуста или ее
+        # уже разбирает другой процесс
+        next_scan = 0
+        while True:
+            try:
+                await self._listen()
+            except Exception as e:
+                logger.error(f'[ORDER_QUEUE] Не удалось подписаться на уведомления: {str(e)}')
+                await self._close_listener()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=max(0, next_scan - monotonic()))
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                tickers, self.ready = self.ready, set()
+                if monotonic() >= next_scan:
+                    tickers |= await self._pending_tickers()
+                    next_scan = monotonic() + ORDER_QUEUE_FALLBACK_INTERVAL
+                for ticker in tickers:
+                    if self.owns(ticker):
+                        await self._drain(ticker, handler)
+            except Exception as e:
+                logger.error(f'[ORDER_QUEUE] Ошибка при разборе очереди ордеров: {str(e)}', exc_info=True)
+
+    async def close(self):
+        await self._close_listener()
+        if self.engine is not None:
+            await self.engine.dispose()
+
+
+order_queue = OrderQueue()
@@ -1,134 +1,95 @@
+import asyncio
+from typing import Annotated, Optional
 from uuid import UUID
 from datetime import datetime, timezone
+from time import perf_counter
 
-from fastapi import APIRouter, Depends, HTTPException, status
+import orjson
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query, Request, Response, status
+from pydantic import TypeAdapter
 from sqlalchemy import select, func, update
 from sqlalchemy.orm import selectinload
 
-from src.database import SessionDep
+from src.database import async_session, open_read_session, SessionDep, TradingReadSessionDep, run_transaction, is_retryable_error
 from src.schemas import OkResponseSchema
 from src.orders.models import OrderModel, StatusEnum, DirectionEnum
-from src.orders.schemas import OrderBodySchema, CreateOrderResponseSchema, OrderResponseSchema, LimitOrderSchema, LimitOrderBodySchema, MarketOrderSchema, MarketOrderBodySchema, OrderBookListSchema, OrderLevel
-from src.users.dependencies import get_current_user
+from src.orders.utils import add_level_delta, apply_level_deltas, instrument_statement, matching_orders_statement, load_order_book, load_order_books, parse_tickers, order_reserve, available_liquidity, BATCH_MAX_DEPTH
+from src.orders.snapshots import book_snapshots
+from src.orders.book_cache import top_of_book
+from src.orders.queue import order_queue, ORDER_QUEUE_CHANNEL
+from src.affinity.ring import ticker_ring
+from src.affinity.ipc import forward, proxy, OwnerUnavailableError
+from src.affinity.leases import lease_manager
+from src.orders.schemas import OrderBodySchema, CreateOrderResponseSchema, AcceptedOrderResponseSchema, OrderResponseSchema, LimitOrderSchema, LimitOrderBodySchema, MarketOrderSchema, MarketOrderBodySchema, OrderBookListSchema
+from src.users.dependencies import get_current_user, get_current_reader
+from src.admission.dependencies import admission, rate_limit, acquire_gate, release_admission, readmit
+from src.admission.gate import trading_gate, Priority, ADMISSION_GATE
 from src.users.models import UserModel
-from src.instruments.models import InstrumentModel
-from src.balance.models import BalanceModel
+from src.balance.utils import update_balance, apply_delta, reserve_balance
 from src.transactions.models import TransactionModel
+from src.transactions.stats import ticker_stats
 from src.logger import logger
+from src.responses import FastJSONResponse, dump_json, body_etag, MSGPACK_RESPONSES, conditional_response
+from src.singleflight import single_flight
+from src.monitoring.metrics import MATCH_DURATION, MATCH_FILLS, MATCH_SKIPPED, ORDERS_ACCEPTED, ORDERS_FORWARDED, ORDERS_REJECTED, ORDER_QUEUE_DELAY, LOCK_WAIT
 
 order_router = APIRouter()
+order_body_adapter = TypeAdapter(OrderBodySchema)
 
-async def update_balance(
-    session: SessionDep, 
-    user_id: UUID, 
-    ticker: str, 
-    delta_amount: int,
-    delta_available: int = None
-):
-    logger.debug(f'[UPDATE_BALANCE] Обновление баланса: user_id={user_id}, ticker={ticker}, delta_amount={delta_amount}, delta_available={delta_available}')
-    balance = await session.scalar(
-        select(BalanceModel)
-        .where(BalanceModel.user_id == user_id)
-        .where(BalanceModel.ticker == ticker)
-        .order_by(BalanceModel.user_id, BalanceModel.ticker)
-        .with_for_update()
-    )
-
-    if not balance:
-        logger.info(f'Баланс для {ticker} у пользователя {user_id} не найден, создаем новый')
-        balance = BalanceModel(user_id=user_id, ticker=ticker, amount=0, available=0) 
-        session.add(balance)
-        await session.flush()
-    new_amount = balance.amount + delta_amount
-    new_available = balance.available + (delta_available if delta_available is not None else delta_amount)
-    
-    if new_amount < 0 or new_available < 0:
-        logger.error(f'Попытка установить отрицательный баланс для {ticker} у пользователя {user_id}: amount={new_amount}, available={new_available}')
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f'Negative balance not allowed for {ticker}'
-        )
-    
-    balance.amount = new_amount
-    balance.available = new_available
-    logger.debug(f'Баланс для {ticker} у пользователя {user_id} обновлен: amount={new_amount}, available={new_available}')
-
-@order_router.post('/api/v1/order', response_model=CreateOrderResponseSchema, tags=['order'])
-async def create_order(
+async def place_order(
     session: SessionDep,
-    user_data: OrderBodySchema,
-    current_user: UserModel = Depends(get_current_user)
+    user_id: UUID,
+    user_data: OrderBodySchema
 ):
     try:
-        logger.info(f'[POST /api/v1/order] Начало создания ордера: user_id={current_user.id}, ticker={user_data.ticker}, direction={user_data.direction}, qty={user_data.qty}, price={getattr(user_data, "price", None)}')
+        logger.info(f'[POST /api/v1/order] Начало создания ордера: user_id={user_id}, ticker={user_data.ticker}, direction={user_data.direction}, qty={user_data.qty}, price={getattr(user_data, "price", None)}')
 
-        instrument = await session.scalar(
-            select(InstrumentModel)
-            .where(InstrumentModel.ticker == user_data.ticker)
-        )
+        instrument = await session.scalar(instrument_statement(user_data.ticker))
         if not instrument:
             logger.warning(f'[POST /api/v1/order] Инструмент не найден: ticker={user_data.ticker}')
+            ORDERS_REJECTED.labels('instrument_not_found').inc()
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail='Instrument not found'
             )
         logger.info(f'[POST /api/v1/order] Инструмент найден: ticker={user_data.ticker}')
 
+        if lease_manager.enabled:
+            await lease_manager.fence(session, user_data.ticker)
+
         price = user_data.price if isinstance(user_data, LimitOrderBodySchema) else None
         logger.info(f'[POST /api/v1/order] Тип ордера: {"LIMIT" if price else "MARKET"}, price={price}')
 
-        if user_data.direction == DirectionEnum.BUY:
-            balance = await session.scalar(
-                select(BalanceModel)
-                .where(BalanceModel.user_id == current_user.id)
-                .where(BalanceModel.ticker == 'RUB')
-                .with_for_update()
-            )
-            if not balance or balance.available < user_data.qty * price:
-                logger.warning(f'[POST /api/v1/order] Недостаточно RUB: доступно={balance.available if balance else 0}, требуется={user_data.qty * price}')
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail='Insufficient RUB balance'
-                )
-            balance.available -= user_data.qty * price
-            logger.info(f'[POST /api/v1/order] Зарезервировано RUB: {user_data.qty * price}, новый доступный баланс: {balance.available}')
-        else:
-            balance = await session.scalar(
-                select(BalanceModel)
-                .where(BalanceModel.user_id == current_user.id)
-                .where(BalanceModel.ticker == user_data.ticker)
-                .with_for_update()
-            )
-            if not balance or balance.available < user_data.qty:
-                logger.warning(f'[POST /api/v1/order] Недостаточно {user_data.ticker}: доступно={balance.available if balance else 0}, требуется={user_data.qty}')
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f'Insufficient {user_data.ticker} balance'
-                )
-            balance.available -= user_data.qty
-            logger.info(f'[POST /api/v1/order] Зарезервировано {user_data.ticker}: {user_data.qty}, новый доступный баланс: {balance.available}')
+        reserve_ticker, reserve_qty = order_reserve(user_data.direction, user_data.ticker, user_data.qty, price)
+        logger.info(f'[POST /api/v1/order] Резервирование {reserve_ticker}: {reserve_qty}')
 
         if price is None:
-            opposite_direction = DirectionEnum.SELL if user_data.direction == DirectionEnum.BUY else DirectionEnum.BUY
-            price_condition = True
-            available_qty = await session.scalar(
-                select(func.sum(OrderModel.qty - OrderModel.filled))
-                .where(OrderModel.ticker == user_data.ticker)
-                .where(OrderModel.direction == opposite_direction)
-                .where(OrderModel.status.in_([StatusEnum.NEW, StatusEnum.PARTIALLY_EXECUTED]))
-                .where(price_condition)
-            )
-            available_qty = available_qty or 0
+            available_qty = await available_liquidity(session, user_data.ticker, user_data.direction)
             logger.info(f'[POST /api/v1/order] Доступная ликвидность для рыночного ордера: {available_qty}')
             if available_qty < user_data.qty:
                 logger.warning(f'[POST /api/v1/order] Недостаточная ликвидность: доступно={available_qty}, требуется={user_data.qty}')
+                ORDERS_REJECTED.labels('insufficient_liquidity').inc()
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail='Insufficient liquidity for market order'
                 )
 
+        # Резерв берется до матчинга: ордер, который нечем обеспечить,
+        # отклоняется раньше, чем заблокирует ордера мейкеров и уровни стакана
+        if reserve_qty:
+            with LOCK_WAIT.labels('balance').time():
+                available = await reserve_balance(session, user_id, reserve_ticker, reserve_qty)
+            if available is None:
+                logger.warning(f'[POST /api/v1/order] Недостаточно средств для резерва: user_id={user_id}, ticker={reserve_ticker}, qty={reserve_qty}')
+                ORDERS_REJECTED.labels('insufficient_balance').inc()
+                await session.rollback()
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f'Insufficient {reserve_ticker} balance'
+                )
+
         new_order = OrderModel(
-            user_id=current_user.id,
+            user_id=user_id,
             ticker=user_data.ticker,
             direction=user_data.direction,
             qty=user_data.qty,
@@ -140,19 +101,24 @@ async def create_order(
 
         try:
             await match_orders(session, new_order)
+        except HTTPException as e:
+            logger.warning(f'[POST /api/v1/order] Ордер отклонен при исполнении: {e.detail}')
+            ORDERS_REJECTED.labels('insufficient_balance').inc()
+            await session.rollback()
+            raise
         except Exception as e:
+            if is_retryable_error(e):
+                raise
             logger.error(f'[POST /api/v1/order] Ошибка при исполнении ордера: {str(e)}', exc_info=True)
-            if user_data.direction == DirectionEnum.BUY:
-                balance.available += user_data.qty * price
-            else:
-                balance.available += user_data.qty
-            await session.commit()
+            ORDERS_REJECTED.labels('execution_error').inc()
+            await session.rollback()
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail='Error executing order'
             )
 
         logger.info(f'[POST /api/v1/order] Ордер успешно создан: id={new_order.id}, filled={new_order.filled}, status={new_order.status}')
+        ORDERS_ACCEPTED.labels(new_order.ticker, new_order.direction.value, 'LIMIT' if price else 'MARKET').inc()
         return CreateOrderResponseSchema(
             success=True,
             order_id=new_order.id,
@@ -163,24 +129,308 @@ async def create_order(
     except HTTPException:
         raise
     except Exception as e:
+        if is_retryable_error(e):
+            raise
         logger.error(f'[POST /api/v1/order] Неожиданная ошибка: {str(e)}', exc_info=True)
+        ORDERS_REJECTED.labels('internal_error').inc()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail='Internal server error'
         )
 
-@order_router.delete('/api/v1/order/{order_id}', response_model=OkResponseSchema, tags=['order'])
-async def cancel_order(
+async def enqueue_order(
     session: SessionDep,
-    order_id: UUID,
-    current_user: UserModel = Depends(get_current_user)
+    user_id: UUID,
+    user_data: OrderBodySchema
 ):
-    logger.info(f'[DELETE /api/v1/order/{order_id}] Запрос на отмену ордера: order_id={order_id}, user_id={current_user.id}')
-    
+    logger.info(f'[POST /api/v1/order] Прием ордера в очередь: user_id={user_id}, ticker={user_data.ticker}, direction={user_data.direction}, qty={user_data.qty}, price={getattr(user_data, "price", None)}')
+
+    instrument = await session.scalar(instrument_statement(user_data.ticker))
+    if not instrument:
+        logger.warning(f'[POST /api/v1/order] Инструмент не найден: ticker={user_data.ticker}')
+        ORDERS_REJECTED.labels('instrument_not_found').inc()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Instrument not found'
+        )
+
+    price = user_data.price if isinstance(user_data, LimitOrderBodySchema) else None
+    if price is None and await available_liquidity(session, user_data.ticker, user_data.direction) < user_data.qty:
+        logger.warning(f'[POST /api/v1/order] Недостаточная ликвидность для рыночного ордера: ticker={user_data.ticker}, qty={user_data.qty}')
+        ORDERS_REJECTED.labels('insufficient_liquidity').inc()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Insufficient liquidity for market order'
+        )
+
+    seq = await session.scalar(select(func.nextval('order_seq')))
+    new_order = OrderModel(
+        user_id=user_id,
+        ticker=user_data.ticker,
+        direction=user_data.direction,
+        qty=user_data.qty,
+        price=price,
+        status=StatusEnum.PENDING,
+        seq=seq
+    )
+    session.add(new_order)
+    await session.flush()
+
+    # Резерв списывается при приеме: в очереди не может оказаться ордер,
+    # который нечем обеспечить
+    reserve_ticker, reserve_qty = order_reserve(user_data.direction, user_data.ticker, user_data.qty, price)
+    if reserve_qty:
+        with LOCK_WAIT.labels('balance').time():
+            available = await reserve_balance(session, user_id, reserve_ticker, reserve_qty)
+        if available is None:
+            logger.warning(f'[POST /api/v1/order] Недостаточно средств для резерва: user_id={user_id}, ticker={reserve_ticker}, qty={reserve_qty}')
+            ORDERS_REJECTED.labels('insufficient_balance').inc()
+            await session.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f'Insufficient {reserve_ticker} balance'
+            )
+
+    # Уведомление доставляется слушателям при коммите
+    await session.execute(select(func.pg_notify(ORDER_QUEUE_CHANNEL, new_order.ticker)))
+    await session.commit()
+    order_queue.notify(new_order.ticker)
+    logger.info(f'[POST /api/v1/order] Ордер принят в очередь: id={new_order.id}, seq={seq}')
+    ORDERS_ACCEPTED.labels(new_order.ticker, new_order.direction.value, 'LIMIT' if price else 'MARKET').inc()
+    return {
+        'success': True,
+        'order_id': new_order.id,
+        'seq': seq
+    }
+
+async def reject_queued_order(session: SessionDep, order_id: UUID, reason: str):
     order = await session.scalar(
         select(OrderModel)
         .where(OrderModel.id == order_id)
         .with_for_update()
+        .execution_options(populate_existing=True)
+    )
+    if order is None or order.status != StatusEnum.PENDING:
+        await session.rollback()
+        return
+
+    order.status = StatusEnum.CANCELLED
+    with LOCK_WAIT.labels('orders').time():
+        await session.flush()
+    reserve_ticker, reserve_qty = order_reserve(order.direction, order.ticker, order.qty, order.price)
+    if reserve_qty:
+        await update_balance(session, order.user_id, reserve_ticker, 0, reserve_qty)
+    await session.commit()
+    ORDERS_REJECTED.labels(reason).inc()
+    logger.warning(f'[ORDER_QUEUE] Ордер из очереди отклонен: id={order_id}, reason={reason}')
+
+async def match_next_order(session: SessionDep, ticker: str) -> bool:
+    # Advisory-блокировка тикера держится до коммита: пока один процесс
+    # исполняет голову очереди, другой не возьмет следующий по seq ордер
+    locked = await session.scalar(select(func.pg_try_advisory_xact_lock(func.hashtext(f'order_queue:{ticker}'))))
+    if not locked:
+        await session.rollback()
+        return False
+
+    order = await session.scalar(
+        select(OrderModel)
+        .where(OrderModel.ticker == ticker)
+        .where(OrderModel.status == StatusEnum.PENDING)
+        .order_by(OrderModel.seq)
+        .limit(1)
+        .with_for_update()
+    )
+    if order is None:
+        await session.rollback()
+        return False
+
+    if lease_manager.enabled:
+        await lease_manager.fence(session, ticker)
+    ORDER_QUEUE_DELAY.labels(ticker).observe((datetime.now(timezone.utc) - order.timestamp).total_seconds())
+
+    if order.price is None and await available_liquidity(session, ticker, order.direction) < order.qty:
+        await reject_queued_order(session, order.id, 'insufficient_liquidity')
+        return True
+
+    order_id = order.id
+    try:
+        # Резерв уже списан при приеме ордера; match_orders выставит итоговый статус
+        await match_orders(session, order)
+    except HTTPException as e:
+        logger.warning(f'[ORDER_QUEUE] Ордер отклонен при исполнении: id={order_id}, error={e.detail}')
+        await session.rollback()
+        await reject_queued_order(session, order_id, 'insufficient_balance')
+    except Exception as e:
+        if is_retryable_error(e):
+            raise
+        # Ордер нельзя оставить в голове очереди — он заблокирует тикер
+        logger.error(f'[ORDER_QUEUE] Ошибка при исполнении ордера из очереди: id={order_id}, error={str(e)}', exc_info=True)
+        await session.rollback()
+        await reject_queued_order(session, order_id, 'execution_error')
+    return True
+
+async def match_queued_order(ticker: str) -> bool:
+    async with async_session() as session:
+        try:
+            return await run_transaction(session, lambda: match_next_order(session, ticker), 'match_queued_order')
+        except HTTPException as e:
+            # Повторы исчерпаны — ордер остается в очереди до следующего прохода
+            logger.warning(f'[ORDER_QUEUE] Не удалось исполнить ордер из очереди: ticker={ticker}, error={e.detail}')
+            return False
+
+async def forward_order(owner: str, user_id: UUID, user_data: OrderBodySchema):
+    logger.info(f'[POST /api/v1/order] Ордер пересылается владельцу тикера: ticker={user_data.ticker}, owner={owner}')
+    try:
+        response = await forward(ticker_ring.socket_for(owner), {
+            'user_id': str(user_id),
+            'body': user_data.model_dump(mode='json')
+        })
+    except OwnerUnavailableError as e:
+        logger.warning(f'[POST /api/v1/order] Владелец тикера недоступен, ордер исполняется локально: owner={owner}, error={str(e)}')
+        ORDERS_FORWARDED.labels('unavailable').inc()
+        ticker_ring.exclude(owner)
+        return None
+    except (asyncio.TimeoutError, ConnectionError) as e:
+        # Запрос уже мог быть исполнен владельцем — повторять локально нельзя
+        logger.error(f'[POST /api/v1/order] Нет ответа от владельца тикера: owner={owner}, error={str(e)}')
+        ORDERS_FORWARDED.labels('timeout').inc()
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail='Order routing timed out, check order status before retrying'
+        )
+
+    ORDERS_FORWARDED.labels('ok').inc()
+    if 'result' not in response:
+        raise HTTPException(
+            status_code=response['status_code'],
+            detail=response['detail'],
+            headers=response.get('headers')
+        )
+    return response['result']
+
+async def proxy_order(owner_url: str, authorization: str, user_data: OrderBodySchema):
+    logger.info(f'[POST /api/v1/order] Ордер проксируется узлу-владельцу тикера: ticker={user_data.ticker}, owner={owner_url}')
+    try:
+        response = await proxy(
+            f'{owner_url}/api/v1/order',
+            {'Authorization': authorization, 'X-Forwarded-Order': lease_manager.forwarded_header()},
+            user_data.model_dump(mode='json')
+        )
+    except OwnerUnavailableError as e:
+        logger.warning(f'[POST /api/v1/order] Узел-владелец недоступен, ордер исполняется локально: owner={owner_url}, error={str(e)}')
+        ORDERS_FORWARDED.labels('node_unavailable').inc()
+        return None
+    except (asyncio.TimeoutError, ConnectionError) as e:
+        logger.error(f'[POST /api/v1/order] Нет ответа от узла-владельца: owner={owner_url}, error={str(e)}')
+        ORDERS_FORWARDED.labels('node_timeout').inc()
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail='Order routing timed out, check order status before retrying'
+        )
+
+    ORDERS_FORWARDED.labels('proxied').inc()
+    headers = {'Retry-After': response.headers['Retry-After']} if 'Retry-After' in response.headers else None
+    return Response(
+        content=response.content,
+        status_code=response.status_code,
+        media_type=response.headers.get('content-type'),
+        headers=headers
+    )
+
+async def handle_forwarded_order(message: dict) -> dict:
+    # Исполняется в воркере-владельце; дальше не пересылается, даже если
+    # кольцо уже успело измениться
+    # Пересланный ордер проходит гейт владельца наравне с его собственными:
+    # иначе владелец исполняет больше ордеров, чем выдерживает торговый пул
+    admitted = False
+    try:
+        user_data = order_body_adapter.validate_python(message['body'])
+        if ADMISSION_GATE:
+            await acquire_gate('order_create', Priority.ORDER)
+            admitted = True
+        async with async_session() as session:
+            result = await run_transaction(
+                session,
+                lambda: place_order(session, UUID(message['user_id']), user_data),
+                'create_order'
+            )
+        return {'result': result.model_dump(mode='json')}
+    except HTTPException as e:
+        return {'status_code': e.status_code, 'detail': e.detail, 'headers': e.headers}
+    except Exception as e:
+        logger.error(f'[POST /api/v1/order] Ошибка при исполнении пересланного ордера: {str(e)}', exc_info=True)
+        return {'status_code': status.HTTP_500_INTERNAL_SERVER_ERROR, 'detail': 'Internal server error'}
+    finally:
+        if admitted:
+            trading_gate.release()
+
+def prefers_async(prefer: str | None) -> bool:
+    if not prefer:
+        return False
+    return any(preference.split(';')[0].strip().lower() == 'respond-async' for preference in prefer.split(','))
+
+@order_router.post(
+    '/api/v1/order',
+    response_model=CreateOrderResponseSchema,
+    responses={status.HTTP_202_ACCEPTED: {'model': AcceptedOrderResponseSchema}},
+    dependencies=[Depends(admission('order_create', Priority.ORDER))],
+    tags=['order']
+)
+async def create_order(
+    request: Request,
+    session: SessionDep,
+    user_data: Annotated[OrderBodySchema, Body()],
+    current_user: UserModel = Depends(get_current_user),
+    authorization: Optional[str] = Header(None),
+    x_forwarded_order: Optional[str] = Header(None),
+    prefer: Optional[str] = Header(None)
+):
+    user_id = current_user.id
+    if order_queue.enabled and prefers_async(prefer):
+        # Ордер только резервируется и ставится в очередь — пересылать его
+        # владельцу тикера не нужно, очередь он разберет сам. Без
+        # ASYNC_ORDERS предпочтение игнорируется и ордер исполняется сразу
+        result = await run_transaction(session, lambda: enqueue_order(session, user_id, user_data), 'enqueue_order')
+        return FastJSONResponse(
+            result,
+            status_code=status.HTTP_202_ACCEPTED,
+            headers={
+                'Preference-Applied': 'respond-async',
+                'Location': f'/api/v1/order/{result["order_id"]}'
+            }
+        )
+
+    # Ордер, уже пришедший с другого узла, дальше между узлами не пересылается
+    owner_url = lease_manager.owner_url(user_data.ticker) if lease_manager.enabled and x_forwarded_order is None else None
+    if owner_url is not None:
+        await session.rollback()
+        release_admission(request)
+        response = await proxy_order(owner_url, authorization, user_data)
+        if response is not None:
+            return response
+
+    owner = ticker_ring.owner(user_data.ticker)
+    if owner is not None and owner != ticker_ring.node:
+        # Соединение и слот гейта этого воркера на время пересылки не
+        # нужны: владелец исполняет ордер под своим гейтом
+        await session.rollback()
+        release_admission(request)
+        result = await forward_order(owner, user_id, user_data)
+        if result is not None:
+            return result
+    await readmit(request, 'order_create', Priority.ORDER)
+    return await run_transaction(session, lambda: place_order(session, user_id, user_data), 'create_order')
+
+async def cancel_user_order(
+    session: SessionDep,
+    user_id: UUID,
+    order_id: UUID
+):
+    logger.info(f'[DELETE /api/v1/order/{order_id}] Запрос на отмену ордера: order_id={order_id}, user_id={user_id}')
+    
+    order = await session.scalar(
+        select(OrderModel)
+        .where(OrderModel.id == order_id)
     )
     if not order:
         logger.warning(f'[DELETE /api/v1/order/{order_id}] Ордер не найден: order_id={order_id}')
@@ -188,8 +438,8 @@ async def cancel_order(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail='Order not found'
         )
-    if order.user_id != current_user.id:
-        logger.warning(f'[DELETE /api/v1/order/{order_id}] Попытка отменить чужой ордер: order_id={order_id}, user_id={current_user.id}, owner_id={order.user_id}')
+    if order.user_id != user_id:
+        logger.warning(f'[DELETE /api/v1/order/{order_id}] Попытка отменить чужой ордер: order_id={order_id}, user_id={user_id}, owner_id={order.user_id}')
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail='You can only cancel your own orders'
@@ -202,70 +452,96 @@ async def cancel_order(
             detail='Cannot cancel executed or cancelled order.'
         )
     
-    if not order.price:
+    # Ордер из очереди еще не попал в стакан — отменить можно и рыночный
+    pending = order.status == StatusEnum.PENDING
+    if not order.price and not pending:
         logger.warning(f'[DELETE /api/v1/order/{order_id}] Невозможно отменить рыночный ордер: order_id={order_id}')
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail='Cannot cancel market order'
         )
     
-    logger.info(f'[DELETE /api/v1/order/{order_id}] Получение балансов для отмены: user_id={current_user.id}, ticker={order.ticker}')
-    if order.direction == DirectionEnum.BUY:
-        await update_balance(session, current_user.id, 'RUB', 0, (order.qty - order.filled) * order.price)
-        logger.info(f'[DELETE /api/v1/order/{order_id}] Возвращены RUB: amount={(order.qty - order.filled) * order.price}')
-    else:
-        await update_balance(session, current_user.id, order.ticker, 0, order.qty - order.filled)
-        logger.info(f'[DELETE /api/v1/order/{order_id}] Возвращен {order.ticker}: amount={order.qty - order.filled}')
+    # Сначала блокируется строка ордера, затем уровень стакана и баланс — общий порядок блокировок
+    order.status = StatusEnum.CANCELLED
+    with LOCK_WAIT.labels('orders').time():
+        await session.flush()
+    if not pending:
+        level_deltas = {}
+        add_level_delta(level_deltas, order.ticker, order.direction, order.price, -(order.qty - order.filled), -1)
+        await apply_level_deltas(session, level_deltas)
+
+    logger.info(f'[DELETE /api/v1/order/{order_id}] Получение балансов для отмены: user_id={user_id}, ticker={order.ticker}')
+    reserve_ticker, reserve_qty = order_reserve(order.direction, order.ticker, order.qty - order.filled, order.price)
+    if reserve_qty:
+        await update_balance(session, user_id, reserve_ticker, 0, reserve_qty)
+        logger.info(f'[DELETE /api/v1/order/{order_id}] Возвращен {reserve_ticker}: amount={reserve_qty}')
     
-    order.status = StatusEnum.CANCELLED 
+    await session.commit()
+    if not pending:
+        top_of_book.on_remove(order.ticker, order.direction, order.price)
+        book_snapshots.mark_dirty(order.ticker)
     logger.info(f'[DELETE /api/v1/order/{order_id}] Ордер успешно отменен: order_id={order_id}')
     return {'success': True}
 
-@order_router.get('/api/v1/order', response_model=list[OrderResponseSchema], tags=['order'])
-async def get_orders_list(
+@order_router.delete('/api/v1/order/{order_id}', response_model=OkResponseSchema, dependencies=[Depends(admission('order_cancel', Priority.CANCEL))], tags=['order'])
+async def cancel_order(
     session: SessionDep,
+    order_id: UUID,
     current_user: UserModel = Depends(get_current_user)
+):
+    user_id = current_user.id
+    return await run_transaction(session, lambda: cancel_user_order(session, user_id, order_id), 'cancel_order')
+
+def serialize_order(order) -> dict:
+    body = {
+        'direction': order.direction,
+        'ticker': order.ticker,
+        'qty': order.qty
+    }
+    result = {
+        'id': order.id,
+        'status': order.status,
+        'user_id': order.user_id,
+        'timestamp': order.timestamp,
+        'body': body
+    }
+    if order.price is not None:
+        body['type'] = 'LIMIT'
+        body['price'] = order.price
+        result['filled'] = order.filled
+    else:
+        body['type'] = 'MARKET'
+    return result
+
+@order_router.get('/api/v1/order', response_model=list[OrderResponseSchema], dependencies=[Depends(admission('order_read', Priority.READ))], tags=['order'])
+async def get_orders_list(
+    session: TradingReadSessionDep,
+    current_user: UserModel = Depends(get_current_reader)
 ):
     logger.info(f'[GET /api/v1/order] Запрос списка ордеров: user_id={current_user.id}')
-    orders = await session.scalars(
-        select(OrderModel)
+    orders = await session.execute(
+        select(
+            OrderModel.id,
+            OrderModel.status,
+            OrderModel.user_id,
+            OrderModel.timestamp,
+            OrderModel.direction,
+            OrderModel.ticker,
+            OrderModel.qty,
+            OrderModel.price,
+            OrderModel.filled
+        )
         .where(OrderModel.user_id == current_user.id)
     )
-    result = []
-    for order in orders:
-        body_data = {
-            'direction': order.direction,
-            'ticker': order.ticker,
-            'qty': order.qty,
-        }
-        if order.price is not None:
-            result.append(LimitOrderSchema(
-                id=order.id,
-                status=order.status,
-                user_id=order.user_id,
-                timestamp=order.timestamp,
-                body=LimitOrderBodySchema(**body_data, price=order.price),
-                filled=order.filled
-            ))
-            logger.info(f'[GET /api/v1/order] Лимитный ордер: id={order.id}, direction={order.direction}, qty={order.qty}, filled={order.filled}, price={order.price}')
-        else:
-            result.append(MarketOrderSchema(
-                id=order.id,
-                status=order.status,
-                user_id=order.user_id,
-                timestamp=order.timestamp,
-                body=MarketOrderBodySchema(**body_data)
-            ))
-            logger.info(f'[GET /api/v1/order] Рыночный ордер: id={order.id}, direction={order.direction}, qty={order.qty}, filled={order.filled}')
-
+    result = [serialize_order(order) for order in orders]
     logger.info(f'[GET /api/v1/order] Возвращено ордеров: {len(result)}')
-    return result
+    return FastJSONResponse(result)
 
-@order_router.get('/api/v1/order/{order_id}', response_model=OrderResponseSchema, tags=['order'])
+@order_router.get('/api/v1/order/{order_id}', response_model=OrderResponseSchema, dependencies=[Depends(admission('order_read', Priority.READ))], tags=['order'])
 async def get_order(
-    session: SessionDep,
+    session: TradingReadSessionDep,
     order_id: UUID,
-    current_user: UserModel = Depends(get_current_user)
+    current_user: UserModel = Depends(get_current_reader)
 ):
     logger.info(f'[GET /api/v1/order/{order_id}] Запрос ордера: order_id={order_id}, user_id={current_user.id}')
     order = await session.scalar(
@@ -302,71 +578,91 @@ async def get_order(
             body=MarketOrderBodySchema(**body_data)
         )
 
-@order_router.get('/api/v1/public/orderbook/{ticker}', response_model=OrderBookListSchema, tags=['public'])
+async def load_order_book_json(ticker: str) -> bytes:
+    async with open_read_session() as session:
+        book = await load_order_book(session, ticker)
+    logger.info(f'[GET /api/v1/public/orderbook/{ticker}] Стакан {ticker}:')
+    logger.info(f'[GET /api/v1/public/orderbook/{ticker}] Бид уровни: {book["bid_levels"]}')
+    logger.info(f'[GET /api/v1/public/orderbook/{ticker}] Аск уровни: {book["ask_levels"]}')
+    return dump_json(book)
+
+async def load_order_books_json(tickers: list[str], depth: int) -> bytes:
+    # Тикеры со свежим снимком берутся из разделяемой памяти, остальные —
+    # одним запросом к уровням стакана
+    books = {}
+    missing = []
+    for ticker in tickers:
+        snapshot = book_snapshots.read(ticker)
+        if snapshot is None:
+            missing.append(ticker)
+            continue
+        book = orjson.loads(snapshot.book)
+        books[ticker] = {'bid_levels': book['bid_levels'][:depth], 'ask_levels': book['ask_levels'][:depth]}
+    if missing:
+        async with open_read_session() as session:
+            books.update(await load_order_books(session, missing, depth))
+    logger.info(f'[GET /api/v1/public/orderbook] Стаканы: tickers={len(tickers)}, из базы={len(missing)}, depth={depth}')
+    return dump_json({ticker: books[ticker] for ticker in tickers})
+
+@order_router.get('/api/v1/public/orderbook', response_model=dict[str, OrderBookListSchema], dependencies=[Depends(rate_limit('public'))], responses=MSGPACK_RESPONSES, tags=['public'])
+async def get_order_books(
+    tickers: str,
+    depth: int = Query(10, ge=1, le=BATCH_MAX_DEPTH),
+    if_none_match: Optional[str] = Header(None),
+    accept: Optional[str] = Header(None)
+):
+    ticker_list = parse_tickers(tickers)
+    logger.info(f'[GET /api/v1/public/orderbook] Запрос стаканов: tickers={ticker_list}, depth={depth}')
+    content = await single_flight.do(
+        'orderbook_batch',
+        ('orderbook_batch', tuple(ticker_list), depth),
+        lambda: load_order_books_json(ticker_list, depth)
+    )
+    return conditional_response(content, body_etag(content), if_none_match, accept)
+
+@order_router.get('/api/v1/public/orderbook/{ticker}', response_model=OrderBookListSchema, dependencies=[Depends(rate_limit('public'))], responses=MSGPACK_RESPONSES, tags=['public'])
 async def get_order_book(
-    session: SessionDep,
-    ticker: str
+    ticker: str,
+    if_none_match: Optional[str] = Header(None),
+    accept: Optional[str] = Header(None)
 ):
     logger.info(f'[GET /api/v1/public/orderbook/{ticker}] Запрос стакана: ticker={ticker}')
-    bid_orders = await session.execute(
-        select(
-            OrderModel.price,
-            func.sum(OrderModel.qty - OrderModel.filled)
-        )
-        .where(OrderModel.status.in_([StatusEnum.NEW, StatusEnum.PARTIALLY_EXECUTED]))
-        .where(OrderModel.direction == DirectionEnum.BUY)
-        .where(OrderModel.ticker == ticker)
-        .where(OrderModel.price != None)
-        .group_by(OrderModel.price)
-        .order_by(OrderModel.price.desc())
-    )
+    # Свежий снимок из разделяемой памяти отдается как есть, без базы; его
+    # версия меняется только вместе с содержимым и служит ETag
+    snapshot = book_snapshots.read(ticker)
+    if snapshot is not None:
+        logger.debug(f'[GET /api/v1/public/orderbook/{ticker}] Стакан из снимка: version={snapshot.version}')
+        return conditional_response(snapshot.book, f'"b{snapshot.version:x}"', if_none_match, accept)
 
-    ask_orders = await session.execute(
-        select(
-            OrderModel.price,
-            func.sum(OrderModel.qty - OrderModel.filled)
-        )
-        .where(OrderModel.status.in_([StatusEnum.NEW, StatusEnum.PARTIALLY_EXECUTED]))
-        .where(OrderModel.direction == DirectionEnum.SELL)
-        .where(OrderModel.ticker == ticker)
-        .where(OrderModel.price != None)
-        .group_by(OrderModel.price)
-        .order_by(OrderModel.price.asc())
-    )
+    # Сессия берется только тем запросом, который действительно идет в базу
+    content = await single_flight.do('orderbook', ('orderbook', ticker), lambda: load_order_book_json(ticker))
+    return conditional_response(content, body_etag(content), if_none_match, accept)
 
-    bid_levels = [OrderLevel(price=price, qty=qty) for price, qty in bid_orders if qty > 0]
-    ask_levels = [OrderLevel(price=price, qty=qty) for price, qty in ask_orders if qty > 0]
-    
-    logger.info(f'[GET /api/v1/public/orderbook/{ticker}] Стакан {ticker}:')
-    logger.info(f'[GET /api/v1/public/orderbook/{ticker}] Бид уровни: {bid_levels}')
-    logger.info(f'[GET /api/v1/public/orderbook/{ticker}] Аск уровни: {ask_levels}')
-    
-    return OrderBookListSchema(
-        bid_levels=bid_levels,
-        ask_levels=ask_levels
-    )
+def add_delta(balance_deltas: dict, user_id: UUID, ticker: str, order_id: UUID, delta_amount: int, delta_available: int):
+    amount, available = balance_deltas.get((user_id, ticker, order_id), (0, 0))
+    balance_deltas[(user_id, ticker, order_id)] = (amount + delta_amount, available + delta_available)
 
 async def match_orders(session: SessionDep, new_order: OrderModel):
     logger.info(f'[match_orders] Начало исполнения ордера: id={new_order.id}, direction={new_order.direction}, qty={new_order.qty}, price={new_order.price}')
-
-    opposite_direction = DirectionEnum.SELL if new_order.direction == DirectionEnum.BUY else DirectionEnum.BUY
-    sorting_by = (OrderModel.price.asc(), OrderModel.timestamp.asc()) if new_order.direction == DirectionEnum.BUY else (OrderModel.price.desc(), OrderModel.timestamp.asc())
-    price_condition = (OrderModel.price <= new_order.price if new_order.price and new_order.direction == DirectionEnum.BUY else
-                          OrderModel.price >= new_order.price if new_order.price else True)
-
-    matching_orders = await session.scalars(
-        select(OrderModel)
-        .where(OrderModel.ticker == new_order.ticker)
-        .where(OrderModel.direction == opposite_direction)
-        .where(OrderModel.status.in_([StatusEnum.NEW, StatusEnum.PARTIALLY_EXECUTED]))
-        .where(price_condition)
-        .order_by(OrderModel.user_id, OrderModel.ticker, *sorting_by)
-        .with_for_update()
-    )
-    matching_orders = list(matching_orders)
+    started = perf_counter()
+    fills = 0
+
+    use_cache = top_of_book.is_enabled(new_order.ticker)
+    if use_cache and new_order.price is not None and not await top_of_book.can_cross(session, new_order):
+        # Лимитный ордер не пересекает лучшую встречную цену — просто встает в стакан
+        logger.info(f'[match_orders] Ордер не пересекает стакан, матчинг пропущен: id={new_order.id}')
+        MATCH_SKIPPED.labels(new_order.ticker).inc()
+        matching_orders = []
+    else:
+        matching_orders = list(await session.scalars(
+            matching_orders_statement(new_order.ticker, new_order.direction, new_order.price)
+        ))
     logger.info(f'[match_orders] Найдено подходящих ордеров: {len(matching_orders)}')
 
     total_filled = 0
+    balance_deltas = {}
+    level_deltas = {}
+    transactions = []
     for matching_order in matching_orders:
         if total_filled >= new_order.qty:
             break
@@ -388,68 +684,26 @@ async def match_orders(session: SessionDep, new_order: OrderModel):
         seller = matching_order.user_id if new_order.direction == DirectionEnum.BUY else new_order.user_id
         logger.info(f'[match_orders] Исполнение сделки: buyer={buyer}, seller={seller}, qty={match_qty}, price={transaction_price}')
 
+        # Цена, по которой у покупателя были зарезервированы RUB под этот объем
+        if new_order.direction == DirectionEnum.BUY:
+            reserved_price = new_order.price or 0
+        else:
+            reserved_price = transaction_price
+
+        buy_order = new_order.id if new_order.direction == DirectionEnum.BUY else matching_order.id
+        sell_order = matching_order.id if new_order.direction == DirectionEnum.BUY else new_order.id
         if buyer == seller:
-            logger.info(f'[match_orders] Самоторговля: buyer={buyer}, seller={seller}, qty={match_qty}, price={transaction_price}. Пропускаем обновление балансов.')
+            logger.info(f'[match_orders] Самоторговля: buyer={buyer}, seller={seller}, qty={match_qty}, price={transaction_price}. Снимаем только резервы.')
+            add_delta(balance_deltas, buyer, 'RUB', buy_order, 0, match_qty * reserved_price)
+            add_delta(balance_deltas, seller, new_order.ticker, sell_order, 0, match_qty)
         else:
-            buyer_rub_balance = await session.scalar(
-                select(BalanceModel)
-                .where(BalanceModel.user_id == buyer)
-                .where(BalanceModel.ticker == 'RUB')
-                .with_for_update()
-            )
-            if not buyer_rub_balance:
-                buyer_rub_balance = BalanceModel(user_id=buyer, ticker='RUB', amount=0, available=0)
-                session.add(buyer_rub_balance)
-
-            buyer_ticker_balance = await session.scalar(
-                select(BalanceModel)
-                .where(BalanceModel.user_id == buyer)
-                .where(BalanceModel.ticker == new_order.ticker)
-                .with_for_update()
-            )
-            if not buyer_ticker_balance:
-                buyer_ticker_balance = BalanceModel(user_id=buyer, ticker=new_order.ticker, amount=0, available=0)
-                session.add(buyer_ticker_balance)
-
-            seller_rub_balance = await session.scalar(
-                select(BalanceModel)
-                .where(BalanceModel.user_id == seller)
-                .where(BalanceModel.ticker == 'RUB')
-                .with_for_update()
-            )
-            if not seller_rub_balance:
-                seller_rub_balance = BalanceModel(user_id=seller, ticker='RUB', amount=0, available=0)
-                session.add(seller_rub_balance)
-
-            seller_ticker_balance = await session.scalar(
-                select(BalanceModel)
-                .where(BalanceModel.user_id == seller)
-                .where(BalanceModel.ticker == new_order.ticker)
-                .with_for_update()
-            )
-            if not seller_ticker_balance:
-                seller_ticker_balance = BalanceModel(user_id=seller, ticker=new_order.ticker, amount=0, available=0)
-                session.add(seller_ticker_balance)
-
-            buyer_rub_balance.amount -= match_qty * transaction_price
-            buyer_ticker_balance.amount += match_qty
-            seller_rub_balance.amount += match_qty * transaction_price
-            seller_ticker_balance.amount -= match_qty
-
-            if new_order.direction == DirectionEnum.BUY:
-                buyer_rub_balance.available = buyer_rub_balance.amount + (new_order.qty - total_filled - match_qty) * new_order.price
-                seller_ticker_balance.available = seller_ticker_balance.amount + (matching_order.qty - matching_order.filled - match_qty)
-            else:
-                seller_rub_balance.available = seller_rub_balance.amount + (new_order.qty - total_filled - match_qty) * new_order.price
-                buyer_ticker_balance.available = buyer_ticker_balance.amount + (matching_order.qty - matching_order.filled - match_qty)
-
-            logger.info(f'[match_orders] Обновлены балансы:')
-            logger.info(f'[match_orders] Покупатель RUB: amount={buyer_rub_balance.amount}, available={buyer_rub_balance.available}')
-            logger.info(f'[match_orders] Покупатель {new_order.ticker}: amount={buyer_ticker_balance.amount}, available={buyer_ticker_balance.available}')
-            logger.info(f'[match_orders] Продавец RUB: amount={seller_rub_balance.amount}, available={seller_rub_balance.available}')
-            logger.info(f'[match_orders] Продавец {new_order.ticker}: amount={seller_ticker_balance.amount}, available={seller_ticker_balance.available}')
+            add_delta(balance_deltas, buyer, 'RUB', buy_order, -match_qty * transaction_price, match_qty * (reserved_price - transaction_price))
+            add_delta(balance_deltas, buyer, new_order.ticker, buy_order, match_qty, match_qty)
+            add_delta(balance_deltas, seller, 'RUB', sell_order, match_qty * transaction_price, match_qty * transaction_price)
+            add_delta(balance_deltas, seller, new_order.ticker, sell_order, -match_qty, 0)
 
         matching_order.filled += match_qty
+        add_level_delta(level_deltas, matching_order.ticker, matching_order.direction, matching_order.price, -match_qty, -1 if matching_order.filled == matching_order.qty else 0)
         if matching_order.filled == matching_order.qty:
             matching_order.status = StatusEnum.EXECUTED
             logger.info(f'[match_orders] Ордер полностью исполнен: id={matching_order.id}')
@@ -458,6 +712,7 @@ async def match_orders(session: SessionDep, new_order: OrderModel):
             logger.info(f'[match_orders] Ордер частично исполнен: id={matching_order.id}, filled={matching_order.filled}')
 
         total_filled += match_qty
+        fills += 1
         logger.info(f'[match_orders] Текущий прогресс исполнения: total_filled={total_filled}')
 
         if buyer != seller:
@@ -470,8 +725,40 @@ async def match_orders(session: SessionDep, new_order: OrderModel):
                 seller_id=seller
             )
             session.add(transaction)
-            await session.flush()
-            logger.info(f'[match_orders] Создана транзакция: id={transaction.id}, ticker={transaction.ticker}, amount={transaction.amount}, price={transaction.price}')
+            transactions.append(transaction)
+
+    if new_order.price is not None and total_filled < new_order.qty:
+        add_level_delta(level_deltas, new_order.ticker, new_order.direction, new_order.price, new_order.qty - total_filled, 1)
+
+    # Блокировки берутся в общем порядке: резерв тейкера (до матчинга),
+    # строки ордеров (flush обновляет их по возрастанию id), уровни стакана
+    # по (ticker, side, price), затем балансы по (user_id, ticker). Резерв
+    # стоит вне порядка балансов: встречная сделка, которая уже держит
+    # балансы и ждет строку тейкера, может дать дедлок — Postgres его
+    # обрывает, а run_transaction повторяет транзакцию (40P01)
+    with LOCK_WAIT.labels('orders').time():
+        await session.flush()
+    with LOCK_WAIT.labels('levels').time():
+        await apply_level_deltas(session, level_deltas)
+    for transaction in transactions:
+        logger.info(f'[match_orders] Создана транзакция: id={transaction.id}, ticker={transaction.ticker}, amount={transaction.amount}, price={transaction.price}')
+
+    # Изменения балансов копятся по ордерам и применяются условным UPDATE на ордер: резерв каждого ордера
+    # лежит в одном шарде, и списание под этот ордер должно попасть туда
+    # же, а сумма списаний по нескольким ордерам мейкера может не уместиться
+    # ни в один шард
+    for (user_id, ticker, _), (delta_amount, delta_available) in sorted(balance_deltas.items(), key=lambda item: (str(item[0][0]), item[0][1], str(item[0][2]))):
+        if not delta_amount and not delta_available:
+            continue
+        with LOCK_WAIT.labels('balance').time():
+            balance = await apply_delta(session, user_id, ticker, delta_amount, delta_available)
+        if balance is None:
+            logger.warning(f'[match_orders] Недостаточно средств: user_id={user_id}, ticker={ticker}, delta_amount={delta_amount}, delta_available={delta_available}')
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f'Negative balance not allowed for {ticker}'
+            )
+        logger.info(f'[match_orders] Обновлен баланс: user_id={user_id}, ticker={ticker}, amount={balance.amount}, available={balance.available}')
 
     new_order.filled = total_filled
     if total_filled == new_order.qty:
@@ -485,4 +772,18 @@ async def match_orders(session: SessionDep, new_order: OrderModel):
         logger.info(f'[match_orders] Новый ордер создан: id={new_order.id}')
 
     await session.commit()
+
+    if use_cache:
+        for matching_order in matching_orders:
+            if matching_order.status == StatusEnum.EXECUTED:
+                top_of_book.on_remove(matching_order.ticker, matching_order.direction, matching_order.price)
+        if new_order.price is not None and new_order.status != StatusEnum.EXECUTED:
+            top_of_book.on_rest(new_order.ticker, new_order.direction, new_order.price)
+
+    book_snapshots.mark_dirty(new_order.ticker)
+    for transaction in transactions:
+        ticker_stats.add_trade(transaction.id, transaction.ticker, transaction.price, transaction.amount, transaction.timestamp)
+
+    MATCH_DURATION.labels(new_order.ticker).observe(perf_counter() - started)
+    MATCH_FILLS.labels(new_order.ticker).observe(fills)
     logger.info(f'[match_orders] Исполнение ордера завершено: id={new_order.id}, filled={new_order.filled}, status={new_order.status}')
\ No newline at end of file
@@ -1,5 +1,5 @@
-from typing import Union, Literal
-from pydantic import BaseModel, Field
+from typing import Annotated, Union, Literal
+from pydantic import BaseModel, Discriminator, Field, Tag
 from datetime import datetime
 from uuid import UUID
 from typing import List
@@ -10,8 +10,10 @@ class MarketOrderBodySchema(BaseModel):
     direction: DirectionEnum
     ticker: str
     qty: int = Field(ge=1)
+    type: Literal['MARKET'] = 'MARKET'
 
 class LimitOrderBodySchema(MarketOrderBodySchema):
+    type: Literal['LIMIT'] = 'LIMIT'
     price: int = Field(gt=0)
 
 class OrderSchema(BaseModel):
@@ -27,14 +29,44 @@ class LimitOrderSchema(OrderSchema):
 class MarketOrderSchema(OrderSchema):
     body: MarketOrderBodySchema
 
-OrderBodySchema = Union[LimitOrderBodySchema, MarketOrderBodySchema]
+def get_order_type(body) -> str | None:
+    # Клиенты, не передающие type, определяются по наличию цены
+    if isinstance(body, dict):
+        order_type = body.get('type')
+        if order_type is None:
+            return 'LIMIT' if body.get('price') is not None else 'MARKET'
+        return order_type
+    return getattr(body, 'type', None)
 
-OrderResponseSchema = Union[LimitOrderSchema, MarketOrderSchema]
+def get_order_response_type(order) -> str | None:
+    body = order.get('body') if isinstance(order, dict) else getattr(order, 'body', None)
+    return get_order_type(body)
+
+OrderBodySchema = Annotated[
+    Union[
+        Annotated[LimitOrderBodySchema, Tag('LIMIT')],
+        Annotated[MarketOrderBodySchema, Tag('MARKET')]
+    ],
+    Discriminator(get_order_type)
+]
+
+OrderResponseSchema = Annotated[
+    Union[
+        Annotated[LimitOrderSchema, Tag('LIMIT')],
+        Annotated[MarketOrderSchema, Tag('MARKET')]
+    ],
+    Discriminator(get_order_response_type)
+]
 
 class CreateOrderResponseSchema(BaseModel):
     success: Literal[True] = Field(default=True)
     order_id: UUID
 
+class AcceptedOrderResponseSchema(BaseModel):
+    success: Literal[True] = Field(default=True)
+    order_id: UUID
+    seq: int
+
 class OrderLevel(BaseModel):
     price: int
     qty: int
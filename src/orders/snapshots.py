@@ -0,0 +1,266 @@
+import asyncio
+import fcntl
+import os
+import struct
+import zlib
+from contextlib import contextmanager
+from typing import NamedTuple
+from time import time
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import orjson
+from sqlalchemy import select
+
+from src.database import market_data_session
+from src.affinity.ring import ticker_ring, AFFINITY_DIR
+from src.instruments.models import InstrumentModel
+from src.responses import dump_json
+from src.orders.utils import load_order_book
+from src.transactions.stats import ticker_stats
+from src.monitoring.metrics import ORDER_BOOK_DEPTH
+from src.logger import logger
+
+
+BOOK_SNAPSHOTS = os.getenv('BOOK_SNAPSHOTS', '0') == '1'
+SNAPSHOT_SEGMENT = os.getenv('SNAPSHOT_SEGMENT', 'toy_exchange_books')
+SNAPSHOT_SLOTS = int(os.getenv('SNAPSHOT_SLOTS', '256'))
+SNAPSHOT_SLOT_SIZE = int(os.getenv('SNAPSHOT_SLOT_SIZE', str(64 * 1024)))
+SNAPSHOT_REFRESH_INTERVAL = float(os.getenv('SNAPSHOT_REFRESH_INTERVAL', '0.5'))
+SNAPSHOT_MAX_AGE = float(os.getenv('SNAPSHOT_MAX_AGE', '2'))
+
+# Заголовок слота: seq (нечетный, пока писатель пишет), версия содержимого,
+# номер последней сделки, время публикации, тикер, длины JSON стакана и
+# статистики
+HEADER = struct.Struct('<QQQd16sII')
+SEQ = struct.Struct('<Q')
+TICKER_OFFSET = 32
+# Слот со списком инструментов; ключ не может совпасть с тикером
+INSTRUMENTS_KEY = '@instruments'
+
+
+class Snapshot(NamedTuple):
+    version: int
+    trade_seq: int
+    book: bytes
+    stats: bytes
+
+
+class BookSnapshots:
+    # Сегмент разделяемой памяти со снимками стакана и статистики 24ч по
+    # тикерам. Пишет только воркер-владелец тикера, читают все воркеры без
+    # обращения к базе; согласованность чтения обеспечивает seqlock
+    def __init__(self):
+        self.enabled = BOOK_SNAPSHOTS
+        self.shm = None
+        self.slots = {}
+        self.dirty = set()
+        self.wakeup = asyncio.Event()
+        self.lock_file = None
+        self.writer = False
+
+    def attach(self):
+        try:
+            self.shm = SharedMemory(SNAPSHOT_SEGMENT)
+            # Сегмент создан мастером gunicorn (gunicorn.conf.py); воркер
+            # не должен удалять его при выходе
+            resource_tracker.unregister(self.shm._name, 'shared_memory')
+        except FileNotFoundError:
+            # Запуск без gunicorn: сегмент создает и владеет им сам процесс
+            self.shm = SharedMemory(SNAPSHOT_SEGMENT, create=True, size=SNAPSHOT_SLOTS * SNAPSHOT_SLOT_SIZE)
+        logger.info(f'[SNAPSHOTS] Подключен сегмент {SNAPSHOT_SEGMENT}: {SNAPSHOT_SLOTS} слотов по {SNAPSHOT_SLOT_SIZE} байт')
+
+    def can_publish(self, ticker: str) -> bool:
+        # Без кольца воркеров пишет один процесс из всех — держатель
+        # блокировки писателя: у каждого воркера своя статистика и своя
+        # эпоха trade_seq, и несколько писателей меняли бы версию слота
+        # (ETag) на каждой записи
+        if self.shm is None:
+            return False
+        return ticker_ring.owns(ticker) if ticker_ring.enabled else self.writer
+
+    def _elect_writer(self):
+        self._open_lock_file()
+        try:
+            fcntl.lockf(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, SNAPSHOT_SLOTS + 1)
+        except OSError:
+            return
+        # Блокировка держится до выхода процесса; после его смерти ее
+        # возьмет другой воркер на следующем проходе
+        self.writer = True
+        logger.info(f'[SNAPSHOTS] Процесс {os.getpid()} публикует снимки всех тикеров')
+
+    def _slot_ticker(self, index: int) -> bytes:
+        offset = index * SNAPSHOT_SLOT_SIZE
+        return bytes(self.shm.buf[offset + TICKER_OFFSET:offset + TICKER_OFFSET + 16]).rstrip(b'\0')
+
+    def _open_lock_file(self):
+        if self.lock_file is None:
+            os.makedirs(AFFINITY_DIR, exist_ok=True)
+            self.lock_file = open(os.path.join(AFFINITY_DIR, 'snapshots.lock'), 'a')
+
+    @contextmanager
+    def _locked(self, byte: int):
+        # Блокировки между воркерами — байты файла snapshots.lock: байт i
+        # защищает запись в слот i, байт SNAPSHOT_SLOTS — занятие пустых
+        # слотов, байт SNAPSHOT_SLOTS + 1 — роль писателя без кольца. Внутри процесса запись не прерывается await, поэтому
+        # POSIX-блокировки процесса достаточно
+        self._open_lock_file()
+        fcntl.lockf(self.lock_file, fcntl.LOCK_EX, 1, byte)
+        try:
+            yield
+        finally:
+            fcntl.lockf(self.lock_file, fcntl.LOCK_UN, 1, byte)
+
+    def _find_slot(self, ticker: str, claim: bool) -> int | None:
+        if ticker in self.slots:
+            return self.slots[ticker]
+        key = ticker.encode()
+        start = zlib.crc32(key) % SNAPSHOT_SLOTS
+        for probe in range(SNAPSHOT_SLOTS):
+            index = (start + probe) % SNAPSHOT_SLOTS
+            slot_ticker = self._slot_ticker(index)
+            if slot_ticker == key:
+                self.slots[ticker] = index
+                return index
+            if not slot_ticker:
+                if not claim:
+                    return None
+                # Занятие пустого слота — редкая операция, сериализуем ее
+                # между воркерами файловой блокировкой
+                with self._locked(SNAPSHOT_SLOTS):
+                    slot_ticker = self._slot_ticker(index)
+                    if not slot_ticker:
+                        offset = index * SNAPSHOT_SLOT_SIZE
+                        self.shm.buf[offset + TICKER_OFFSET:offset + TICKER_OFFSET + 16] = key.ljust(16, b'\0')
+                        slot_ticker = key
+                if slot_ticker == key:
+                    self.slots[ticker] = index
+                    return index
+        return None
+
+    def publish(self, ticker: str, book: bytes, stats: bytes, trade_seq: int = 0):
+        if HEADER.size + len(book) + len(stats) > SNAPSHOT_SLOT_SIZE:
+            logger.warning(f'[SNAPSHOTS] Снимок {ticker} не помещается в слот: {len(book) + len(stats)} байт')
+            return
+        index = self._find_slot(ticker, claim=True)
+        if index is None:
+            logger.warning(f'[SNAPSHOTS] Нет свободного слота для {ticker}')
+            return
+        # seqlock рассчитан на одного писателя, а во время смены владельцев в
+        # кольце тикер могут публиковать два воркера сразу
+        with self._locked(index):
+            self._write(index, ticker, book, stats, trade_seq)
+
+    def _write(self, index: int, ticker: str, book: bytes, stats: bytes, trade_seq: int):
+        offset = index * SNAPSHOT_SLOT_SIZE
+        buf = self.shm.buf
+        # Версия продолжается с той, что лежит в слоте: при смене владельца
+        # тикера она не откатывается назад. Версия служит ETag, поэтому
+        # меняется только вместе с содержимым, а новый слот начинает ее со
+        # случайного значения — после пересоздания сегмента старые ETag не совпадут
+        seq, version, slot_trade_seq, _, _, book_len, stats_len = HEADER.unpack_from(buf, offset)
+        payload = offset + HEADER.size
+        unchanged = (
+            version != 0
+            and slot_trade_seq == trade_seq
+            and book_len == len(book)
+            and stats_len == len(stats)
+            and buf[payload:payload + book_len + stats_len] == book + stats
+        )
+        if version == 0:
+            version = int.from_bytes(os.urandom(4), 'big') << 32
+        elif not unchanged:
+            version += 1
+
+        SEQ.pack_into(buf, offset, seq + 1)
+        HEADER.pack_into(buf, offset, seq + 1, version, trade_seq, time(), ticker.encode().ljust(16, b'\0'), len(book), len(stats))
+        if not unchanged:
+            buf[payload:payload + len(book)] = book
+            buf[payload + len(book):payload + len(book) + len(stats)] = stats
+        SEQ.pack_into(buf, offset, seq + 2)
+
+    def read(self, ticker: str) -> Snapshot | None:
+        # None, если снимка нет, он устарел или писатель не дал прочитать
+        # его целиком
+        if self.shm is None:
+            return None
+        index = self._find_slot(ticker, claim=False)
+        if index is None:
+            return None
+        offset = index * SNAPSHOT_SLOT_SIZE
+        buf = self.shm.buf
+        for _ in range(10):
+            seq, version, trade_seq, published_at, _, book_len, stats_len = HEADER.unpack_from(buf, offset)
+            if seq % 2 or seq == 0:
+                continue
+            payload = offset + HEADER.size
+            book = bytes(buf[payload:payload + book_len])
+            stats = bytes(buf[payload + book_len:payload + book_len + stats_len])
+            if SEQ.unpack_from(buf, offset)[0] != seq:
+                continue
+            if time() - published_at > SNAPSHOT_MAX_AGE:
+                return None
+            return Snapshot(version, trade_seq, book, stats)
+        return None
+
+    def mark_dirty(self, ticker: str):
+        if self.can_publish(ticker):
+            self.dirty.add(ticker)
+            self.wakeup.set()
+
+    async def publish_ticker(self, session, ticker: str):
+        book = await load_order_book(session, ticker)
+        ORDER_BOOK_DEPTH.labels(ticker, 'bid').set(len(book['bid_levels']))
+        ORDER_BOOK_DEPTH.labels(ticker, 'ask').set(len(book['ask_levels']))
+        stats = {
+            'ticker': ticker,
+            **ticker_stats.snapshot(ticker),
+            'best_bid': book['bid_levels'][0]['price'] if book['bid_levels'] else None,
+            'best_ask': book['ask_levels'][0]['price'] if book['ask_levels'] else None
+        }
+        self.publish(ticker, orjson.dumps(book), orjson.dumps(stats), ticker_stats.trade_seq(ticker))
+
+    async def publish_instruments(self, session):
+        instruments = await session.execute(
+            select(InstrumentModel.name, InstrumentModel.ticker).order_by(InstrumentModel.ticker)
+        )
+        self.publish(INSTRUMENTS_KEY, dump_json([{'name': name, 'ticker': ticker} for name, ticker in instruments]), b'')
+
+    async def run(self, interval: float):
+        # Свои сделки публикуются сразу после коммита (mark_dirty); полный
+        # проход раз в interval подхватывает отмены и ордера других воркеров
+        tickers = []
+        next_refresh = 0
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            if not ticker_ring.enabled and not self.writer:
+                self._elect_writer()
+                if not self.writer:
+                    continue
+            try:
+                async with market_data_session() as session:
+                    if time() >= next_refresh:
+                        tickers = (await session.scalars(
+                            select(InstrumentModel.ticker).where(InstrumentModel.ticker != 'RUB')
+                        )).all()
+                        self.dirty.update(ticker for ticker in tickers if self.can_publish(ticker))
+                        if self.can_publish(INSTRUMENTS_KEY):
+                            self.dirty.add(INSTRUMENTS_KEY)
+                        next_refresh = time() + interval
+                        await ticker_stats.refresh(session)
+                    dirty, self.dirty = self.dirty, set()
+                    for ticker in dirty:
+                        if ticker == INSTRUMENTS_KEY:
+                            await self.publish_instruments(session)
+                        else:
+                            await self.publish_ticker(session, ticker)
+            except Exception as e:
+                logger.error(f'[SNAPSHOTS] Ошибка при публикации снимков: {str(e)}', exc_info=True)
+
+
+book_snapshots = BookSnapshots()
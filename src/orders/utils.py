@@ -0,0 +1,181 @@
+import os
+from uuid import UUID
+
+from fastapi import HTTPException, status
+from sqlalchemy import select, delete, func, case, lambda_stmt
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.orders.models import OrderModel, PriceLevelModel, StatusEnum, DirectionEnum
+from src.instruments.models import InstrumentModel
+from src.ids import uuid7
+from src.logger import logger
+
+
+OPEN_STATUSES = (StatusEnum.NEW, StatusEnum.PARTIALLY_EXECUTED)
+BATCH_MAX_TICKERS = int(os.getenv('BATCH_MAX_TICKERS', '100'))
+BATCH_MAX_DEPTH = int(os.getenv('BATCH_MAX_DEPTH', '100'))
+
+# Горячие запросы задаются через lambda_stmt: выражение строится и
+# компилируется один раз на место вызова, дальше из кэша подставляются
+# только параметры
+def instrument_statement(ticker: str):
+    return lambda_stmt(lambda: select(InstrumentModel).where(InstrumentModel.ticker == ticker))
+
+def matching_orders_statement(ticker: str, direction: DirectionEnum, price: int | None):
+    opposite_direction = DirectionEnum.SELL if direction == DirectionEnum.BUY else DirectionEnum.BUY
+    statement = lambda_stmt(
+        lambda: select(OrderModel)
+        .where(OrderModel.ticker == ticker)
+        .where(OrderModel.direction == opposite_direction)
+        .where(OrderModel.status.in_(OPEN_STATUSES))
+    )
+    if direction == DirectionEnum.BUY:
+        if price is not None:
+            statement += lambda s: s.where(OrderModel.price <= price)
+        statement += lambda s: s.order_by(OrderModel.price.asc(), OrderModel.timestamp.asc())
+    else:
+        if price is not None:
+            statement += lambda s: s.where(OrderModel.price >= price)
+        statement += lambda s: s.order_by(OrderModel.price.desc(), OrderModel.timestamp.asc())
+    return statement
+
+def best_price_statement(ticker: str, direction: DirectionEnum):
+    statement = lambda_stmt(
+        lambda: select(func.max(OrderModel.price))
+        .where(OrderModel.ticker == ticker)
+        .where(OrderModel.direction == DirectionEnum.BUY)
+    ) if direction == DirectionEnum.BUY else lambda_stmt(
+        lambda: select(func.min(OrderModel.price))
+        .where(OrderModel.ticker == ticker)
+        .where(OrderModel.direction == DirectionEnum.SELL)
+    )
+    statement += lambda s: s.where(OrderModel.status.in_(OPEN_STATUSES)).where(OrderModel.price != None)
+    return statement
+
+
+def order_reserve(direction: DirectionEnum, ticker: str, qty: int, price: int | None) -> tuple[str, int]:
+    if direction == DirectionEnum.BUY:
+        # Для рыночной покупки цена заранее неизвестна, RUB списываются при исполнении
+        return 'RUB', qty * price if price else 0
+    return ticker, qty
+
+async def available_liquidity(session: AsyncSession, ticker: str, direction: DirectionEnum) -> int:
+    opposite_direction = DirectionEnum.SELL if direction == DirectionEnum.BUY else DirectionEnum.BUY
+    available_qty = await session.scalar(
+        select(func.sum(OrderModel.qty - OrderModel.filled))
+        .where(OrderModel.ticker == ticker)
+        .where(OrderModel.direction == opposite_direction)
+        .where(OrderModel.status.in_(OPEN_STATUSES))
+    )
+    return available_qty or 0
+
+
+def add_level_delta(level_deltas: dict, ticker: str, side: DirectionEnum, price: int, delta_qty: int, delta_count: int):
+    qty, count = level_deltas.get((ticker, side, price), (0, 0))
+    level_deltas[(ticker, side, price)] = (qty + delta_qty, count + delta_count)
+
+async def apply_level_deltas(session: AsyncSession, level_deltas: dict):
+    # Уровни обновляются в порядке (ticker, side, price), чтобы параллельные
+    # транзакции брали блокировки строк price_levels в одном порядке
+    for (ticker, side, price), (delta_qty, delta_count) in sorted(level_deltas.items(), key=lambda item: (item[0][0], item[0][1].value, item[0][2])):
+        if not delta_qty and not delta_count:
+            continue
+        statement = insert(PriceLevelModel).values(
+            id=uuid7(),
+            ticker=ticker,
+            side=side,
+            price=price,
+            qty=delta_qty,
+            order_count=delta_count
+        )
+        level = (await session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[PriceLevelModel.ticker, PriceLevelModel.side, PriceLevelModel.price],
+                set_={
+                    'qty': PriceLevelModel.qty + statement.excluded.qty,
+                    'order_count': PriceLevelModel.order_count + statement.excluded.order_count
+                }
+            ).returning(PriceLevelModel.qty, PriceLevelModel.order_count)
+        )).first()
+
+        if level.qty <= 0:
+            if level.qty < 0 or level.order_count != 0:
+                logger.error(f'[PRICE_LEVELS] Рассинхронизация уровня {ticker} {side.value} {price}: qty={level.qty}, order_count={level.order_count}')
+            await session.execute(
+                delete(PriceLevelModel)
+                .where(PriceLevelModel.ticker == ticker)
+                .where(PriceLevelModel.side == side)
+                .where(PriceLevelModel.price == price)
+                .where(PriceLevelModel.qty <= 0)
+            )
+
+async def remove_user_levels(session: AsyncSession, user_id: UUID):
+    # Открытые ордера удаляемого пользователя уходят каскадом, поэтому
+    # их объем нужно заранее вычесть из уровней. Ордера блокируются до
+    # подсчета: иначе сделка, закоммиченная в это время, вычлась бы из
+    # уровня дважды. Блокировки — по возрастанию id, как при матчинге
+    orders = await session.execute(
+        select(OrderModel.ticker, OrderModel.direction, OrderModel.price, OrderModel.qty, OrderModel.filled)
+        .where(OrderModel.user_id == user_id)
+        .where(OrderModel.status.in_([StatusEnum.NEW, StatusEnum.PARTIALLY_EXECUTED]))
+        .where(OrderModel.price != None)
+        .order_by(OrderModel.id)
+        .with_for_update()
+    )
+    level_deltas = {}
+    for ticker, direction, price, qty, filled in orders:
+        add_level_delta(level_deltas, ticker, direction, price, -(qty - filled), -1)
+    await apply_level_deltas(session, level_deltas)
+
+async def load_order_book(session: AsyncSession, ticker: str) -> dict:
+    # Стакан читается из материализованной таблицы уровней: стоимость
+    # зависит от числа уровней, а не от числа открытых ордеров
+    levels = await session.execute(
+        select(PriceLevelModel.side, PriceLevelModel.price, PriceLevelModel.qty)
+        .where(PriceLevelModel.ticker == ticker)
+        .where(PriceLevelModel.qty > 0)
+        .order_by(PriceLevelModel.side, PriceLevelModel.price)
+    )
+    bid_levels = []
+    ask_levels = []
+    for side, price, qty in levels:
+        (bid_levels if side == DirectionEnum.BUY else ask_levels).append({'price': price, 'qty': qty})
+    bid_levels.reverse()
+    return {
+        'bid_levels': bid_levels,
+        'ask_levels': ask_levels
+    }
+
+def parse_tickers(tickers: str) -> list[str]:
+    # Список тикеров для пакетных ручек: через запятую, без повторов
+    result = list(dict.fromkeys(ticker.strip() for ticker in tickers.split(',') if ticker.strip()))
+    if not result or len(result) > BATCH_MAX_TICKERS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f'Expected from 1 to {BATCH_MAX_TICKERS} tickers'
+        )
+    return result
+
+async def load_order_books(session: AsyncSession, tickers: list[str], depth: int) -> dict:
+    # Все стаканы одним запросом: номер уровня внутри (ticker, side) от
+    # лучшей цены, берутся первые depth уровней каждой стороны
+    level_rank = func.row_number().over(
+        partition_by=(PriceLevelModel.ticker, PriceLevelModel.side),
+        order_by=case((PriceLevelModel.side == DirectionEnum.BUY, -PriceLevelModel.price), else_=PriceLevelModel.price)
+    ).label('level_rank')
+    ranked = (
+        select(PriceLevelModel.ticker, PriceLevelModel.side, PriceLevelModel.price, PriceLevelModel.qty, level_rank)
+        .where(PriceLevelModel.ticker.in_(tickers))
+        .where(PriceLevelModel.qty > 0)
+        .subquery()
+    )
+    levels = await session.execute(
+        select(ranked.c.ticker, ranked.c.side, ranked.c.price, ranked.c.qty)
+        .where(ranked.c.level_rank <= depth)
+        .order_by(ranked.c.ticker, ranked.c.side, ranked.c.level_rank)
+    )
+    books = {ticker: {'bid_levels': [], 'ask_levels': []} for ticker in tickers}
+    for ticker, side, price, qty in levels:
+        books[ticker]['bid_levels' if side == DirectionEnum.BUY else 'ask_levels'].append({'price': price, 'qty': qty})
+    return books
@@ -0,0 +1,86 @@
+import hashlib
+import os
+from collections import OrderedDict
+
+import msgpack
+import orjson
+from fastapi import Response, status
+from fastapi.responses import JSONResponse
+
+
+def dump_json(content) -> bytes:
+    # OPT_UTC_Z сохраняет формат дат как у Pydantic
+    return orjson.dumps(content, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(JSONResponse):
+    # Отдает уже доверенные данные напрямую через orjson, минуя валидацию
+    # response_model
+    def render(self, content) -> bytes:
+        return dump_json(content)
+
+
+MSGPACK_MEDIA_TYPE = 'application/msgpack'
+# Закодированные в MessagePack ответы по ETag их JSON-формы: содержимое с
+# тем же ETag перекодируется только один раз
+ENCODED_CACHE_SIZE = int(os.getenv('ENCODED_CACHE_SIZE', '1024'))
+_msgpack_cache = OrderedDict()
+# Для OpenAPI: ручка может отдавать и MessagePack
+MSGPACK_RESPONSES = {200: {'content': {MSGPACK_MEDIA_TYPE: {}}}}
+
+
+def accepts_msgpack(accept: str | None) -> bool:
+    # MessagePack отдается, если клиент предпочитает его JSON (или
+    # указал с тем же весом); по умолчанию — JSON
+    if not accept:
+        return False
+    msgpack_q = json_q = 0.0
+    for item in accept.split(','):
+        media_type, *params = [part.strip() for part in item.split(';')]
+        q = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        media_type = media_type.lower()
+        if media_type in (MSGPACK_MEDIA_TYPE, 'application/x-msgpack'):
+            msgpack_q = max(msgpack_q, q)
+        elif media_type in ('application/json', 'application/*', '*/*'):
+            json_q = max(json_q, q)
+    return msgpack_q > 0 and msgpack_q >= json_q
+
+def to_msgpack(content: bytes, etag: str) -> bytes:
+    packed = _msgpack_cache.get(etag)
+    if packed is not None:
+        _msgpack_cache.move_to_end(etag)
+        return packed
+    packed = msgpack.packb(orjson.loads(content))
+    _msgpack_cache[etag] = packed
+    if len(_msgpack_cache) > ENCODED_CACHE_SIZE:
+        _msgpack_cache.popitem(last=False)
+    return packed
+
+def representation_etag(etag: str, accept: str | None) -> str:
+    # Сильный ETag различает представления одного ресурса
+    return f'{etag[:-1]}-msgpack"' if accepts_msgpack(accept) else etag
+
+def body_etag(content: bytes) -> str:
+    return f'"{hashlib.blake2b(content, digest_size=16).hexdigest()}"'
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # If-None-Match сравнивается слабо: префикс W/ от прокси не мешает совпадению
+    return any(candidate.strip().removeprefix('W/') in (etag, '*') for candidate in if_none_match.split(','))
+
+def conditional_response(content: bytes, etag: str, if_none_match: str | None, accept: str | None = None) -> Response:
+    # content — JSON-форма ответа, etag — ее ETag
+    use_msgpack = accepts_msgpack(accept)
+    headers = {'ETag': representation_etag(etag, accept), 'Vary': 'Accept'}
+    if etag_matches(if_none_match, headers['ETag']):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if use_msgpack:
+        return Response(content=to_msgpack(content, etag), media_type=MSGPACK_MEDIA_TYPE, headers=headers)
+    return Response(content=content, media_type='application/json', headers=headers)
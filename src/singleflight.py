@@ -0,0 +1,43 @@
+import asyncio
+import os
+
+from src.monitoring.metrics import SINGLE_FLIGHT_CALLS
+
+
+SINGLE_FLIGHT_WINDOW = float(os.getenv('SINGLE_FLIGHT_WINDOW', '0.05'))
+
+
+class SingleFlight:
+    # Одинаковые одновременные чтения выполняются один раз: первый запрос
+    # запускает загрузку отдельной задачей, остальные ждут ее результат.
+    # Готовый результат еще window секунд отдается следующим запросам.
+    # Загрузка не отменяется, если отключился клиент, который ее начал
+    def __init__(self, window: float):
+        self.window = window
+        self.calls = {}
+
+    async def do(self, name: str, key, load):
+        task = self.calls.get(key)
+        if task is not None:
+            SINGLE_FLIGHT_CALLS.labels(name, 'shared').inc()
+            return await asyncio.shield(task)
+
+        SINGLE_FLIGHT_CALLS.labels(name, 'leader').inc()
+        task = asyncio.ensure_future(load())
+        self.calls[key] = task
+        task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        # Ошибку повторно не раздаем: следующий запрос загрузит заново
+        if task.cancelled() or task.exception() is not None or self.window <= 0:
+            self._forget(key, task)
+        else:
+            asyncio.get_running_loop().call_later(self.window, self._forget, key, task)
+
+    def _forget(self, key, task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+
+
+single_flight = SingleFlight(SINGLE_FLIGHT_WINDOW)
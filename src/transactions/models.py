@@ -1,10 +1,11 @@
-from sqlalchemy import String, Integer, ForeignKey, DateTime, Index
+from sqlalchemy import String, Integer, BigInteger, ForeignKey, DateTime, Index, text
 from sqlalchemy.orm import Mapped, mapped_column
 from sqlalchemy.dialects.postgresql import UUID as PGUUID
-from uuid import uuid4, UUID
+from uuid import UUID
 from datetime import datetime, timezone
 
 from src.database import Base
+from src.ids import uuid7
 
 
 class TransactionModel(Base):
@@ -12,7 +13,7 @@ class TransactionModel(Base):
 
     id: Mapped[UUID] = mapped_column(
         PGUUID,
-        default=uuid4,
+        default=uuid7,
         primary_key=True
     )
 
@@ -50,7 +51,16 @@ class TransactionModel(Base):
         nullable=False
     )
 
+    # Транзакция Postgres, записавшая сделку: порядок коммита для догрузки статистики
+    xact_id: Mapped[int] = mapped_column(
+        BigInteger,
+        server_default=text('txid_current()'),
+        nullable=False
+    )
+
     __table_args__ = (
         Index('idx_transactions_ticker_timestamp', 'ticker', 'timestamp'),
+        Index('idx_transactions_timestamp', 'timestamp'),
         Index('idx_transactions_buyer_seller', 'buyer_id', 'seller_id'),
+        Index('idx_transactions_xact_id', 'xact_id'),
     )
\ No newline at end of file
@@ -1,24 +1,38 @@
-from fastapi import APIRouter, HTTPException, Depends, status
-from sqlalchemy import select, desc
+from typing import Optional
 
-from src.database import SessionDep
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Response, status
+from sqlalchemy import String, select, desc, func, literal, true
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database import ReadSessionDep, open_read_session
 from src.transactions.models import TransactionModel
-from src.transactions.schemas import TransactionRescponseSchema
+from src.transactions.schemas import TransactionRescponseSchema, TickerStatsSchema
+from src.transactions.stats import ticker_stats
+from src.orders.snapshots import book_snapshots
 from src.instruments.models import InstrumentModel
+from src.orders.models import OrderModel, StatusEnum, DirectionEnum
+from src.orders.utils import parse_tickers, BATCH_MAX_DEPTH
+from src.admission.dependencies import rate_limit
 from src.logger import logger
+from src.responses import FastJSONResponse, dump_json, body_etag, MSGPACK_RESPONSES, etag_matches, representation_etag, conditional_response
+from src.singleflight import single_flight
 
 
 transaction_router = APIRouter()
 
-@transaction_router.get('/api/v1/public/transactions/{ticker}', response_model=list[TransactionRescponseSchema], tags=['public'])
-async def get_transaction_history(
-    session: SessionDep,
-    ticker: str,
-    limit: int = 10
-):
-    try:
-        logger.info(f'[GET /api/v1/public/transactions/{ticker}] Начало запроса истории транзакций: ticker={ticker}, limit={limit}')
-        
+# ETag последней выдачи истории сделок и номер последней сделки тикера, при
+# котором она загружена. Пока номер в снимке тот же, новых сделок не было
+# и запрос с этим ETag получает 304 без обращения к базе
+transaction_etags = {}
+TRANSACTION_ETAGS_LIMIT = 10000
+
+async def load_transaction_history(ticker: str, limit: int) -> tuple[bytes, int | None]:
+    # Номер сделки читается до запроса: выдача содержит как минимум эти
+    # сделки. С реплики она может отставать — тогда номер не запоминается
+    snapshot = book_snapshots.read(ticker)
+    async with open_read_session() as session:
+        trade_seq = snapshot.trade_seq if snapshot is not None and session.info['pool'] != 'replica' else None
         instrument = await session.scalar(
             select(InstrumentModel).where(InstrumentModel.ticker == ticker)
         )
@@ -32,22 +46,195 @@ async def get_transaction_history(
         
         logger.info(f'[GET /api/v1/public/transactions/{ticker}] Инструмент найден: id={instrument.id}, name={instrument.name}')
         
-        transactions = await session.scalars(
-            select(TransactionModel)
+        transactions = await session.execute(
+            select(
+                TransactionModel.ticker,
+                TransactionModel.amount,
+                TransactionModel.price,
+                TransactionModel.timestamp
+            )
             .where(TransactionModel.ticker == ticker)
             .order_by(desc(TransactionModel.timestamp))
             .limit(limit)
         )
         
-        result = transactions.all()
-        logger.info(f'[GET /api/v1/public/transactions/{ticker}] Получено транзакций: {len(result)}')
-        
-        for transaction in result:
-            logger.info(f'[GET /api/v1/public/transactions/{ticker}] Транзакция: id={transaction.id}, amount={transaction.amount}, price={transaction.price}, buyer_id={transaction.buyer_id}, seller_id={transaction.seller_id}, timestamp={transaction.timestamp}')
-        
-        return result
+        result = [
+            {
+                'ticker': transaction.ticker,
+                'amount': transaction.amount,
+                'price': transaction.price,
+                'timestamp': transaction.timestamp
+            }
+            for transaction in transactions
+        ]
+    logger.info(f'[GET /api/v1/public/transactions/{ticker}] Получено транзакций: {len(result)}')
+    
+    for transaction in result:
+        logger.debug(f'[GET /api/v1/public/transactions/{ticker}] Транзакция: amount={transaction["amount"]}, price={transaction["price"]}, timestamp={transaction["timestamp"]}')
+    
+    return dump_json(result), trade_seq
+
+@transaction_router.get('/api/v1/public/transactions/{ticker}', response_model=list[TransactionRescponseSchema], dependencies=[Depends(rate_limit('public'))], responses=MSGPACK_RESPONSES, tags=['public'])
+async def get_transaction_history(
+    ticker: str,
+    limit: int = 10,
+    if_none_match: Optional[str] = Header(None),
+    accept: Optional[str] = Header(None)
+):
+    try:
+        logger.info(f'[GET /api/v1/public/transactions/{ticker}] Начало запроса истории транзакций: ticker={ticker}, limit={limit}')
+        known = transaction_etags.get((ticker, limit))
+        if known is not None and etag_matches(if_none_match, representation_etag(known[1], accept)):
+            snapshot = book_snapshots.read(ticker)
+            if snapshot is not None and snapshot.trade_seq == known[0]:
+                return Response(
+                    status_code=status.HTTP_304_NOT_MODIFIED,
+                    headers={'ETag': representation_etag(known[1], accept), 'Vary': 'Accept'}
+                )
+
+        # Одинаковые одновременные запросы делят один поход в базу
+        content, trade_seq = await single_flight.do(
+            'transactions',
+            ('transactions', ticker, limit),
+            lambda: load_transaction_history(ticker, limit)
+        )
+        etag = body_etag(content)
+        if trade_seq is not None:
+            if len(transaction_etags) >= TRANSACTION_ETAGS_LIMIT:
+                transaction_etags.clear()
+            transaction_etags[(ticker, limit)] = (trade_seq, etag)
+        return conditional_response(content, etag, if_none_match, accept)
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f'[GET /api/v1/public/transactions/{ticker}] Ошибка при получении истории транзакций: {str(e)}', exc_info=True)
-        raise
\ No newline at end of file
+        raise
+
+async def load_transaction_batch(tickers: list[str], limit: int) -> bytes:
+    # Для каждого тикера — LATERAL-подзапрос с LIMIT по индексу (ticker,
+    # timestamp): читаются только последние limit сделок, а не вся история,
+    # как при нумерации row_number() по всем сделкам тикеров
+    requested = func.unnest(literal(tickers, postgresql.ARRAY(String))).table_valued('ticker').render_derived(name='requested')
+    recent = (
+        select(
+            TransactionModel.ticker,
+            TransactionModel.amount,
+            TransactionModel.price,
+            TransactionModel.timestamp
+        )
+        .where(TransactionModel.ticker == requested.c.ticker)
+        .order_by(desc(TransactionModel.timestamp))
+        .limit(limit)
+        .lateral('recent')
+    )
+    async with open_read_session() as session:
+        transactions = await session.execute(
+            select(recent).select_from(requested).join(recent, true())
+        )
+        result = {ticker: [] for ticker in tickers}
+        for transaction in transactions:
+            result[transaction.ticker].append({
+                'ticker': transaction.ticker,
+                'amount': transaction.amount,
+                'price': transaction.price,
+                'timestamp': transaction.timestamp
+            })
+    logger.info(f'[GET /api/v1/public/transactions] Получено транзакций: tickers={len(tickers)}, всего={sum(len(items) for items in result.values())}')
+    return dump_json(result)
+
+@transaction_router.get('/api/v1/public/transactions', response_model=dict[str, list[TransactionRescponseSchema]], dependencies=[Depends(rate_limit('public'))], responses=MSGPACK_RESPONSES, tags=['public'])
+async def get_transaction_batch(
+    tickers: str,
+    limit: int = Query(10, ge=1, le=BATCH_MAX_DEPTH),
+    if_none_match: Optional[str] = Header(None),
+    accept: Optional[str] = Header(None)
+):
+    try:
+        ticker_list = parse_tickers(tickers)
+        logger.info(f'[GET /api/v1/public/transactions] Запрос истории транзакций: tickers={ticker_list}, limit={limit}')
+        content = await single_flight.do(
+            'transactions_batch',
+            ('transactions_batch', tuple(ticker_list), limit),
+            lambda: load_transaction_batch(ticker_list, limit)
+        )
+        return conditional_response(content, body_etag(content), if_none_match, accept)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f'[GET /api/v1/public/transactions] Ошибка при получении истории транзакций: {str(e)}', exc_info=True)
+        raise
+
+async def get_best_prices(session: AsyncSession, ticker: str = None) -> dict:
+    query = (
+        select(
+            OrderModel.ticker,
+            func.max(OrderModel.price).filter(OrderModel.direction == DirectionEnum.BUY),
+            func.min(OrderModel.price).filter(OrderModel.direction == DirectionEnum.SELL)
+        )
+        .where(OrderModel.status.in_([StatusEnum.NEW, StatusEnum.PARTIALLY_EXECUTED]))
+        .where(OrderModel.price != None)
+        .group_by(OrderModel.ticker)
+    )
+    if ticker is not None:
+        query = query.where(OrderModel.ticker == ticker)
+    return {row[0]: (row[1], row[2]) for row in await session.execute(query)}
+
+def build_ticker_stats(ticker: str, best_prices: dict) -> dict:
+    best_bid, best_ask = best_prices.get(ticker, (None, None))
+    return {
+        'ticker': ticker,
+        **ticker_stats.snapshot(ticker),
+        'best_bid': best_bid,
+        'best_ask': best_ask
+    }
+
+@transaction_router.get('/api/v1/public/ticker', response_model=list[TickerStatsSchema], dependencies=[Depends(rate_limit('public'))], tags=['public'])
+async def get_all_ticker_stats(session: ReadSessionDep):
+    try:
+        logger.info('[GET /api/v1/public/ticker] Запрос статистики за 24ч по всем инструментам')
+
+        await ticker_stats.refresh(session)
+        tickers = (await session.scalars(
+            select(InstrumentModel.ticker).where(InstrumentModel.ticker != 'RUB')
+        )).all()
+        best_prices = await get_best_prices(session)
+
+        result = [build_ticker_stats(ticker, best_prices) for ticker in tickers]
+        logger.info(f'[GET /api/v1/public/ticker] Получена статистика по {len(result)} инструментам')
+        return FastJSONResponse(result)
+    except Exception as e:
+        logger.error(f'[GET /api/v1/public/ticker] Ошибка при получении статистики: {str(e)}', exc_info=True)
+        raise
+
+@transaction_router.get('/api/v1/public/ticker/{ticker}', response_model=TickerStatsSchema, dependencies=[Depends(rate_limit('public'))], tags=['public'])
+async def get_ticker_stats(
+    session: ReadSessionDep,
+    ticker: str
+):
+    try:
+        logger.info(f'[GET /api/v1/public/ticker/{ticker}] Запрос статистики за 24ч: ticker={ticker}')
+
+        snapshot = book_snapshots.read(ticker)
+        if snapshot is not None:
+            logger.debug(f'[GET /api/v1/public/ticker/{ticker}] Статистика из снимка: version={snapshot.version}')
+            return Response(content=snapshot.stats, media_type='application/json')
+
+        instrument = await session.scalar(
+            select(InstrumentModel.ticker).where(InstrumentModel.ticker == ticker)
+        )
+        if not instrument:
+            logger.warning(f'[GET /api/v1/public/ticker/{ticker}] Инструмент не найден: ticker={ticker}')
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail='Instrument not found'
+            )
+
+        await ticker_stats.refresh(session)
+        result = build_ticker_stats(ticker, await get_best_prices(session, ticker))
+        logger.info(f'[GET /api/v1/public/ticker/{ticker}] Статистика: last_price={result["last_price"]}, volume={result["volume"]}, trade_count={result["trade_count"]}')
+        return FastJSONResponse(result)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f'[GET /api/v1/public/ticker/{ticker}] Ошибка при получении статистики: {str(e)}', exc_info=True)
+        raise
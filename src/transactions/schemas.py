@@ -8,4 +8,15 @@ class TransactionRescponseSchema(BaseModel):
     ticker: str
     amount: int
     price: int
-    timestamp: datetime
\ No newline at end of file
+    timestamp: datetime
+
+class TickerStatsSchema(BaseModel):
+    ticker: str
+    last_price: int | None
+    best_bid: int | None
+    best_ask: int | None
+    high: int | None
+    low: int | None
+    volume: int
+    vwap: float | None
+    trade_count: int
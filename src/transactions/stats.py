@@ -0,0 +1,164 @@
+import asyncio
+import os
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from time import monotonic
+from uuid import UUID
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database import open_read_session
+from src.transactions.models import TransactionModel
+from src.logger import logger
+
+
+STATS_WINDOW = timedelta(hours=24)
+STATS_REFRESH_INTERVAL = float(os.getenv('STATS_REFRESH_INTERVAL', '1'))
+
+
+class TickerStats:
+    # Скользящее окно 24ч из минутных корзин: не больше 1440 корзин на тикер
+    def __init__(self):
+        self.buckets = deque()
+        self.last_price = None
+        self.last_timestamp = None
+        self.trades = 0
+
+    def add(self, price: int, amount: int, timestamp: datetime):
+        minute = timestamp.replace(second=0, microsecond=0)
+        self.trades += 1
+        if self.last_timestamp is None or timestamp >= self.last_timestamp:
+            self.last_price = price
+            self.last_timestamp = timestamp
+
+        # Корзины упорядочены по минуте; опоздавшая сделка обычно попадает
+        # в одну из последних корзин
+        index = len(self.buckets)
+        while index > 0 and self.buckets[index - 1][0] > minute:
+            index -= 1
+        if index > 0 and self.buckets[index - 1][0] == minute:
+            bucket = self.buckets[index - 1]
+            bucket[1] = max(bucket[1], price)
+            bucket[2] = min(bucket[2], price)
+            bucket[3] += amount
+            bucket[4] += amount * price
+            bucket[5] += 1
+        else:
+            self.buckets.insert(index, [minute, price, price, amount, amount * price, 1])
+        # Снимок по тикеру могут вообще не запрашивать — старые корзины
+        # выбрасываются и при записи
+        self.evict(datetime.now(timezone.utc))
+
+    def evict(self, now: datetime):
+        cutoff = now - STATS_WINDOW
+        while self.buckets and self.buckets[0][0] < cutoff.replace(second=0, microsecond=0):
+            self.buckets.popleft()
+
+    def snapshot(self, now: datetime) -> dict:
+        self.evict(now)
+        volume = sum(bucket[3] for bucket in self.buckets)
+        notional = sum(bucket[4] for bucket in self.buckets)
+        return {
+            'last_price': self.last_price,
+            'high': max((bucket[1] for bucket in self.buckets), default=None),
+            'low': min((bucket[2] for bucket in self.buckets), default=None),
+            'volume': volume,
+            'vwap': notional / volume if volume else None,
+            'trade_count': sum(bucket[5] for bucket in self.buckets)
+        }
+
+
+class TickerStatsRegistry:
+    # Агрегаты обновляются инкрементально: свои сделки добавляются сразу
+    # после коммита в match_orders, сделки других воркеров — догрузкой
+    # строк transactions по номеру записавшей их транзакции. Отметка —
+    # xmin снимка прошлого опроса: все транзакции с меньшим номером к тому
+    # моменту уже завершились и были видны, а любая сделка, закоммиченная
+    # позже, имеет номер не меньше отметки, сколько бы она ни ждала
+    # блокировок и повторов. Строки от отметки перечитываются, пока она не
+    # сдвинется; повторы отсекает seen. Отметка берется из того же снимка,
+    # что и строки, поэтому отстающая реплика ее не опережает
+    def __init__(self):
+        self.stats = {}
+        self.watermark = None
+        self.seen = {}
+        self.last_refresh = None
+        self.prune_at = 10000
+        self.lock = asyncio.Lock()
+        # Номер сделки — счетчик увиденных процессом сделок тикера; старшие
+        # биты отличают процесс, чтобы номера разных процессов не совпадали
+        self.epoch = int.from_bytes(os.urandom(4), 'big')
+
+    def add_trade(self, trade_id: UUID, ticker: str, price: int, amount: int, timestamp: datetime):
+        if trade_id in self.seen:
+            return
+        if timestamp < datetime.now(timezone.utc) - STATS_WINDOW:
+            return
+        self.seen[trade_id] = None
+        self.stats.setdefault(ticker, TickerStats()).add(price, amount, timestamp)
+        if len(self.seen) >= self.prune_at:
+            self._prune_seen()
+            self.prune_at = max(10000, 2 * len(self.seen))
+
+    def _prune_seen(self):
+        # Своя сделка без номера транзакции остается, пока ее не прочитает
+        # опрос, прочитанная — пока ее номер не ниже отметки
+        if self.watermark is None:
+            return
+        for trade_id in [trade_id for trade_id, xact_id in self.seen.items() if xact_id is not None and xact_id < self.watermark]:
+            del self.seen[trade_id]
+
+    async def refresh(self, session: AsyncSession):
+        if self.last_refresh is not None and monotonic() - self.last_refresh < STATS_REFRESH_INTERVAL:
+            return
+        async with self.lock:
+            if self.last_refresh is not None and monotonic() - self.last_refresh < STATS_REFRESH_INTERVAL:
+                return
+            # xmin берется до чтения строк: транзакции, завершившиеся к
+            # этому моменту, видны и следующему запросу
+            xmin = await session.scalar(select(func.txid_snapshot_xmin(func.txid_current_snapshot())))
+            statement = (
+                select(
+                    TransactionModel.id,
+                    TransactionModel.ticker,
+                    TransactionModel.price,
+                    TransactionModel.amount,
+                    TransactionModel.timestamp,
+                    TransactionModel.xact_id
+                )
+                .where(TransactionModel.timestamp > datetime.now(timezone.utc) - STATS_WINDOW)
+                .order_by(TransactionModel.timestamp)
+            )
+            if self.watermark is not None:
+                statement = statement.where(TransactionModel.xact_id >= self.watermark)
+            for trade in await session.execute(statement):
+                self.add_trade(trade.id, trade.ticker, trade.price, trade.amount, trade.timestamp)
+                if trade.id in self.seen:
+                    self.seen[trade.id] = trade.xact_id
+            self.watermark = xmin
+            self._prune_seen()
+            self.last_refresh = monotonic()
+
+    async def warm_up(self):
+        # Первая загрузка читает сделки за все 24ч — делаем ее при старте
+        # воркера, а не в первом публичном запросе
+        try:
+            async with open_read_session() as session:
+                await self.refresh(session)
+            logger.info(f'[STATS] Статистика загружена: {len(self.seen)} сделок')
+        except Exception as e:
+            logger.error(f'[STATS] Не удалось загрузить статистику: {str(e)}', exc_info=True)
+
+    def trade_seq(self, ticker: str) -> int:
+        stats = self.stats.get(ticker)
+        return self.epoch << 32 | (stats.trades & 0xFFFFFFFF if stats else 0)
+
+    def snapshot(self, ticker: str) -> dict:
+        stats = self.stats.get(ticker)
+        if stats is None:
+            return TickerStats().snapshot(datetime.now(timezone.utc))
+        return stats.snapshot(datetime.now(timezone.utc))
+
+
+ticker_stats = TickerStatsRegistry()
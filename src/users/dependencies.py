@@ -1,16 +1,13 @@
 from typing import Optional
 
-from fastapi import Header, HTTPException, Depends, status
-from sqlalchemy import select
+from fastapi import Header, HTTPException, status
 
-from src.database import SessionDep
+from src.database import SessionDep, AdminSessionDep, TradingReadSessionDep
 from src.users.models import UserModel, RoleEnum
+from src.users.utils import user_by_token_statement
 
 
-async def get_current_user(
-    session: SessionDep,
-    authorization: Optional[str] = Header(None)
-) -> UserModel:
+async def get_user_by_token(session, authorization: Optional[str]) -> UserModel:
     if authorization is None or not authorization.startswith("TOKEN "):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -19,9 +16,7 @@ async def get_current_user(
     
     token = authorization[len("TOKEN "):]
 
-    user = await session.scalar(
-        select(UserModel).where(UserModel.api_key == token)
-    )
+    user = await session.scalar(user_by_token_statement(token))
 
     if user is None:
         raise HTTPException(
@@ -31,11 +26,29 @@ async def get_current_user(
 
     return user
 
-async def get_current_admin(user: UserModel = Depends(get_current_user)) -> UserModel:
+async def get_current_user(
+    session: SessionDep,
+    authorization: Optional[str] = Header(None)
+) -> UserModel:
+    return await get_user_by_token(session, authorization)
+
+# Для GET-ручек: проверка токена в той же сессии без транзакции
+async def get_current_reader(
+    session: TradingReadSessionDep,
+    authorization: Optional[str] = Header(None)
+) -> UserModel:
+    return await get_user_by_token(session, authorization)
+
+# Админские запросы проверяются через свой пул, как и сами админские ручки
+async def get_current_admin(
+    session: AdminSessionDep,
+    authorization: Optional[str] = Header(None)
+) -> UserModel:
+    user = await get_user_by_token(session, authorization)
     if user.role != RoleEnum.ADMIN:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Admin access required"
         )
     
-    return user
\ No newline at end of file
+    return user
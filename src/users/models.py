@@ -2,7 +2,7 @@ from enum import Enum as PyEnum
 from datetime import datetime
 from uuid import uuid4, UUID
 
-from sqlalchemy import String, Enum,  func
+from sqlalchemy import String, Enum, Integer, func
 from sqlalchemy.orm import Mapped, mapped_column
 from sqlalchemy.dialects.postgresql import UUID as PGUUID
 
@@ -42,6 +42,13 @@ class UserModel(Base):
         unique=True
     )
 
+    balance_shards: Mapped[int] = mapped_column(
+        Integer,
+        nullable=False,
+        default=1,
+        server_default='1'
+    )
+
     created_at: Mapped[datetime] = mapped_column(
         nullable=False,
         server_default=func.now()
@@ -2,17 +2,20 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy import select
 from uuid import UUID
 
-from src.database import SessionDep
+from src.database import SessionDep, AdminSessionDep
 from src.users.models import UserModel 
 from src.users.schemas import UserRegistrationSchema, UserRegistrationResponceSchema
 from src.users.utils import generate_api_key
 from src.users.dependencies import get_current_admin
+from src.admission.dependencies import admission
+from src.admission.gate import Priority
+from src.orders.utils import remove_user_levels
 from src.logger import logger
 
 
 auth_router = APIRouter()
 
-@auth_router.post('/api/v1/public/register', response_model=UserRegistrationResponceSchema, tags=['public'])
+@auth_router.post('/api/v1/public/register', response_model=UserRegistrationResponceSchema, dependencies=[Depends(admission('public', Priority.READ, authenticated=False))], tags=['public'])
 async def register_user(
     user_data: UserRegistrationSchema,
     session: SessionDep
@@ -44,7 +47,7 @@ async def register_user(
 
 @auth_router.delete('/api/v1/admin/user/{user_id}', response_model=UserRegistrationResponceSchema, tags=['admin', 'user'])
 async def delete_user(
-    session: SessionDep,
+    session: AdminSessionDep,
     user_id: UUID,
     admin_user=Depends(get_current_admin)
 ):
@@ -69,6 +72,7 @@ async def delete_user(
             'api_key': user.api_key,
         }
         
+        await remove_user_levels(session, user.id)
         await session.delete(user)
         await session.commit()
 
@@ -1,5 +1,13 @@
 from secrets import token_urlsafe
 
+from sqlalchemy import select, lambda_stmt
+
+from src.users.models import UserModel
+
 
 def generate_api_key() -> str:
-    return token_urlsafe(32)
\ No newline at end of file
+    return token_urlsafe(32)
+
+# Проверка токена выполняется на каждый запрос — запрос кэшируется целиком
+def user_by_token_statement(token: str):
+    return lambda_stmt(lambda: select(UserModel).where(UserModel.api_key == token))
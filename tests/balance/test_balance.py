@@ -0,0 +1,114 @@
+import pytest
+from fastapi import HTTPException
+
+from src.balance.models import BalanceModel
+from src.balance.utils import apply_delta, update_balance, reserve_balance
+from tests.conftest import get_balance, get_shards
+
+
+async def create_shards(session, user, ticker, shards):
+    for shard, (amount, available) in enumerate(shards):
+        session.add(BalanceModel(user_id=user.id, ticker=ticker, shard=shard, amount=amount, available=available))
+    await session.commit()
+
+@pytest.mark.asyncio
+async def test_credit_creates_missing_balance(create_user, session, ticker):
+    user = await create_user()
+
+    balance = await apply_delta(session, user.id, ticker, 10, 10)
+    await session.commit()
+
+    assert tuple(balance) == (10, 10)
+    assert await get_balance(user.id, ticker) == (10, 10)
+
+@pytest.mark.asyncio
+async def test_debit_below_zero_is_rejected(create_user, session, ticker):
+    user = await create_user({ticker: 10})
+
+    with pytest.raises(HTTPException) as error:
+        await update_balance(session, user.id, ticker, -11)
+    await session.rollback()
+
+    assert error.value.status_code == 400
+    assert await get_balance(user.id, ticker) == (10, 10)
+
+@pytest.mark.asyncio
+async def test_debit_of_reserved_funds_is_rejected(create_user, session, ticker):
+    user = await create_user({ticker: 10})
+    await reserve_balance(session, user.id, ticker, 4)
+
+    # amount не опускается ниже available: зарезервировано только 4
+    assert await apply_delta(session, user.id, ticker, -7, 0) is None
+    await session.rollback()
+
+    assert await get_balance(user.id, ticker) == (10, 10)
+
+@pytest.mark.asyncio
+async def test_reserve_over_available_is_rejected(create_user, session, ticker):
+    user = await create_user({ticker: 10})
+
+    assert await reserve_balance(session, user.id, ticker, 6) == 4
+    assert await reserve_balance(session, user.id, ticker, 5) is None
+    await session.rollback()
+
+@pytest.mark.asyncio
+async def test_debit_goes_to_shard_holding_the_reserve(create_user, session, ticker):
+    user = await create_user(shards=2)
+    await create_shards(session, user, ticker, [(100, 100), (100, 40)])
+
+    balance = await apply_delta(session, user.id, ticker, -60, 0)
+    await session.commit()
+
+    assert tuple(balance) == (40, 40)
+    assert await get_shards(user.id, ticker) == [(100, 100), (40, 40)]
+
+@pytest.mark.asyncio
+async def test_reserve_release_keeps_amount_above_available(create_user, session, ticker):
+    user = await create_user(shards=2)
+    await create_shards(session, user, ticker, [(100, 100), (100, 40)])
+
+    await apply_delta(session, user.id, ticker, 0, 50)
+    await session.commit()
+
+    # Шард 0 не выдержал бы +50 к available — освобождение попадает в шард 1
+    assert await get_shards(user.id, ticker) == [(100, 100), (100, 90)]
+
+@pytest.mark.asyncio
+async def test_debit_larger_than_any_reserve_is_rejected(create_user, session, ticker):
+    user = await create_user(shards=2)
+    await create_shards(session, user, ticker, [(100, 100), (100, 40)])
+
+    balance = await apply_delta(session, user.id, ticker, -150, 0)
+    await session.rollback()
+
+    assert balance is None
+    assert all(amount >= available for amount, available in await get_shards(user.id, ticker))
+
+@pytest.mark.asyncio
+async def test_sharded_reserve_over_available_is_rejected(create_user, session, ticker):
+    user = await create_user({ticker: 10}, shards=2)
+
+    assert await reserve_balance(session, user.id, ticker, 5) == 0
+    assert await reserve_balance(session, user.id, ticker, 6) is None
+    await session.rollback()
+
+@pytest.mark.asyncio
+async def test_debit_spanning_shards_is_split_without_merging(create_user, session, ticker):
+    user = await create_user(shards=2)
+    await create_shards(session, user, ticker, [(100, 50), (100, 50)])
+
+    balance = await apply_delta(session, user.id, ticker, -80, 0)
+    await session.commit()
+
+    assert tuple(balance) == (120, 100)
+    assert await get_shards(user.id, ticker) == [(50, 50), (70, 50)]
+
+@pytest.mark.asyncio
+async def test_reserve_spanning_shards_is_split(create_user, session, ticker):
+    user = await create_user({ticker: 10}, shards=2)
+
+    assert await reserve_balance(session, user.id, ticker, 8) == 2
+    await session.commit()
+
+    assert await get_balance(user.id, ticker) == (10, 2)
+    assert len(await get_shards(user.id, ticker)) == 2
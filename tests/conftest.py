@@ -1,10 +1,27 @@
+from uuid import uuid4
+
 import pytest
 import pytest_asyncio
 from httpx import AsyncClient, ASGITransport
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert
 
 from src.main import app
-from src.database import engine, Base, new_async_session
+from src.database import engine, admin_engine, market_data_engine, async_session
+from src.users.models import UserModel
+from src.users.utils import generate_api_key
+from src.instruments.models import InstrumentModel
+from src.balance.models import BalanceModel
+from src.balance.utils import update_balance, rebalance_shards
+
 
+# pytest-asyncio запускает каждый тест в своем event loop, а соединения
+# пулов привязаны к loop, в котором открыты
+@pytest_asyncio.fixture(autouse=True)
+async def dispose_engines():
+    yield
+    for pool_engine in (engine, admin_engine, market_data_engine):
+        await pool_engine.dispose()
 
 # HTTP клиент
 @pytest_asyncio.fixture
@@ -16,5 +33,54 @@ async def client():
 # Сессия БД
 @pytest_asyncio.fixture
 async def session():
-    async with new_async_session() as session:
+    async with async_session() as session:
         yield session
+
+# Новый тикер на каждый тест: тесты не видят стаканы друг друга
+@pytest_asyncio.fixture
+async def ticker(session):
+    ticker = f'T{uuid4().hex[:7].upper()}'
+    await session.execute(
+        insert(InstrumentModel)
+        .values(id=str(uuid4()), name='Russian Ruble', ticker='RUB')
+        .on_conflict_do_nothing(index_elements=[InstrumentModel.ticker])
+    )
+    session.add(InstrumentModel(name=f'Test {ticker}', ticker=ticker))
+    await session.commit()
+    return ticker
+
+@pytest.fixture
+def create_user(session):
+    async def create(balances: dict[str, int] = None, shards: int = 1) -> UserModel:
+        user = UserModel(name='Test Trader', api_key=generate_api_key(), balance_shards=shards)
+        session.add(user)
+        await session.flush()
+        for ticker, amount in (balances or {}).items():
+            await update_balance(session, user.id, ticker, amount)
+            if shards > 1:
+                await rebalance_shards(session, user.id, ticker, shards)
+        await session.commit()
+        return user
+    return create
+
+def auth(user: UserModel) -> dict:
+    return {'Authorization': f'TOKEN {user.api_key}'}
+
+async def get_balance(user_id, ticker: str) -> tuple[int, int]:
+    # (amount, available) по всем шардам
+    async with async_session() as session:
+        amount, available = (await session.execute(
+            select(func.coalesce(func.sum(BalanceModel.amount), 0), func.coalesce(func.sum(BalanceModel.available), 0))
+            .where(BalanceModel.user_id == user_id)
+            .where(BalanceModel.ticker == ticker)
+        )).one()
+    return amount, available
+
+async def get_shards(user_id, ticker: str) -> list[tuple[int, int]]:
+    async with async_session() as session:
+        return [tuple(row) for row in await session.execute(
+            select(BalanceModel.amount, BalanceModel.available)
+            .where(BalanceModel.user_id == user_id)
+            .where(BalanceModel.ticker == ticker)
+            .order_by(BalanceModel.shard)
+        )]
@@ -0,0 +1,174 @@
+import pytest
+from sqlalchemy import select
+
+from src.orders.models import OrderModel, StatusEnum, DirectionEnum
+from src.orders.schemas import LimitOrderBodySchema, MarketOrderBodySchema
+from src.orders.router import enqueue_order, reject_queued_order
+from src.transactions.models import TransactionModel
+from tests.conftest import auth, get_balance, get_shards
+
+
+async def place(client, user, ticker, direction, qty, price=None):
+    body = {"direction": direction, "ticker": ticker, "qty": qty}
+    if price is not None:
+        body["price"] = price
+    return await client.post("/api/v1/order", json=body, headers=auth(user))
+
+async def get_order(client, user, order_id):
+    response = await client.get(f"/api/v1/order/{order_id}", headers=auth(user))
+    assert response.status_code == 200
+    return response.json()
+
+@pytest.mark.asyncio
+async def test_limit_orders_fill_at_maker_price(client, create_user, ticker):
+    seller = await create_user({ticker: 10})
+    buyer = await create_user({"RUB": 1000})
+
+    sell = await place(client, seller, ticker, "SELL", 5, 100)
+    assert sell.status_code == 200
+    buy = await place(client, buyer, ticker, "BUY", 3, 120)
+    assert buy.status_code == 200
+
+    sell_order = await get_order(client, seller, sell.json()["order_id"])
+    assert sell_order["status"] == "PARTIALLY_EXECUTED"
+    assert sell_order["filled"] == 3
+    buy_order = await get_order(client, buyer, buy.json()["order_id"])
+    assert buy_order["status"] == "EXECUTED"
+
+    # Покупатель резервировал по 120, а купил по 100 — разница возвращена
+    assert await get_balance(buyer.id, "RUB") == (700, 700)
+    assert await get_balance(buyer.id, ticker) == (3, 3)
+    assert await get_balance(seller.id, "RUB") == (300, 300)
+    assert await get_balance(seller.id, ticker) == (7, 5)
+
+@pytest.mark.asyncio
+async def test_market_order_walks_the_book(client, create_user, ticker):
+    seller = await create_user({ticker: 10})
+    buyer = await create_user({"RUB": 1000})
+
+    assert (await place(client, seller, ticker, "SELL", 2, 100)).status_code == 200
+    assert (await place(client, seller, ticker, "SELL", 3, 110)).status_code == 200
+    buy = await place(client, buyer, ticker, "BUY", 4)
+    assert buy.status_code == 200
+
+    buy_order = await get_order(client, buyer, buy.json()["order_id"])
+    assert buy_order["status"] == "EXECUTED"
+    assert await get_balance(buyer.id, "RUB") == (1000 - 2 * 100 - 2 * 110, 1000 - 2 * 100 - 2 * 110)
+    assert await get_balance(buyer.id, ticker) == (4, 4)
+    assert await get_balance(seller.id, ticker) == (6, 5)
+
+@pytest.mark.asyncio
+async def test_market_order_without_liquidity_is_rejected(client, create_user, ticker):
+    buyer = await create_user({"RUB": 1000})
+
+    response = await place(client, buyer, ticker, "BUY", 1)
+
+    assert response.status_code == 400
+    assert await get_balance(buyer.id, "RUB") == (1000, 1000)
+
+@pytest.mark.asyncio
+async def test_unfunded_order_leaves_the_book_untouched(client, create_user, ticker):
+    seller = await create_user({ticker: 10})
+    buyer = await create_user({"RUB": 100})
+
+    sell = await place(client, seller, ticker, "SELL", 5, 100)
+    response = await place(client, buyer, ticker, "BUY", 5, 100)
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Insufficient RUB balance"
+    sell_order = await get_order(client, seller, sell.json()["order_id"])
+    assert sell_order["status"] == "NEW"
+    assert sell_order["filled"] == 0
+    assert await get_balance(buyer.id, "RUB") == (100, 100)
+
+@pytest.mark.asyncio
+async def test_self_trade_only_releases_reserves(client, create_user, session, ticker):
+    trader = await create_user({ticker: 5, "RUB": 1000})
+
+    sell = await place(client, trader, ticker, "SELL", 5, 100)
+    buy = await place(client, trader, ticker, "BUY", 5, 100)
+    assert buy.status_code == 200
+
+    assert (await get_order(client, trader, sell.json()["order_id"]))["status"] == "EXECUTED"
+    assert (await get_order(client, trader, buy.json()["order_id"]))["status"] == "EXECUTED"
+    assert await get_balance(trader.id, "RUB") == (1000, 1000)
+    assert await get_balance(trader.id, ticker) == (5, 5)
+    transactions = await session.scalars(select(TransactionModel).where(TransactionModel.ticker == ticker))
+    assert transactions.all() == []
+
+@pytest.mark.asyncio
+async def test_cancel_refunds_unfilled_reserve(client, create_user, ticker):
+    seller = await create_user({ticker: 10})
+    buyer = await create_user({"RUB": 1000})
+
+    buy = await place(client, buyer, ticker, "BUY", 5, 100)
+    assert await get_balance(buyer.id, "RUB") == (1000, 500)
+    assert (await place(client, seller, ticker, "SELL", 2, 100)).status_code == 200
+
+    response = await client.delete(f"/api/v1/order/{buy.json()['order_id']}", headers=auth(buyer))
+
+    assert response.status_code == 200
+    buy_order = await get_order(client, buyer, buy.json()["order_id"])
+    assert buy_order["status"] == "CANCELLED"
+    assert await get_balance(buyer.id, "RUB") == (800, 800)
+    assert await get_balance(buyer.id, ticker) == (2, 2)
+
+@pytest.mark.asyncio
+async def test_cancel_foreign_order_is_forbidden(client, create_user, ticker):
+    owner = await create_user({ticker: 10})
+    other = await create_user()
+
+    sell = await place(client, owner, ticker, "SELL", 5, 100)
+    response = await client.delete(f"/api/v1/order/{sell.json()['order_id']}", headers=auth(other))
+
+    assert response.status_code == 403
+    assert await get_balance(owner.id, ticker) == (10, 5)
+
+@pytest.mark.asyncio
+async def test_sharded_maker_filled_across_orders_keeps_shards(client, create_user, ticker):
+    seller = await create_user({ticker: 10}, shards=2)
+    buyer = await create_user({"RUB": 10000})
+
+    # Резерв каждого ордера ложится в свой шард, списание по каждому
+    # ордеру должно попасть туда же, а не сливать шарды
+    assert (await place(client, seller, ticker, "SELL", 5, 100)).status_code == 200
+    assert (await place(client, seller, ticker, "SELL", 5, 100)).status_code == 200
+    buy = await place(client, buyer, ticker, "BUY", 10, 100)
+    assert buy.status_code == 200
+
+    shards = await get_shards(seller.id, ticker)
+    assert len(shards) == 2
+    assert all(amount >= available >= 0 for amount, available in shards)
+    assert await get_balance(seller.id, ticker) == (0, 0)
+    assert await get_balance(seller.id, "RUB") == (1000, 1000)
+
+@pytest.mark.asyncio
+async def test_rejected_queued_order_releases_reserve(create_user, session, ticker):
+    buyer = await create_user({"RUB": 1000})
+
+    result = await enqueue_order(session, buyer.id, LimitOrderBodySchema(direction=DirectionEnum.BUY, ticker=ticker, qty=5, price=100))
+    assert await get_balance(buyer.id, "RUB") == (1000, 500)
+
+    await reject_queued_order(session, result["order_id"], "insufficient_balance")
+
+    order = await session.scalar(
+        select(OrderModel)
+        .where(OrderModel.id == result["order_id"])
+        .execution_options(populate_existing=True)
+    )
+    assert order.status == StatusEnum.CANCELLED
+    assert await get_balance(buyer.id, "RUB") == (1000, 1000)
+
+@pytest.mark.asyncio
+async def test_cancel_queued_market_order_releases_nothing(client, create_user, session, ticker):
+    seller = await create_user({ticker: 10})
+    buyer = await create_user({"RUB": 1000})
+    assert (await place(client, seller, ticker, "SELL", 5, 100)).status_code == 200
+
+    # Рыночная покупка ничего не резервирует, но из очереди ее отменить можно
+    result = await enqueue_order(session, buyer.id, MarketOrderBodySchema(direction=DirectionEnum.BUY, ticker=ticker, qty=5))
+    response = await client.delete(f"/api/v1/order/{result['order_id']}", headers=auth(buyer))
+
+    assert response.status_code == 200
+    assert (await get_order(client, buyer, result["order_id"]))["status"] == "CANCELLED"
+    assert await get_balance(buyer.id, "RUB") == (1000, 1000)